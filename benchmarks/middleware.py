@@ -0,0 +1,258 @@
+"""Benchmark the per-request overhead of the masking middleware.
+
+Runs the same request through no middleware and each masking middleware,
+under sequential and threaded load, against a test database created from
+``tests.settings``. The database needs the ``anon`` extension, see the
+contributing guide.
+
+Usage:
+
+    python -m benchmarks.middleware --output results.json
+    python -m benchmarks.middleware --requests 2000 --threads 8 --group-counts 1 100
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import UTC, datetime
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+django.setup()
+
+from django.contrib.auth.models import Group, User  # noqa: E402
+from django.db import connection, connections  # noqa: E402
+from django.test import RequestFactory, override_settings  # noqa: E402
+from django.test.utils import setup_databases, teardown_databases  # noqa: E402
+
+from django_security_label import VERSION  # noqa: E402
+from django_security_label.middleware import (  # noqa: E402
+    GroupMaskingMiddleware,
+    MaskedReadsMiddleware,
+)
+from tests.testapp.middleware import AnalystsMaskedReadsMiddleware  # noqa: E402
+from tests.testapp.models import MaskedColumn  # noqa: E402
+
+ROWS = 10
+
+
+def view(request):
+    request.rows = list(MaskedColumn.objects.all()[:ROWS])
+    return request
+
+
+class Scenario:
+    """A middleware configuration to benchmark.
+
+    Args:
+        name: The name reported in the results.
+        middleware_class: The middleware, or ``None`` to call the view directly.
+        settings: Settings overridden while the scenario runs.
+        user: The ``request.user`` of every request, if any.
+    """
+
+    def __init__(self, name, middleware_class=None, settings=None, user=None):
+        self.name = name
+        self.middleware_class = middleware_class
+        self.settings = settings or {}
+        self.user = user
+
+    def handler(self):
+        if self.middleware_class is None:
+            return view
+        return self.middleware_class(view)
+
+
+def build_scenarios(group_counts):
+    user = User.objects.create_user(username="benchmark")
+    analysts = Group.objects.create(name="Analysts")
+    user.groups.add(analysts)
+
+    scenarios = [
+        Scenario("no_middleware", user=user),
+        Scenario("masked_reads", MaskedReadsMiddleware, user=user),
+        Scenario("analysts_masked_reads", AnalystsMaskedReadsMiddleware, user=user),
+    ]
+    for group_count in group_counts:
+        # The user's group comes last, after groups they don't belong to.
+        filler = [(f"Group {i}", f"policy_{i}") for i in range(group_count - 1)]
+        Group.objects.bulk_create(
+            [Group(name=name) for name, _ in filler], ignore_conflicts=True
+        )
+        scenarios.append(
+            Scenario(
+                f"group_masking_{group_count}_groups",
+                GroupMaskingMiddleware,
+                settings={
+                    "SECURITY_LABEL_GROUPS_TO_POLICIES": [
+                        *filler,
+                        ("Analysts", "analysts_reader"),
+                    ]
+                },
+                user=user,
+            )
+        )
+    return scenarios
+
+
+def run_requests(handler, user, count):
+    """Send ``count`` requests through ``handler`` and return their latencies."""
+    request_factory = RequestFactory()
+    latencies = []
+    try:
+        for _ in range(count):
+            request = request_factory.get("/")
+            if user is not None:
+                request.user = user
+            start = time.perf_counter()
+            handler(request)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            connections.close_all()
+    return latencies
+
+
+def summarize(scenario, load, threads, latencies, elapsed):
+    latencies = sorted(latencies)
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "scenario": scenario.name,
+        "load": load,
+        "threads": threads,
+        "requests": len(latencies),
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": quantiles[49] * 1000,
+        "p95_ms": quantiles[94] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+        "throughput_rps": len(latencies) / elapsed,
+    }
+
+
+def run_scenario(scenario, requests, threads, warmup):
+    results = []
+    settings = override_settings(**scenario.settings) if scenario.settings else None
+    with settings or nullcontext():
+        handler = scenario.handler()
+        run_requests(handler, scenario.user, warmup)
+
+        start = time.perf_counter()
+        latencies = run_requests(handler, scenario.user, requests)
+        elapsed = time.perf_counter() - start
+        results.append(summarize(scenario, "sequential", 1, latencies, elapsed))
+
+        if threads > 1:
+            per_thread = max(requests // threads, 1)
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                start = time.perf_counter()
+                futures = [
+                    executor.submit(run_requests, handler, scenario.user, per_thread)
+                    for _ in range(threads)
+                ]
+                latencies = [
+                    latency for future in futures for latency in future.result()
+                ]
+                elapsed = time.perf_counter() - start
+            results.append(summarize(scenario, "threaded", threads, latencies, elapsed))
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    with connection.cursor() as cursor:
+        cursor.execute("SHOW server_version")
+        server_version = cursor.fetchone()[0]
+    return {
+        "timestamp": datetime.now(UTC).isoformat(),
+        "git_revision": git_revision(),
+        "django_security_label": VERSION,
+        "django": django.get_version(),
+        "python": platform.python_version(),
+        "postgresql": server_version,
+        "platform": platform.platform(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument(
+        "--group-counts", type=int, nargs="+", default=[1, 10, 100, 1000]
+    )
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        help="Only run scenarios whose name starts with this. Repeatable.",
+    )
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--keepdb", action="store_true")
+    args = parser.parse_args(argv)
+
+    old_config = setup_databases(verbosity=0, interactive=False, keepdb=args.keepdb)
+    try:
+        MaskedColumn.objects.bulk_create(
+            MaskedColumn(
+                text="secret_text_value",
+                uuid=uuid.uuid4(),
+                safe_text="safe_text_value",
+                safe_uuid=uuid.uuid4(),
+                confidential="hunter2",
+                random_int=999,
+            )
+            for _ in range(ROWS)
+        )
+        # Reconnect so the anon objects created by the migrations are loaded.
+        connection.close()
+
+        report = {"environment": environment(), "results": []}
+        for scenario in build_scenarios(args.group_counts):
+            if args.scenario and not scenario.name.startswith(tuple(args.scenario)):
+                continue
+            for result in run_scenario(
+                scenario, args.requests, args.threads, args.warmup
+            ):
+                report["results"].append(result)
+                print(
+                    f"{result['scenario']:<32} {result['load']:<10} "
+                    f"p50={result['p50_ms']:.3f}ms p99={result['p99_ms']:.3f}ms "
+                    f"{result['throughput_rps']:.0f} req/s",
+                    file=sys.stderr,
+                )
+    finally:
+        connections.close_all()
+        teardown_databases(old_config, verbosity=0, keepdb=args.keepdb)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,15 +5,19 @@ from django.db import connections
 from django.db.models.signals import pre_migrate
 from django.dispatch import receiver
 
-from django_security_label.labels import ColumnSecurityLabel
+from django_security_label.labels import (
+    ColumnSecurityLabel,
+    TableSecurityLabel,
+    check_table_labels,
+)
 from django_security_label.operations import CreateSecurityLabelForRole
 
 
 def _collect_security_label_providers(apps, plan):
     """
     Look through the loaded Django apps for models using
-    `ColumnSecurityLabel` and throughout the plan being migrated for any
-    possible security label providers.
+    `ColumnSecurityLabel` or `TableSecurityLabel` and throughout the plan
+    being migrated for any possible security label providers.
     """
     providers = set()
 
@@ -21,6 +25,9 @@ def _collect_security_label_providers(apps, plan):
         for index in model._meta.indexes:
             if isinstance(index, ColumnSecurityLabel):
                 providers.add(index.provider)
+        for constraint in model._meta.constraints:
+            if isinstance(constraint, TableSecurityLabel):
+                providers.add(constraint.provider)
 
     for migration, _ in plan:
         for operation in migration.operations:
@@ -70,3 +77,28 @@ class DjangoSecurityLabelConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "django_security_label"
     verbose_name = "Django Security Label"
+
+    def ready(self):
+        from django.conf import settings
+        from django.core import checks
+        from django.core.signals import request_started
+
+        from django_security_label.middleware import check_connection_roles
+        from django_security_label.policies import connect_signals, get_policy_index
+        from django_security_label.stats import get_role_switch_aggregator
+        from django_security_label.tables import get_labeled_tables
+
+        checks.register(check_table_labels, checks.Tags.models)
+        # Compile SECURITY_LABEL_GROUPS_TO_POLICIES once at startup.
+        get_policy_index()
+        if getattr(settings, "SECURITY_LABEL_LABELED_TABLES_ONLY", False):
+            get_labeled_tables()
+        if getattr(settings, "SECURITY_LABEL_ROLE_SWITCH_STATS", False):
+            get_role_switch_aggregator().connect()
+        if getattr(settings, "SECURITY_LABEL_CHECK_CONNECTION_ROLE", False):
+            request_started.connect(
+                check_connection_roles,
+                dispatch_uid="django_security_label.check_connection_roles",
+            )
+        if self.apps.is_installed("django.contrib.auth"):
+            connect_signals()
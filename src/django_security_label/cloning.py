@@ -0,0 +1,330 @@
+"""Copy a database into another alias, masking the labeled tables.
+
+[clone_masked][django_security_label.cloning.clone_masked] reads each
+labeled table in a masking policy's role, so the copy only holds masked
+values, and copies the other tables as they are. Rows are streamed from
+``COPY ... TO STDOUT`` on the source into ``COPY ... FROM STDIN`` on the
+target, without going through Python objects, by several worker threads
+at once. The workers all read the source in one exported snapshot, so the
+copy is consistent while the source is written to. The ``clone_masked``
+management command wraps it.
+
+The target must already have the tables, for example by running
+``migrate`` on it.
+"""
+
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from django.apps import apps
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from django_security_label.middleware import masked_reads
+from django_security_label.ranges import KeyRange, close_worker_connections, split_table
+from django_security_label.tables import collect_labeled_tables
+
+
+def get_cloned_models(app_labels=None, exclude=()):
+    """Return the models to copy, by default every concrete managed model.
+
+    Args:
+        app_labels: Only include these ``app_label`` or
+            ``app_label.ModelName`` entries.
+        exclude: Leave out these ``app_label`` or ``app_label.ModelName``
+            entries.
+    """
+    models = [
+        model
+        for model in apps.get_models(include_auto_created=True)
+        if model._meta.managed and not model._meta.proxy
+    ]
+
+    def matches(model, labels):
+        return (
+            model._meta.app_label in labels
+            or model._meta.label in labels
+            # Include the many-to-many tables of the models listed.
+            or (
+                model._meta.auto_created
+                and model._meta.auto_created._meta.label in labels
+            )
+        )
+
+    if app_labels:
+        models = [model for model in models if matches(model, set(app_labels))]
+    return [model for model in models if not matches(model, set(exclude))]
+
+
+def _references(model, models):
+    """Return the models in ``models`` that ``model`` has foreign keys to."""
+    return {
+        field.related_model._meta.concrete_model
+        for field in model._meta.concrete_fields
+        if field.is_relation
+        and (field.many_to_one or field.one_to_one)
+        and field.db_constraint
+    } & models
+
+
+def dependency_levels(models):
+    """Order ``models`` so every model comes after the models it references.
+
+    Returns:
+        A list of levels, each a list of models that only reference models
+        of earlier levels and can be copied in parallel, and the list of
+        models left over because they reference each other in a cycle.
+    """
+    model_set = set(models)
+    remaining = {model: _references(model, model_set) - {model} for model in models}
+    levels = []
+    while remaining:
+        level = [
+            model for model, refs in remaining.items() if not refs & remaining.keys()
+        ]
+        if not level:
+            break
+        levels.append(level)
+        for model in level:
+            del remaining[model]
+    return levels, list(remaining)
+
+
+def _columns(model, connection):
+    quote_name = connection.ops.quote_name
+    return ", ".join(quote_name(field.column) for field in model._meta.concrete_fields)
+
+
+class MaskedCloner:
+    """Copies tables from ``source`` to ``target``, masking the labeled ones.
+
+    Args:
+        target: The alias to copy into.
+        source: The alias to copy from.
+        policy: The role the labeled tables are read in. Defaults to the
+            default masked reader role.
+        workers: The number of tables, or chunks of a table, copied at once.
+        chunk_size: Split tables into primary key ranges of this many rows,
+            each copied and committed on its own. ``None`` copies each table
+            at once.
+        progress: Called with the model, its number of rows and the seconds
+            it took once each table is copied.
+    """
+
+    def __init__(
+        self,
+        target: str,
+        source: str = DEFAULT_DB_ALIAS,
+        policy: str | None = None,
+        workers: int = 4,
+        chunk_size: int | None = 100_000,
+        progress=None,
+    ):
+        self.target = target
+        self.source = source
+        self.policy = policy
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.labeled_tables = collect_labeled_tables()
+        self._snapshot = None
+
+    def clone(self, models, truncate: bool = False) -> dict:
+        """Copy ``models``' tables and return the number of rows of each."""
+        levels, cyclic = dependency_levels(models)
+        if truncate:
+            self.truncate(models)
+        rows = {}
+        # Every worker reads the source in the snapshot exported here, so
+        # the copy is consistent even while the source is written to.
+        with transaction.atomic(using=self.source):
+            self._snapshot = self._export_snapshot()
+            try:
+                with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                    for level in levels:
+                        # Each level only starts once the tables it references
+                        # are committed, so foreign keys are satisfied chunk by
+                        # chunk.
+                        rows.update(self._copy_level(executor, level))
+                    if cyclic:
+                        rows.update(
+                            executor.submit(self._copy_together, cyclic).result()
+                        )
+            finally:
+                self._snapshot = None
+        self.reset_sequences(models)
+        return rows
+
+    def truncate(self, models):
+        """Empty ``models``' tables on the target.
+
+        Raises a ``DatabaseError`` if tables that aren't copied reference
+        them, rather than emptying those too.
+        """
+        connection = connections[self.target]
+        tables = ", ".join(
+            connection.ops.quote_name(model._meta.db_table) for model in models
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {tables}")
+
+    def _export_snapshot(self) -> str:
+        """Start a repeatable read transaction on the source and export its snapshot."""
+        with connections[self.source].cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            cursor.execute("SELECT pg_export_snapshot()")
+            return cursor.fetchone()[0]
+
+    def _import_snapshot(self):
+        """Read the source in the exported snapshot for the rest of the transaction."""
+        with connections[self.source].cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            cursor.execute("SET TRANSACTION SNAPSHOT %s", [self._snapshot])
+
+    def reset_sequences(self, models):
+        connection = connections[self.target]
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+    def _copy_level(self, executor, level):
+        started, futures = {}, {}
+        for model in level:
+            started[model] = time.perf_counter()
+            futures[model] = [
+                executor.submit(self._copy_chunk, chunk)
+                for chunk in self._chunks(model)
+            ]
+        rows = {}
+        for model in level:
+            rows[model] = sum(future.result() for future in futures[model])
+            self._report(model, rows[model], started[model])
+        return rows
+
+    def _copy_together(self, models):
+        """Copy ``models`` in a single transaction, for tables in a cycle."""
+        rows = {}
+        try:
+            with transaction.atomic(using=self.target):
+                for model in models:
+                    start = time.perf_counter()
+                    rows[model] = self._copy(KeyRange(model))
+                    self._report(model, rows[model], start)
+        finally:
+            self._close_connections()
+        return rows
+
+    def _copy_chunk(self, chunk):
+        try:
+            with transaction.atomic(using=self.target):
+                return self._copy(chunk)
+        finally:
+            self._close_connections()
+
+    def _chunks(self, model):
+        """Split ``model``'s table into primary key ranges of ``chunk_size`` rows."""
+        if (
+            self.chunk_size is None
+            # Rows may reference rows of another chunk.
+            or model in _references(model, {model})
+        ):
+            return [KeyRange(model)]
+        return split_table(model, self.chunk_size, using=self.source)
+
+    def _copy(self, chunk) -> int:
+        """Stream one chunk from the source into the target."""
+        model = chunk.model
+        source = connections[self.source]
+        target = connections[self.target]
+        where, params = chunk.where_sql(source)
+        copy_out = (
+            f"COPY (SELECT {_columns(model, source)} "
+            f"FROM {source.ops.quote_name(model._meta.db_table)}{where}) "
+            "TO STDOUT (FORMAT BINARY)"
+        )
+        copy_in = (
+            f"COPY {target.ops.quote_name(model._meta.db_table)} "
+            f"({_columns(model, target)}) FROM STDIN (FORMAT BINARY)"
+        )
+        if model._meta.db_table in self.labeled_tables:
+            role_scope = masked_reads(self.policy, using=self.source)
+        else:
+            role_scope = nullcontext()
+        target.ensure_connection()
+        with transaction.atomic(using=self.source):
+            # The snapshot must be set before any other statement.
+            self._import_snapshot()
+            with (
+                role_scope,
+                source.wrap_database_errors,
+                target.wrap_database_errors,
+                source.connection.cursor() as source_cursor,
+                target.connection.cursor() as target_cursor,
+            ):
+                with (
+                    source_cursor.copy(copy_out, params) as reader,
+                    target_cursor.copy(copy_in) as writer,
+                ):
+                    for data in reader:
+                        writer.write(data)
+                return target_cursor.rowcount
+
+    def _report(self, model, rows, start):
+        if self.progress is not None:
+            self.progress(model, rows, time.perf_counter() - start)
+
+    def _close_connections(self):
+        close_worker_connections(self.source, self.target)
+
+
+def clone_masked(
+    target: str,
+    source: str = DEFAULT_DB_ALIAS,
+    policy: str | None = None,
+    models=None,
+    workers: int = 4,
+    chunk_size: int | None = 100_000,
+    truncate: bool = False,
+    progress=None,
+) -> dict:
+    """Copy the tables of ``source`` into ``target``, masking the labeled ones.
+
+    Labeled tables are read in ``policy``'s role and the other tables are
+    copied as they are. Tables are copied after the tables they have
+    foreign keys to, with up to ``workers`` tables or chunks of a table at
+    once. Tables referencing each other in a cycle are copied together, in
+    a single transaction, once the others are done. The target's sequences
+    are reset afterwards.
+
+    Args:
+        target: The alias to copy into.
+        source: The alias to copy from.
+        policy: The role labeled tables are read in. Defaults to the default
+            masked reader role.
+        models: The models to copy. Defaults to
+            [get_cloned_models][django_security_label.cloning.get_cloned_models].
+        workers: See [MaskedCloner][django_security_label.cloning.MaskedCloner].
+        chunk_size: See [MaskedCloner][django_security_label.cloning.MaskedCloner].
+        truncate: Empty the target's tables first. Fails if tables that
+            aren't copied reference them.
+        progress: See [MaskedCloner][django_security_label.cloning.MaskedCloner].
+
+    Returns:
+        The number of rows copied, by model.
+    """
+    if models is None:
+        models = get_cloned_models()
+    cloner = MaskedCloner(
+        target,
+        source=source,
+        policy=policy,
+        workers=workers,
+        chunk_size=chunk_size,
+        progress=progress,
+    )
+    return cloner.clone(models, truncate=truncate)
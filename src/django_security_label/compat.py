@@ -8,3 +8,22 @@ else:
     from django.db.migrations.operations.base import OperationCategory
 
     ADDITION = OperationCategory.ADDITION
+
+try:
+    from psycopg import Pipeline, ServerCursor
+except ImportError:  # pragma: no cover
+    # psycopg2 has no pipeline mode.
+    Pipeline = ServerCursor = None
+
+
+def pipeline_supported(raw_connection, raw_cursor) -> bool:
+    """Return ``True`` if a query on these DB-API objects can use pipeline mode.
+
+    Server-side cursors can't be used in pipeline mode.
+    """
+    return (
+        Pipeline is not None
+        and hasattr(raw_connection, "pipeline")
+        and not isinstance(raw_cursor, ServerCursor)
+        and Pipeline.is_supported()
+    )
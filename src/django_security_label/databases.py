@@ -0,0 +1,127 @@
+"""Build ``DATABASES`` aliases that connect as a masking policy's role.
+
+Call [policy_databases][django_security_label.databases.policy_databases]
+from your settings to add an alias, with its own connection pool, for each
+policy:
+
+    SECURITY_LABEL_POLICY_DATABASES = policy_databases(
+        DATABASES,
+        {
+            "dsl_masked_reader": {"max_size": 4},
+            "analyst": {"min_size": 2, "max_size": 10},
+        },
+    )
+    DATABASE_ROUTERS = ["django_security_label.routers.MaskedDatabaseRouter"]
+"""
+
+from __future__ import annotations
+
+from django.db import DEFAULT_DB_ALIAS
+
+from django_security_label import constants
+from django_security_label.snapshots import snapshot_schema
+
+
+def policy_alias(policy: str, using: str = DEFAULT_DB_ALIAS) -> str:
+    """Return the name of the alias for ``policy`` based on ``using``."""
+    return f"{using}__{policy}"
+
+
+def _option_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace(" ", "\\ ")
+
+
+def _snapshot_provider(policy: str) -> str:
+    # The app's migration labels the default masked reader role for "anon".
+    if policy == constants.MASKED_READER_ROLE:
+        return "anon"
+    return policy
+
+
+def policy_database(
+    settings_dict: dict,
+    policy: str,
+    pool=True,
+    snapshots: bool = False,
+    provider: str | None = None,
+) -> dict:
+    """Return a copy of ``settings_dict`` that connects as ``policy``'s role.
+
+    The role is set with ``-c role=<policy>`` in the libpq ``options``, so
+    connections start in the role and ``RESET ROLE`` keeps them in it.
+
+    Args:
+        settings_dict: The settings of the alias to connect like.
+        policy: The masking policy, which shares its name with the role.
+        pool: The ``OPTIONS["pool"]`` for the alias: ``True`` for the
+            default pool, a dictionary of ``psycopg_pool.ConnectionPool``
+            arguments such as ``min_size`` and ``max_size``, or ``None`` to
+            keep the pool setting of ``settings_dict``. Pools require
+            Django 5.1 or newer.
+        snapshots: Read the policy's snapshots, where they exist, instead
+            of masking the tables on every read. Puts the snapshot schema
+            of the role's label ``provider`` first in the ``search_path``.
+            See [django_security_label.snapshots][django_security_label.snapshots].
+        provider: The label provider the role is ``MASKED`` for, whose
+            snapshots it reads. Defaults to ``"anon"`` for the default
+            masked reader role, and to ``policy`` for other roles.
+    """
+    options = dict(settings_dict.get("OPTIONS", {}))
+    option_args = [options.get("options", ""), f"-c role={_option_value(policy)}"]
+    if snapshots:
+        if provider is None:
+            provider = _snapshot_provider(policy)
+        search_path = _option_value(f"{snapshot_schema(provider)},public")
+        option_args.append(f"-c search_path={search_path}")
+    options["options"] = " ".join(option_args).strip()
+    if pool is not None:
+        options["pool"] = pool
+    return {**settings_dict, "OPTIONS": options}
+
+
+def policy_databases(
+    databases: dict,
+    policy_pools: dict,
+    using: str = DEFAULT_DB_ALIAS,
+    snapshots: bool = False,
+    providers: dict | None = None,
+) -> dict[str, str]:
+    """Add an alias for each policy to ``databases``.
+
+    Each alias connects to the same database as ``using``, as the policy's
+    role, and is a test mirror of ``using``. Masked requests then check out
+    a connection that is already in their role from the policy's own pool,
+    so policies don't compete for connections.
+
+    Args:
+        databases: The ``DATABASES`` setting, updated in place.
+        policy_pools: Maps each policy to its ``pool`` option, see
+            [policy_database][django_security_label.databases.policy_database].
+        using: The alias to connect like.
+        snapshots: Read the policies' snapshots, see
+            [policy_database][django_security_label.databases.policy_database].
+        providers: Maps policies to the label provider whose snapshots
+            they read, for roles not named after their provider. See
+            [policy_database][django_security_label.databases.policy_database].
+
+    Returns:
+        The mapping of policies to aliases for
+        ``SECURITY_LABEL_POLICY_DATABASES``.
+    """
+    settings_dict = databases[using]
+    aliases = {}
+    for policy, pool in policy_pools.items():
+        alias = policy_alias(policy, using)
+        databases[alias] = policy_database(
+            settings_dict,
+            policy,
+            pool,
+            snapshots,
+            provider=(providers or {}).get(policy),
+        )
+        databases[alias]["TEST"] = {
+            **settings_dict.get("TEST", {}),
+            "MIRROR": using,
+        }
+        aliases[policy] = alias
+    return aliases
@@ -0,0 +1,64 @@
+"""View decorators that override the masking middleware's decision.
+
+The masking middleware classes check the view a request resolves to before
+deciding on a role. A decorated view skips the middleware's own policy
+decision, such as the group lookup of
+[GroupMaskingMiddleware][django_security_label.middleware.GroupMaskingMiddleware].
+"""
+
+from __future__ import annotations
+
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+
+# Set once a view is decorated. Until then, the middleware doesn't resolve
+# request paths, as no view can override its decision.
+_views_decorated = False
+
+
+def _wrap_view(view_func):
+    global _views_decorated
+    _views_decorated = True
+    # Return a new function rather than setting attributes on view_func.
+    if iscoroutinefunction(view_func):
+
+        async def _view_wrapper(request, *args, **kwargs):
+            return await view_func(request, *args, **kwargs)
+
+    else:
+
+        def _view_wrapper(request, *args, **kwargs):
+            return view_func(request, *args, **kwargs)
+
+    return wraps(view_func)(_view_wrapper)
+
+
+def masking_exempt(view_func):
+    """Mark a view as never using a masked role.
+
+    Use it for views that don't read labeled tables, such as webhooks and
+    status endpoints, so their requests neither look up a policy nor switch
+    roles.
+    """
+    view_wrapper = _wrap_view(view_func)
+    view_wrapper.masking_exempt = True
+    return view_wrapper
+
+
+def masking_policy(policy: str | None):
+    """Mark a view as always using ``policy``'s role.
+
+    ``None`` is the same as
+    [masking_exempt][django_security_label.decorators.masking_exempt].
+    """
+
+    def decorator(view_func):
+        view_wrapper = _wrap_view(view_func)
+        if policy is None:
+            view_wrapper.masking_exempt = True
+        else:
+            view_wrapper.masking_policy = policy
+        return view_wrapper
+
+    return decorator
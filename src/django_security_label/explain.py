@@ -0,0 +1,217 @@
+"""Compare a queryset's query plan unmasked and in each policy's role.
+
+With dynamic masking, PostgreSQL Anonymizer replaces each labeled column
+with its masking expression when a masked role reads the table. A filter
+or an ordering on a labeled column then applies to the masked value, so
+an index on the column can't be used and the planner may pick a different
+plan altogether.
+[explain_masking][django_security_label.explain.explain_masking] runs
+``EXPLAIN (ANALYZE, BUFFERS)`` for a queryset unmasked and in each
+policy's role, and reports how the plans and their timings differ. The
+``explain_masking`` management command wraps it.
+
+``ANALYZE`` runs the query, so only explain querysets that are safe and
+reasonably quick to run.
+"""
+
+from __future__ import annotations
+
+import json
+from contextlib import nullcontext
+
+from django.db.models import QuerySet
+from django.utils.module_loading import import_string
+
+from django_security_label.middleware import masked_reads
+from django_security_label.policies import get_configured_policies
+
+
+class QueryPlan:
+    """The ``EXPLAIN (ANALYZE, BUFFERS)`` output of a queryset in one role.
+
+    Attributes:
+        policy: The masking policy, ``None`` for unmasked reads.
+        plan: The root node of the JSON plan.
+        planning_time: The planning milliseconds.
+        execution_time: The execution milliseconds.
+    """
+
+    def __init__(self, policy: str | None, explain: dict):
+        self.policy = policy
+        self.plan = explain["Plan"]
+        self.planning_time = explain.get("Planning Time", 0.0)
+        self.execution_time = explain.get("Execution Time", 0.0)
+
+    def __repr__(self):
+        return (
+            f"<{self.__class__.__name__} policy={self.policy!r} "
+            f"execution_time={self.execution_time:.3f}>"
+        )
+
+    @property
+    def shared_hit_blocks(self) -> int:
+        return self.plan.get("Shared Hit Blocks", 0)
+
+    @property
+    def shared_read_blocks(self) -> int:
+        return self.plan.get("Shared Read Blocks", 0)
+
+    def nodes(self):
+        """Yield each node of the plan with its depth, depth first."""
+        stack = [(0, self.plan)]
+        while stack:
+            depth, node = stack.pop()
+            yield depth, node
+            for child in reversed(node.get("Plans", [])):
+                stack.append((depth + 1, child))
+
+    def shape(self) -> list[tuple]:
+        """Return the plan without its timings, to compare plans by."""
+        return [
+            (
+                depth,
+                node["Node Type"],
+                node.get("Relation Name"),
+                node.get("Index Name"),
+            )
+            for depth, node in self.nodes()
+        ]
+
+    def scans(self) -> dict[str, list[str]]:
+        """Return how each table is scanned, by table name."""
+        scans = {}
+        for _depth, node in self.nodes():
+            relation = node.get("Relation Name")
+            if relation is not None:
+                scans.setdefault(relation, []).append(_describe_node(node))
+        return scans
+
+    def format(self) -> str:
+        """Return the plan as indented text, one node per line."""
+        lines = []
+        for depth, node in self.nodes():
+            timing = ""
+            if "Actual Total Time" in node:
+                timing = (
+                    f" (rows={node.get('Actual Rows', 0)} "
+                    f"time={node['Actual Total Time']:.3f} ms)"
+                )
+            prefix = "  " * depth + ("-> " if depth else "")
+            lines.append(f"{prefix}{_describe_node(node)}{timing}")
+        return "\n".join(lines)
+
+
+def _describe_node(node) -> str:
+    description = node["Node Type"]
+    if "Index Name" in node:
+        description += f" using {node['Index Name']}"
+    if "Relation Name" in node:
+        description += f" on {node['Relation Name']}"
+    return description
+
+
+class MaskingComparison:
+    """A queryset's unmasked plan and its plans in each policy's role.
+
+    Attributes:
+        unmasked: The plan of unmasked reads.
+        masked: The plans of each policy, in order.
+    """
+
+    def __init__(self, unmasked: QueryPlan, masked: list[QueryPlan]):
+        self.unmasked = unmasked
+        self.masked = masked
+
+    def plan_changed(self, plan: QueryPlan) -> bool:
+        """Return ``True`` if ``plan`` differs from the unmasked plan."""
+        return plan.shape() != self.unmasked.shape()
+
+    def time_delta(self, plan: QueryPlan) -> float:
+        """Return the execution milliseconds ``plan`` adds to the unmasked plan."""
+        return plan.execution_time - self.unmasked.execution_time
+
+    def scan_changes(self, plan: QueryPlan) -> list[str]:
+        """Describe the tables scanned differently than in the unmasked plan."""
+        unmasked_scans = self.unmasked.scans()
+        scans = plan.scans()
+        changes = []
+        for relation in sorted(unmasked_scans.keys() | scans.keys()):
+            before = unmasked_scans.get(relation, [])
+            after = scans.get(relation, [])
+            if before != after:
+                changes.append(
+                    f"{relation}: {', '.join(before) or 'not scanned'} -> "
+                    f"{', '.join(after) or 'not scanned'}"
+                )
+        return changes
+
+
+def explain_queryset(
+    queryset: QuerySet, policy: str | None = None, repeat: int = 1
+) -> QueryPlan:
+    """Run ``EXPLAIN (ANALYZE, BUFFERS)`` for ``queryset`` in ``policy``'s role.
+
+    Args:
+        queryset: The queryset to explain. It's run on its own database.
+        policy: The masking policy, or ``None`` for unmasked reads.
+        repeat: Run it this many times and keep the fastest plan, so a
+            cold cache doesn't skew the comparison.
+    """
+    best = None
+    for _ in range(repeat):
+        if policy is None:
+            role_scope = nullcontext()
+        else:
+            role_scope = masked_reads(policy, using=queryset.db)
+        with role_scope:
+            output = queryset.explain(format="json", analyze=True, buffers=True)
+        explain = json.loads(output)
+        if isinstance(explain, list):
+            explain = explain[0]
+        plan = QueryPlan(policy, explain)
+        if best is None or plan.execution_time < best.execution_time:
+            best = plan
+    return best
+
+
+def resolve_queryset(queryset_or_path) -> QuerySet:
+    """Return a queryset, calling the function a dotted path points to.
+
+    Args:
+        queryset_or_path: A queryset, or the dotted path of a function
+            that takes no arguments and returns one, such as
+            ``"core.reports.active_customers"``.
+    """
+    if isinstance(queryset_or_path, QuerySet):
+        return queryset_or_path
+    try:
+        function = import_string(queryset_or_path)
+    except ImportError as exc:
+        raise ValueError(f"Can't import '{queryset_or_path}': {exc}") from exc
+    queryset = function()
+    if not isinstance(queryset, QuerySet):
+        raise ValueError(
+            f"'{queryset_or_path}' returned {type(queryset).__name__}, not a QuerySet."
+        )
+    return queryset
+
+
+def explain_masking(queryset, policies=None, repeat: int = 1) -> MaskingComparison:
+    """Explain ``queryset`` unmasked and in the role of each of ``policies``.
+
+    Args:
+        queryset: A queryset, or the dotted path of a function returning
+            one, see
+            [resolve_queryset][django_security_label.explain.resolve_queryset].
+        policies: The masking policies to compare. Defaults to
+            [get_configured_policies][django_security_label.policies.get_configured_policies].
+        repeat: See [explain_queryset][django_security_label.explain.explain_queryset].
+    """
+    queryset = resolve_queryset(queryset)
+    if policies is None:
+        policies = get_configured_policies()
+    unmasked = explain_queryset(queryset, repeat=repeat)
+    masked = [
+        explain_queryset(queryset, policy=policy, repeat=repeat) for policy in policies
+    ]
+    return MaskingComparison(unmasked, masked)
@@ -0,0 +1,235 @@
+"""Export masked querysets to CSV or JSON Lines files.
+
+The rows are read in a masking policy's role with
+``COPY (SELECT ...) TO STDOUT`` and written to the file as PostgreSQL sends
+them, so memory use doesn't grow with the size of the table.
+[export_queryset][django_security_label.exports.export_queryset] writes one
+queryset to a file,
+[export_masked][django_security_label.exports.export_masked] writes a file
+per model or queryset, several at once. The ``export_masked`` management
+command wraps the latter.
+"""
+
+from __future__ import annotations
+
+import csv
+import gzip
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.db import connections
+from django.db.models import QuerySet
+
+from django_security_label.middleware import masked_reads
+from django_security_label.ranges import close_worker_connections
+
+FORMATS = ("csv", "jsonl")
+
+
+def _copy_sql(sql: str, format: str, header: bool) -> str:
+    if format == "csv":
+        header_sql = ", HEADER" if header else ""
+        return f"COPY ({sql}) TO STDOUT (FORMAT CSV{header_sql})"
+    if format == "jsonl":
+        # CSV without quoting, so the JSON is written as is. JSON escapes
+        # control characters, so neither delimiter nor quote can appear.
+        return (
+            f"COPY (SELECT row_to_json(exported) FROM ({sql}) AS exported) "
+            "TO STDOUT (FORMAT CSV, DELIMITER E'\\x02', QUOTE E'\\x01')"
+        )
+    raise ValueError(f"Unknown export format '{format}', use one of {FORMATS}.")
+
+
+def export_queryset(
+    queryset: QuerySet,
+    file,
+    format: str = "csv",
+    policy: str | None = None,
+    after=None,
+) -> int:
+    """Write the rows of ``queryset``, masked for ``policy``, to ``file``.
+
+    Rows are ordered by primary key, unless ``queryset`` has an
+    ``order_by()``, so an interrupted export can be resumed ``after`` the
+    last primary key it wrote.
+
+    Args:
+        queryset: The rows to export, including ``values()`` querysets.
+        file: A binary file object to write to.
+        format: ``"csv"``, with a header row, or ``"jsonl"``, one JSON
+            object per row.
+        policy: The role the rows are read in. Defaults to the default
+            masked reader role.
+        after: Only write the rows with a greater primary key, and leave out
+            the CSV header, to append to the file of an interrupted export.
+
+    Returns:
+        The number of rows written.
+    """
+    if not queryset.query.order_by:
+        queryset = queryset.order_by("pk")
+    header = after is None
+    if not header:
+        if tuple(queryset.query.order_by) != ("pk",):
+            raise ValueError("Only exports in primary key order can be resumed.")
+        queryset = queryset.filter(pk__gt=after)
+    sql, params = queryset.query.sql_with_params()
+    copy_sql = _copy_sql(sql, format, header=header)
+    connection = connections[queryset.db]
+    with masked_reads(policy, using=queryset.db):
+        connection.ensure_connection()
+        with (
+            connection.wrap_database_errors,
+            connection.connection.cursor() as cursor,
+            cursor.copy(copy_sql, params) as copy,
+        ):
+            for data in copy:
+                file.write(data)
+        return cursor.rowcount
+
+
+def _file_name(queryset, format, compress):
+    name = f"{queryset.model._meta.db_table}.{format}"
+    return f"{name}.gz" if compress else name
+
+
+def _parse_record(record: bytes, format: str) -> list | dict:
+    text = record.decode()
+    if format == "csv":
+        return next(csv.reader(io.StringIO(text, newline="")))
+    return json.loads(text)
+
+
+def _truncate_export(path, format: str) -> tuple[int, dict | None]:
+    """Remove the incomplete record at the end of the export at ``path``.
+
+    Returns:
+        The number of complete rows, and the last of them.
+    """
+    path = Path(path)
+    if path.suffix == ".gz":
+        raise ValueError(f"Can't resume the compressed export {path}.")
+    records = 0
+    first = last = None
+    with path.open("rb+") as file:
+        end = position = 0
+        quoted = False
+        lines = []
+        for line in file:
+            position += len(line)
+            lines.append(line)
+            # A CSV line break inside quotes is part of a field, quotes are
+            # escaped by doubling them so they pair up at the record's end.
+            if format == "csv" and line.count(b'"') % 2:
+                quoted = not quoted
+            if quoted or not line.endswith(b"\n"):
+                continue
+            last = b"".join(lines)
+            lines = []
+            first = first or last
+            records += 1
+            end = position
+        if end != position:
+            file.truncate(end)
+    if format == "csv":
+        # The header isn't a row, it names the columns of the last one.
+        rows = max(records - 1, 0)
+        if not rows:
+            return rows, None
+        return rows, dict(
+            zip(_parse_record(first, format), _parse_record(last, format))
+        )
+    return records, _parse_record(last, format) if records else None
+
+
+def count_exported_rows(path, format: str = "csv") -> int:
+    """Return the number of complete rows in the export at ``path``.
+
+    An incomplete row at the end of the file, left by an interrupted
+    export, is removed, so the export can be resumed after the last row.
+    Compressed files can't be resumed.
+    """
+    return _truncate_export(path, format)[0]
+
+
+def _exported_pk(queryset: QuerySet, row: dict, path: Path):
+    pk = queryset.model._meta.pk
+    for key in (pk.column, pk.attname, "pk"):
+        if key in row:
+            return row[key]
+    raise ValueError(f"Can't resume the export {path} without a primary key column.")
+
+
+def export_masked(
+    querysets,
+    directory,
+    format: str = "csv",
+    policy: str | None = None,
+    compress: bool = False,
+    workers: int = 4,
+    resume: bool = False,
+    progress=None,
+) -> dict[Path, int]:
+    """Export each of ``querysets`` to a file of its own in ``directory``.
+
+    Files are named after the model's table, such as
+    ``core_customer.csv.gz``. Up to ``workers`` files are written at once,
+    each using a connection of its own.
+
+    Args:
+        querysets: Models or querysets to export.
+        directory: The directory to write the files to. It's created if
+            needed.
+        format: See [export_queryset][django_security_label.exports.export_queryset].
+        policy: See [export_queryset][django_security_label.exports.export_queryset].
+        compress: Compress the files with gzip.
+        workers: The number of files written at once.
+        resume: Append to existing files, after the last primary key they
+            have. See
+            [count_exported_rows][django_security_label.exports.count_exported_rows].
+        progress: Called with the path and the number of rows written once
+            each file is done.
+
+    Returns:
+        The number of rows written, by path.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unknown export format '{format}', use one of {FORMATS}.")
+    if resume and compress:
+        raise ValueError("Compressed exports can't be resumed.")
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    querysets = [
+        queryset if isinstance(queryset, QuerySet) else queryset._default_manager.all()
+        for queryset in querysets
+    ]
+    tables = [queryset.model._meta.db_table for queryset in querysets]
+    if len(set(tables)) != len(tables):
+        raise ValueError("Export each model once, files are named after its table.")
+
+    def export(queryset):
+        path = directory / _file_name(queryset, format, compress)
+        after = None
+        if resume and path.exists():
+            rows, last_row = _truncate_export(path, format)
+            if rows:
+                after = _exported_pk(queryset, last_row, path)
+        try:
+            with (
+                gzip.open(path, "wb")
+                if compress
+                else path.open("wb" if after is None else "ab")
+            ) as file:
+                rows = export_queryset(
+                    queryset, file, format=format, policy=policy, after=after
+                )
+        finally:
+            close_worker_connections(queryset.db)
+        if progress is not None:
+            progress(path, rows)
+        return path, rows
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(executor.map(export, querysets))
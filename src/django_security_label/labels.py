@@ -1,8 +1,10 @@
-"""Security label definitions for model columns.
+"""Security label definitions for model columns and tables.
 
 Use these classes in a model's ``Meta.indexes`` to declare which columns
 should be masked and how.  Django will generate the corresponding
-``SECURITY LABEL`` SQL in migrations automatically.
+``SECURITY LABEL`` SQL in migrations automatically. Table labels, such as
+[SampleTable][django_security_label.labels.SampleTable], go in the model's
+``Meta.constraints`` instead.
 
 Subclass [ColumnSecurityLabel][django_security_label.labels.ColumnSecurityLabel]
 if you need a custom provider or masking strategy beyond what
@@ -12,12 +14,25 @@ if you need a custom provider or masking strategy beyond what
 
 from __future__ import annotations
 
+import re
+from collections import Counter
 from enum import StrEnum
 from typing import Any
 
+from django.apps import apps
+from django.conf import settings
+from django.core import checks
 from django.db import models
 from django.db.backends.ddl_references import Statement, Table
 
+_MASKED_WITH = re.compile(
+    r"^\s*MASKED\s+WITH\s+(?:FUNCTION|VALUE)\s+(?P<expression>.+?)\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+_TABLESAMPLE = re.compile(
+    r"^\s*TABLESAMPLE\s+(?P<clause>.+?)\s*;?\s*$", re.IGNORECASE | re.DOTALL
+)
+
 
 class ColumnSecurityLabel(models.Index):
     """Base class that maps a single model field to a PostgreSQL security label.
@@ -74,6 +89,18 @@ class ColumnSecurityLabel(models.Index):
             provider=schema_editor.quote_name(self.provider),
         )
 
+    @property
+    def masking_expression(self) -> str | None:
+        """The SQL expression masked roles read instead of the column.
+
+        Parsed from a ``MASKED WITH FUNCTION`` or ``MASKED WITH VALUE``
+        label. ``None`` for other labels, such as ``NOT MASKED``.
+        """
+        match = _MASKED_WITH.match(self.string_literal)
+        if match is None:
+            return None
+        return match["expression"]
+
     def deconstruct(self):
         """Serialize for migrations, including ``provider`` and ``string_literal``."""
         (path, expressions, kwargs) = super().deconstruct()
@@ -105,6 +132,7 @@ class MaskFunction(StrEnum):
 
     See the full list in the
     [PostgreSQL Anonymizer docs](https://postgresql-anonymizer.readthedocs.io/en/stable/masking_functions/).
+    Some functions cost far more per row than others, see ``cost``.
     """
 
     dummy_bic = "dummy_bic()"
@@ -182,6 +210,19 @@ class MaskFunction(StrEnum):
     dummy_word = "dummy_word()"
     dummy_zip_code = "dummy_zip_code()"
 
+    @property
+    def cost(self) -> float | None:
+        """The measured microseconds per row of the function, if known.
+
+        Read from ``settings.SECURITY_LABEL_MASK_FUNCTION_COSTS``, a dict of
+        member names to microseconds, such as the ``costs`` written by
+        ``profile_mask_functions --output``. The costs depend on the
+        PostgreSQL Anonymizer version and the hardware, so none are built
+        in.
+        """
+        costs = getattr(settings, "SECURITY_LABEL_MASK_FUNCTION_COSTS", {})
+        return costs.get(self.name)
+
 
 class MaskColumn(AnonymizeColumn):
     """Apply a ``MASKED WITH FUNCTION`` label using a [MaskFunction][django_security_label.labels.MaskFunction] member.
@@ -223,3 +264,230 @@ class MaskColumn(AnonymizeColumn):
         kwargs["policy"] = self.policy
         kwargs["mask_function"] = self.mask_function
         return path, expressions, kwargs
+
+
+def get_column_labels(
+    model, policy: str | None = None
+) -> dict[str, ColumnSecurityLabel]:
+    """Return the labels in ``model``'s ``Meta.indexes`` by field name.
+
+    Args:
+        model: The model to look through.
+        policy: Only return the labels of this masking policy, the label's
+            ``provider``. Without it, a field labeled for several policies
+            is only returned once.
+    """
+    return {
+        index.fields[0]: index
+        for index in model._meta.indexes
+        if isinstance(index, ColumnSecurityLabel)
+        and (policy is None or index.provider == policy)
+    }
+
+
+class TableSecurityLabel(models.BaseConstraint):
+    """Base class that maps a model's table to a PostgreSQL security label.
+
+    Use it in the model's ``Meta.constraints``, since Django only accepts
+    indexes on at least one field. It doesn't constrain any rows, Django
+    only uses it to generate the ``SECURITY LABEL … ON TABLE`` SQL in
+    migrations. See [SampleTable][django_security_label.labels.SampleTable]
+    for the common case.
+
+    Args:
+        name: A name for the label, unique among the project's constraints.
+        provider: The PostgreSQL Anonymizer provider name.
+        string_literal: The raw ``SECURITY LABEL … IS '<value>'`` payload.
+    """
+
+    def __init__(self, *, name: str, provider: str, string_literal: str):
+        self.provider = provider
+        self.string_literal = string_literal
+        super().__init__(name=name)
+
+    def _get_security_label(self):
+        return (
+            "SECURITY LABEL FOR %(provider)s ON TABLE %(table)s IS '%(string_literal)s'"
+        )
+
+    def _remove_security_label(self):
+        return "SECURITY LABEL FOR %(provider)s ON TABLE %(table)s IS NULL"
+
+    def constraint_sql(self, model, schema_editor):
+        """Defer the label until the table is created, it can't be inlined."""
+        schema_editor.deferred_sql.append(self.create_sql(model, schema_editor))
+        return None
+
+    def create_sql(self, model, schema_editor):
+        """Return the ``SECURITY LABEL`` SQL that applies the label."""
+        return Statement(
+            self._get_security_label(),
+            table=Table(model._meta.db_table, schema_editor.quote_name),
+            provider=schema_editor.quote_name(self.provider),
+            string_literal=self.string_literal,
+        )
+
+    def remove_sql(self, model, schema_editor):
+        """Return the SQL that removes the label (sets it to ``NULL``)."""
+        return Statement(
+            self._remove_security_label(),
+            table=Table(model._meta.db_table, schema_editor.quote_name),
+            provider=schema_editor.quote_name(self.provider),
+        )
+
+    def validate(self, model, instance, exclude=None, using=None):
+        """Labels don't constrain rows, so there's nothing to validate."""
+
+    @property
+    def tablesample(self) -> str | None:
+        """The ``TABLESAMPLE`` clause masked roles read the table with.
+
+        Parsed from a ``TABLESAMPLE`` label, such as ``"SYSTEM(10)"`` for
+        ``TABLESAMPLE SYSTEM(10)``. ``None`` for other labels.
+        """
+        match = _TABLESAMPLE.match(self.string_literal)
+        if match is None:
+            return None
+        return match["clause"]
+
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return self.deconstruct() == other.deconstruct()
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.__class__, self.name))
+
+    def __repr__(self):
+        return (
+            f"<{self.__class__.__name__}: name={self.name!r} "
+            f"provider={self.provider!r} string_literal={self.string_literal!r}>"
+        )
+
+    def deconstruct(self):
+        """Serialize for migrations, including ``provider`` and ``string_literal``."""
+        (path, args, kwargs) = super().deconstruct()
+        kwargs["provider"] = self.provider
+        kwargs["string_literal"] = self.string_literal
+        return path, args, kwargs
+
+
+class SampleMethod(StrEnum):
+    """The ``TABLESAMPLE`` methods built into PostgreSQL.
+
+    ``SYSTEM`` picks whole pages, so it only reads the sampled pages of the
+    table, but rows stored together are sampled together. ``BERNOULLI``
+    picks single rows, so it's evenly spread, but it still reads every
+    page.
+    """
+
+    SYSTEM = "SYSTEM"
+    BERNOULLI = "BERNOULLI"
+
+
+class SampleTable(TableSecurityLabel):
+    """Apply a ``TABLESAMPLE`` label, so masked roles read a sample of the table.
+
+    Masked roles of ``policy`` only read about ``ratio`` percent of the
+    rows, which is much cheaper for large tables, such as event logs,
+    whose readers don't need every row::
+
+        class Meta:
+            constraints = [
+                SampleTable(name="event_sample", ratio=10),
+                SampleTable(name="event_sample_analysts", policy="analysts", ratio=1),
+            ]
+
+    Args:
+        name: A name for the label, unique among the project's constraints.
+        ratio: The percentage of the table to sample, above 0 and up to 100.
+        policy: The masking policy name. Defaults to ``"anon"``.
+        method: The [SampleMethod][django_security_label.labels.SampleMethod].
+            Defaults to ``SYSTEM``, which reads the least.
+        seed: Sample the same rows on every read, as long as the table
+            doesn't change. By default, each read samples anew.
+    """
+
+    def __init__(
+        self,
+        *,
+        name: str,
+        ratio: int | float,
+        policy="anon",
+        method: str | SampleMethod = SampleMethod.SYSTEM,
+        seed: int | None = None,
+        **kwargs,
+    ):
+        if not 0 < ratio <= 100:
+            raise ValueError(
+                f"{self.__class__.__name__} ratio must be above 0 and up to 100, "
+                f"got {ratio}."
+            )
+        self.ratio = ratio
+        self.policy = policy
+        self.method = SampleMethod(method)
+        self.seed = seed
+        kwargs.pop("string_literal", None)
+        kwargs.pop("provider", None)
+        string_literal = f"TABLESAMPLE {self.method}({ratio})"
+        if seed is not None:
+            string_literal += f" REPEATABLE({int(seed)})"
+        super().__init__(
+            name=name, provider=self.policy, string_literal=string_literal, **kwargs
+        )
+
+    def deconstruct(self):
+        """Serialize for migrations, including ``policy``, ``ratio`` and ``method``."""
+        (path, args, kwargs) = super().deconstruct()
+        kwargs["policy"] = self.policy
+        kwargs["ratio"] = self.ratio
+        kwargs["method"] = str(self.method)
+        if self.seed is not None:
+            kwargs["seed"] = self.seed
+        return path, args, kwargs
+
+
+def get_table_labels(model, policy: str | None = None) -> list[TableSecurityLabel]:
+    """Return the table labels in ``model``'s ``Meta.constraints``.
+
+    Args:
+        model: The model to look through.
+        policy: Only return the labels of this masking policy, the label's
+            ``provider``.
+    """
+    return [
+        constraint
+        for constraint in model._meta.constraints
+        if isinstance(constraint, TableSecurityLabel)
+        and (policy is None or constraint.provider == policy)
+    ]
+
+
+def check_table_labels(app_configs=None, **kwargs) -> list[checks.Error]:
+    """Report models with more than one table label for the same provider.
+
+    PostgreSQL keeps a single security label per provider and table, so the
+    migration applying the second label silently replaces the first.
+    """
+    if app_configs is None:
+        models_to_check = apps.get_models()
+    else:
+        models_to_check = [
+            model for app_config in app_configs for model in app_config.get_models()
+        ]
+    errors = []
+    for model in models_to_check:
+        providers = Counter(label.provider for label in get_table_labels(model))
+        for provider, count in providers.items():
+            if count > 1:
+                errors.append(
+                    checks.Error(
+                        f"{model._meta.label} has {count} table labels for the "
+                        f"'{provider}' provider.",
+                        hint="PostgreSQL keeps one label per provider and table, "
+                        "keep only one of them.",
+                        obj=model,
+                        id="django_security_label.E001",
+                    )
+                )
+    return errors
@@ -0,0 +1,136 @@
+"""Irreversibly replace labeled columns with their masked values.
+
+Updates each labeled table in primary key batches, several at once, and
+records the committed batches so an interrupted run resumes where it
+stopped. Only run it on a copy of the database, such as staging. See
+[anonymize_static][django_security_label.static_masking.anonymize_static].
+
+Usage:
+
+    python manage.py anonymize_static
+    python manage.py anonymize_static <app_label> <app_label.ModelName>
+    python manage.py anonymize_static --database staging --policy <policy_name>
+    python manage.py anonymize_static --workers 8 --batch-size 50000 --noinput
+    python manage.py anonymize_static --reset
+"""
+
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from django_security_label.cloning import get_cloned_models
+from django_security_label.static_masking import anonymize_static, get_static_models
+
+
+class Command(BaseCommand):
+    """Management command that statically masks the labeled tables."""
+
+    help = (
+        "Replace the values of labeled columns with their masked values, in "
+        "resumable primary key batches. This can't be undone."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "app_labels",
+            nargs="*",
+            help="Only anonymize these apps or app_label.ModelName models.",
+        )
+        parser.add_argument(
+            "--database",
+            default="default",
+            help="The Django database alias to anonymize (default: 'default').",
+        )
+        parser.add_argument(
+            "--policy",
+            default="anon",
+            help="The masking policy whose labels are applied (default: anon).",
+        )
+        parser.add_argument(
+            "-e",
+            "--exclude",
+            action="append",
+            default=[],
+            help="Don't anonymize this app or app_label.ModelName. Repeatable.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="The number of batches updated at once (default: 4).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10_000,
+            help="The number of rows updated and committed at once (default: 10000).",
+        )
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Forget the progress of an interrupted run and update every row again.",
+        )
+        parser.add_argument(
+            "--noinput",
+            "--no-input",
+            action="store_false",
+            dest="interactive",
+            help="Don't ask for confirmation.",
+        )
+
+    def handle(self, *args, **options):
+        using = options["database"]
+        if using not in connections:
+            raise CommandError(f"Unknown database alias '{using}'.")
+        if options["workers"] < 1:
+            raise CommandError("--workers must be at least 1.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        models = get_static_models(
+            options["policy"],
+            get_cloned_models(options["app_labels"], options["exclude"]),
+        )
+        if not models:
+            self.stderr.write(
+                f"No tables have columns masked for policy '{options['policy']}'."
+            )
+            return
+
+        if options["interactive"]:
+            database_name = connections[using].settings_dict["NAME"]
+            confirm = input(
+                f"This will irreversibly mask {len(models)} tables of the "
+                f"'{database_name}' database.\n"
+                "Type 'yes' to continue, or 'no' to cancel: "
+            )
+            if confirm != "yes":
+                self.stderr.write("Anonymization cancelled.")
+                return
+
+        def progress(model, done, total, rows, duration):
+            rate = rows / duration if duration else 0
+            self.stdout.write(
+                f"{model._meta.db_table}: {done}/{total} batches, {rows} rows "
+                f"in {duration:.2f}s ({rate:.0f} rows/s)"
+            )
+
+        try:
+            rows = anonymize_static(
+                using=using,
+                policy=options["policy"],
+                models=models,
+                workers=options["workers"],
+                batch_size=options["batch_size"],
+                reset=options["reset"],
+                progress=progress,
+            )
+        except ValueError as exc:
+            raise CommandError(exc) from exc
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Anonymized {sum(rows.values())} rows of {len(rows)} tables "
+                f"in '{using}'."
+            )
+        )
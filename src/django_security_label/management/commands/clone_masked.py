@@ -0,0 +1,113 @@
+"""Copy the database into another alias, masking the labeled tables.
+
+Labeled tables are read in a masking policy's role and streamed with
+``COPY`` into the target alias, whose tables must already exist. Other
+tables are copied as they are. See
+[clone_masked][django_security_label.cloning.clone_masked].
+
+Usage:
+
+    python manage.py clone_masked <target_alias>
+    python manage.py clone_masked <target_alias> <app_label> <app_label.ModelName>
+    python manage.py clone_masked <target_alias> --policy <policy_name> --truncate
+    python manage.py clone_masked <target_alias> --workers 8 --chunk-size 50000
+"""
+
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from django_security_label.cloning import clone_masked, get_cloned_models
+
+
+class Command(BaseCommand):
+    """Management command that clones a masked copy of the database."""
+
+    help = (
+        "Copy the database into another alias with COPY, reading labeled tables "
+        "in a masking policy's role."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("target", help="The Django database alias to copy into.")
+        parser.add_argument(
+            "app_labels",
+            nargs="*",
+            help="Only copy these apps or app_label.ModelName models.",
+        )
+        parser.add_argument(
+            "--database",
+            default="default",
+            help="The Django database alias to copy from (default: 'default').",
+        )
+        parser.add_argument(
+            "--policy",
+            help="The role labeled tables are read in (default: dsl_masked_reader).",
+        )
+        parser.add_argument(
+            "-e",
+            "--exclude",
+            action="append",
+            default=[],
+            help="Don't copy this app or app_label.ModelName. Repeatable.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="The number of tables or chunks copied at once (default: 4).",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=100_000,
+            help=(
+                "Copy and commit tables in primary key ranges of this many rows, "
+                "0 to copy each table at once (default: 100000)."
+            ),
+        )
+        parser.add_argument(
+            "--truncate",
+            action="store_true",
+            help=(
+                "Empty the target's tables before copying. Fails if tables that "
+                "aren't copied reference them."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        target = options["target"]
+        if target not in connections:
+            raise CommandError(f"Unknown database alias '{target}'.")
+        if target == options["database"]:
+            raise CommandError("The target must differ from the source database.")
+        if options["workers"] < 1:
+            raise CommandError("--workers must be at least 1.")
+
+        models = get_cloned_models(options["app_labels"], options["exclude"])
+        if not models:
+            self.stderr.write("No models to copy.")
+            return
+
+        def progress(model, rows, duration):
+            self.stdout.write(
+                f"Copied {rows} rows of {model._meta.db_table} in {duration:.2f}s"
+            )
+
+        rows = clone_masked(
+            target,
+            source=options["database"],
+            policy=options["policy"],
+            models=models,
+            workers=options["workers"],
+            chunk_size=options["chunk_size"] or None,
+            truncate=options["truncate"],
+            progress=progress,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Copied {sum(rows.values())} rows of {len(rows)} tables "
+                f"into '{target}'."
+            )
+        )
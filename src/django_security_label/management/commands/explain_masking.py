@@ -0,0 +1,107 @@
+"""Compare a queryset's query plan unmasked and in each policy's role.
+
+Takes the dotted path of a function that returns a queryset, runs
+``EXPLAIN (ANALYZE, BUFFERS)`` for it unmasked and in each policy's role,
+and prints the timings side by side with the tables scanned differently.
+See [explain_masking][django_security_label.explain.explain_masking].
+
+Usage:
+
+    python manage.py explain_masking core.reports.active_customers
+    python manage.py explain_masking core.reports.active_customers --policy analysts
+    python manage.py explain_masking core.reports.active_customers --repeat 5 --plans
+"""
+
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_security_label.explain import explain_masking, resolve_queryset
+
+
+class Command(BaseCommand):
+    """Management command that compares a queryset's plans across policies."""
+
+    help = (
+        "Run EXPLAIN (ANALYZE, BUFFERS) for a queryset unmasked and in each "
+        "masking policy's role, and compare the plans and timings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "queryset",
+            help="The dotted path of a function that returns the queryset.",
+        )
+        parser.add_argument(
+            "--policy",
+            action="append",
+            dest="policies",
+            help=(
+                "Compare this masking policy. Repeatable (default: the masked "
+                "reader role and the policies of SECURITY_LABEL_GROUPS_TO_POLICIES)."
+            ),
+        )
+        parser.add_argument(
+            "--database",
+            help="Run the queryset on this Django database alias instead of its own.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Run each plan this many times and keep the fastest (default: 3).",
+        )
+        parser.add_argument(
+            "--plans",
+            action="store_true",
+            help="Print each plan too.",
+        )
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1.")
+        try:
+            queryset = resolve_queryset(options["queryset"])
+        except ValueError as exc:
+            raise CommandError(exc) from exc
+        if options["database"]:
+            queryset = queryset.using(options["database"])
+
+        comparison = explain_masking(
+            queryset, policies=options["policies"], repeat=options["repeat"]
+        )
+
+        unmasked = comparison.unmasked
+        width = max(len("unmasked"), *(len(plan.policy) for plan in comparison.masked))
+        self.stdout.write(
+            f"{'Policy':<{width}}  {'Execution ms':>12}  {'Delta ms':>10}  "
+            f"{'Delta %':>8}  {'Planning ms':>11}  {'Buffers hit/read':>16}  Plan"
+        )
+        self.stdout.write(
+            f"{'unmasked':<{width}}  {unmasked.execution_time:>12.3f}  {'-':>10}  "
+            f"{'-':>8}  {unmasked.planning_time:>11.3f}  "
+            f"{self._buffers(unmasked):>16}"
+        )
+        for plan in comparison.masked:
+            delta = comparison.time_delta(plan)
+            if unmasked.execution_time:
+                percent = f"{delta / unmasked.execution_time:+.1%}"
+            else:
+                percent = "-"
+            changed = "changed" if comparison.plan_changed(plan) else "same"
+            self.stdout.write(
+                f"{plan.policy:<{width}}  {plan.execution_time:>12.3f}  "
+                f"{delta:>+10.3f}  {percent:>8}  {plan.planning_time:>11.3f}  "
+                f"{self._buffers(plan):>16}  {changed}"
+            )
+            for change in comparison.scan_changes(plan):
+                self.stdout.write(f"{'':<{width}}  {change}")
+
+        if options["plans"]:
+            for plan in [unmasked, *comparison.masked]:
+                self.stdout.write("")
+                self.stdout.write(f"{plan.policy or 'unmasked'}:")
+                self.stdout.write(plan.format())
+
+    def _buffers(self, plan):
+        return f"{plan.shared_hit_blocks}/{plan.shared_read_blocks}"
@@ -0,0 +1,105 @@
+"""Export masked tables to CSV or JSON Lines files.
+
+Writes a file per model to a directory, with the rows read in a masking
+policy's role. See
+[export_masked][django_security_label.exports.export_masked].
+
+Usage:
+
+    python manage.py export_masked <directory> <app_label> <app_label.ModelName>
+    python manage.py export_masked <directory> <app_label> --format jsonl --gzip
+    python manage.py export_masked <directory> <app_label> --policy <policy_name>
+    python manage.py export_masked <directory> <app_label> --resume
+"""
+
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_security_label.cloning import get_cloned_models
+from django_security_label.exports import FORMATS, export_masked
+
+
+class Command(BaseCommand):
+    """Management command that exports masked tables to files."""
+
+    help = (
+        "Export tables to CSV or JSON Lines files with COPY, reading them in a "
+        "masking policy's role."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", help="The directory to write the files to.")
+        parser.add_argument(
+            "app_labels",
+            nargs="+",
+            help="The apps or app_label.ModelName models to export.",
+        )
+        parser.add_argument(
+            "--database",
+            default="default",
+            help="The Django database alias to export from (default: 'default').",
+        )
+        parser.add_argument(
+            "--policy",
+            help="The role the rows are read in (default: dsl_masked_reader).",
+        )
+        parser.add_argument(
+            "-e",
+            "--exclude",
+            action="append",
+            default=[],
+            help="Don't export this app or app_label.ModelName. Repeatable.",
+        )
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            default="csv",
+            help="The file format (default: csv).",
+        )
+        parser.add_argument(
+            "--gzip",
+            action="store_true",
+            help="Compress the files with gzip.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="The number of files written at once (default: 4).",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Append to existing files, after the last primary key they have.",
+        )
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1:
+            raise CommandError("--workers must be at least 1.")
+        models = get_cloned_models(options["app_labels"], options["exclude"])
+        if not models:
+            self.stderr.write("No models to export.")
+            return
+
+        def progress(path, rows):
+            self.stdout.write(f"Exported {rows} rows to {path}")
+
+        try:
+            rows = export_masked(
+                [model._default_manager.using(options["database"]) for model in models],
+                options["directory"],
+                format=options["format"],
+                policy=options["policy"],
+                compress=options["gzip"],
+                workers=options["workers"],
+                resume=options["resume"],
+                progress=progress,
+            )
+        except ValueError as exc:
+            raise CommandError(exc) from exc
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Exported {sum(rows.values())} rows to {len(rows)} files."
+            )
+        )
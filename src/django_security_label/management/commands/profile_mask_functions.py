@@ -0,0 +1,112 @@
+"""Time masking functions per row and print them ranked, fastest first.
+
+Arguments are [MaskFunction][django_security_label.labels.MaskFunction]
+member names or ``mask_function`` strings as passed to ``MaskColumn``.
+Without arguments, every member is timed. See
+[profile_mask_functions][django_security_label.profiling.profile_mask_functions].
+
+Usage:
+
+    python manage.py profile_mask_functions
+    python manage.py profile_mask_functions dummy_name dummy_free_email --rows 100000
+    python manage.py profile_mask_functions "random_int_between(0, 50)"
+    python manage.py profile_mask_functions --output mask_costs.json
+"""
+
+from __future__ import annotations
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_security_label.labels import MaskFunction
+from django_security_label.profiling import profile_mask_functions
+
+
+class Command(BaseCommand):
+    """Management command that ranks masking functions by their cost per row."""
+
+    help = (
+        "Time masking functions over a number of rows on the database and print "
+        "them ranked by their cost per row."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "mask_functions",
+            nargs="*",
+            help=(
+                "MaskFunction member names or mask_function strings "
+                "(default: every MaskFunction member)."
+            ),
+        )
+        parser.add_argument(
+            "--database",
+            default="default",
+            help="The Django database alias to use (default: 'default').",
+        )
+        parser.add_argument(
+            "--rows",
+            type=int,
+            default=10_000,
+            help="The number of rows to evaluate each function for (default: 10000).",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help=(
+                "Time each function this many times and keep the fastest (default: 3)."
+            ),
+        )
+        parser.add_argument(
+            "--output",
+            help=(
+                "Write the report to this JSON file. Its costs can be used as "
+                "SECURITY_LABEL_MASK_FUNCTION_COSTS."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if options["rows"] < 1:
+            raise CommandError("--rows must be at least 1.")
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1.")
+        mask_functions = [
+            MaskFunction[name] if name in MaskFunction.__members__ else name
+            for name in options["mask_functions"]
+        ] or None
+
+        profiles = profile_mask_functions(
+            mask_functions,
+            rows=options["rows"],
+            repeat=options["repeat"],
+            using=options["database"],
+        )
+
+        measured = [profile for profile in profiles if profile.error is None]
+        fastest = measured[0].per_row if measured else None
+        width = max((len(profile.name) for profile in profiles), default=0)
+        self.stdout.write(
+            f"{'Rank':>4}  {'Function':<{width}}  {'us/row':>10}  {'x fastest':>9}"
+        )
+        for rank, profile in enumerate(measured, 1):
+            relative = profile.per_row / fastest if fastest else 1.0
+            self.stdout.write(
+                f"{rank:>4}  {profile.name:<{width}}  {profile.per_row:>10.3f}  "
+                f"{relative:>9.1f}"
+            )
+        for profile in profiles:
+            if profile.error is not None:
+                self.stderr.write(f"Failed {profile.name}: {profile.error}")
+
+        if options["output"]:
+            report = {
+                "rows": options["rows"],
+                "repeat": options["repeat"],
+                "results": [profile.as_dict() for profile in profiles],
+                "costs": {profile.name: profile.per_row for profile in measured},
+            }
+            with open(options["output"], "w") as file:
+                json.dump(report, file, indent=2)
+            self.stdout.write(f"Wrote the report to {options['output']}")
@@ -0,0 +1,101 @@
+"""Create and refresh the masked snapshots of labeled tables.
+
+Creates a materialized view of each labeled table, per masking policy, in
+the policy's snapshot schema, or refreshes it if it already exists. See
+[django_security_label.snapshots][django_security_label.snapshots].
+
+Usage:
+
+    python manage.py refresh_masked_snapshots
+    python manage.py refresh_masked_snapshots <policy_name1> <policy_name2>
+    python manage.py refresh_masked_snapshots --model <app_label.ModelName>
+    python manage.py refresh_masked_snapshots --rebuild
+    python manage.py refresh_masked_snapshots --drop
+"""
+
+from __future__ import annotations
+
+from functools import partial
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from django_security_label.snapshots import drop_snapshots, refresh_snapshots
+
+
+class Command(BaseCommand):
+    """Management command that creates, refreshes or drops masked snapshots."""
+
+    help = (
+        "Create or refresh the materialized masked snapshot of each labeled table, "
+        "per masking policy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "policies",
+            nargs="*",
+            help="The masking policies to snapshot (default: every labeled policy).",
+        )
+        parser.add_argument(
+            "--database",
+            default="default",
+            help="The Django database alias to use (default: 'default').",
+        )
+        parser.add_argument(
+            "--model",
+            action="append",
+            dest="models",
+            help="Only snapshot this model, as app_label.ModelName. Repeatable.",
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Drop and create existing snapshots, after labels or columns change.",
+        )
+        parser.add_argument(
+            "--blocking",
+            action="store_true",
+            help="Refresh without CONCURRENTLY, blocking reads of the snapshot.",
+        )
+        parser.add_argument(
+            "--drop",
+            action="store_true",
+            help="Drop the snapshots instead.",
+        )
+
+    def handle(self, *args, **options):
+        models = None
+        if options["models"]:
+            try:
+                models = [apps.get_model(label) for label in options["models"]]
+            except (LookupError, ValueError) as exc:
+                raise CommandError(exc) from exc
+
+        if options["drop"]:
+            snapshots = drop_snapshots(
+                options["policies"] or None,
+                models,
+                using=options["database"],
+                progress=partial(self._report, "Dropped"),
+            )
+        else:
+            snapshots = refresh_snapshots(
+                options["policies"] or None,
+                models,
+                using=options["database"],
+                concurrently=not options["blocking"],
+                rebuild=options["rebuild"],
+                progress=self._report_refresh,
+            )
+        if not snapshots:
+            self.stderr.write("No labeled tables to snapshot.")
+
+    def _report_refresh(self, snapshot, created, duration):
+        self._report("Created" if created else "Refreshed", snapshot, duration)
+
+    def _report(self, action, snapshot, duration):
+        self.stdout.write(
+            f"{action} snapshot {snapshot.schema}.{snapshot.table} "
+            f"for policy '{snapshot.policy}' in {duration:.2f}s"
+        )
@@ -11,6 +11,7 @@ Usage:
 
     python manage.py setup_policies
     python manage.py setup_policies --database <database_name>
+    python manage.py setup_policies --login
 """
 
 from __future__ import annotations
@@ -30,7 +31,9 @@ class Command(BaseCommand):
 
     1. Creates the Django group (if it doesn't exist).
     2. Creates a ``NOLOGIN`` PostgreSQL role that inherits from the
-       database user.
+       database user. With ``--login``, the role can log in instead, using
+       the ``PASSWORD`` of the policy's alias in
+       ``SECURITY_LABEL_POLICY_DATABASES`` if that alias logs in as the role.
     3. Configures the masking policy by applying a ``MASKED`` security
        label on the role so PostgreSQL Anonymizer recognises it.
     """
@@ -46,6 +49,14 @@ class Command(BaseCommand):
             default="default",
             help="The Django database alias to use (default: 'default').",
         )
+        parser.add_argument(
+            "--login",
+            action="store_true",
+            help=(
+                "Create LOGIN roles, so a database alias can connect as a policy's "
+                "role directly. See SECURITY_LABEL_POLICY_DATABASES."
+            ),
+        )
 
     def handle(self, *args, **options):
         groups_to_policies = getattr(settings, "SECURITY_LABEL_GROUPS_TO_POLICIES", [])
@@ -71,7 +82,13 @@ class Command(BaseCommand):
                 transaction.atomic(using=db_alias),
                 db_connection.schema_editor(atomic=True) as schema_editor,
             ):
-                create_role(schema_editor, name=policy, inherit_from_db_user=True)
+                create_role(
+                    schema_editor,
+                    name=policy,
+                    inherit_from_db_user=True,
+                    login=options["login"],
+                    password=self._get_password(policy) if options["login"] else None,
+                )
                 create_security_label_for_role(
                     schema_editor,
                     provider=policy,
@@ -80,6 +97,17 @@ class Command(BaseCommand):
                 )
             self.stdout.write(f"Configured group '{group_name}' with policy '{policy}'")
 
+    def _get_password(self, policy):
+        """Return the password of the alias that logs in as ``policy``, if any."""
+        policy_databases = getattr(settings, "SECURITY_LABEL_POLICY_DATABASES", {})
+        alias = policy_databases.get(policy)
+        if alias is None:
+            return None
+        settings_dict = connections[alias].settings_dict
+        if settings_dict["USER"] != policy:
+            return None
+        return settings_dict["PASSWORD"] or None
+
     def _register_masking_policies(self, db_connection, policies):
         """Register providers with ``anon.masking_policies`` before applying labels."""
         db_name = db_connection.settings_dict["NAME"]
@@ -0,0 +1,144 @@
+"""Copy the rows that changed since the last sync into a masked copy.
+
+Keeps a copy made with ``clone_masked`` up to date, by upserting the rows
+that changed, read in a masking policy's role, and deleting the rows that
+were deleted. See
+[sync_masked_replica][django_security_label.replicas.sync_masked_replica].
+
+Usage:
+
+    python manage.py sync_masked_replica <target_alias> --install-triggers
+    python manage.py sync_masked_replica <target_alias>
+    python manage.py sync_masked_replica <target_alias> <app_label> --policy <policy_name>
+    python manage.py sync_masked_replica <target_alias> --updated-field updated_at
+    python manage.py sync_masked_replica <target_alias> --uninstall-triggers
+"""
+
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from django_security_label.cloning import get_cloned_models
+from django_security_label.replicas import (
+    install_change_tracking,
+    sync_masked_replica,
+    uninstall_change_tracking,
+)
+
+
+class Command(BaseCommand):
+    """Management command that syncs the changed rows into a masked copy."""
+
+    help = (
+        "Upsert the rows that changed since the last sync into another alias, "
+        "reading labeled tables in a masking policy's role."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("target", help="The Django database alias to sync into.")
+        parser.add_argument(
+            "app_labels",
+            nargs="*",
+            help="Only sync these apps or app_label.ModelName models.",
+        )
+        parser.add_argument(
+            "--database",
+            default="default",
+            help="The Django database alias to sync from (default: 'default').",
+        )
+        parser.add_argument(
+            "--policy",
+            help="The role labeled tables are read in (default: dsl_masked_reader).",
+        )
+        parser.add_argument(
+            "-e",
+            "--exclude",
+            action="append",
+            default=[],
+            help="Don't sync this app or app_label.ModelName. Repeatable.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10_000,
+            help="The number of changed rows copied at once (default: 10000).",
+        )
+        parser.add_argument(
+            "--updated-field",
+            help=(
+                "Find changed rows by this timestamp field instead of the change "
+                "tracking triggers."
+            ),
+        )
+        tracking = parser.add_mutually_exclusive_group()
+        tracking.add_argument(
+            "--install-triggers",
+            action="store_true",
+            help="Install the change tracking triggers on the source and exit.",
+        )
+        tracking.add_argument(
+            "--uninstall-triggers",
+            action="store_true",
+            help="Drop the change tracking triggers from the source, empty its log and exit.",
+        )
+
+    def handle(self, *args, **options):
+        target = options["target"]
+        source = options["database"]
+        if target not in connections:
+            raise CommandError(f"Unknown database alias '{target}'.")
+        if target == source:
+            raise CommandError("The target must differ from the source database.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        if options["uninstall_triggers"]:
+            uninstall_change_tracking(using=source)
+            self.stdout.write(
+                self.style.SUCCESS(f"Removed change tracking from '{source}'.")
+            )
+            return
+
+        models = get_cloned_models(options["app_labels"], options["exclude"])
+        if not models:
+            self.stderr.write("No models to sync.")
+            return
+
+        if options["install_triggers"]:
+            try:
+                install_change_tracking(models, using=source)
+            except ValueError as exc:
+                raise CommandError(exc) from exc
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Installed change tracking on {len(models)} tables of '{source}'."
+                )
+            )
+            return
+
+        def progress(model, upserted, deleted, duration):
+            if upserted or deleted:
+                self.stdout.write(
+                    f"Synced {model._meta.db_table}: {upserted} upserted, "
+                    f"{deleted} deleted in {duration:.2f}s"
+                )
+
+        try:
+            results = sync_masked_replica(
+                target,
+                source=source,
+                policy=options["policy"],
+                models=models,
+                batch_size=options["batch_size"],
+                updated_field=options["updated_field"],
+                progress=progress,
+            )
+        except ValueError as exc:
+            raise CommandError(exc) from exc
+        rows = sum(upserted + deleted for upserted, deleted in results.values())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Synced {rows} rows of {len(results)} tables into '{target}'."
+            )
+        )
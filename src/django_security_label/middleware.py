@@ -8,33 +8,644 @@ To write your own masking strategy, subclass one of the middleware
 classes and override the decision logic, or call
 [enable_masked_reads][django_security_label.middleware.enable_masked_reads]
 / [disable_masked_reads][django_security_label.middleware.disable_masked_reads]
-directly in your own middleware.
+directly in your own middleware. Outside of requests, use
+[masked_reads][django_security_label.middleware.masked_reads].
 """
 
 from __future__ import annotations
 
+import time
+from contextlib import ContextDecorator, ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.conf import settings
-from django.db import InternalError, connection
+from django.db import DEFAULT_DB_ALIAS, Error, connections, transaction
+from django.db.transaction import TransactionManagementError
 from django.http import HttpRequest
+from django.urls import Resolver404, get_resolver
+
+from django_security_label import compat, constants, decorators
+from django_security_label.policies import get_group_policy, get_policy_database
+from django_security_label.signals import role_reset, role_switched
+from django_security_label.stats import RequestRoleStats, _request_stats
+from django_security_label.tables import LabeledTables, get_labeled_tables
+
+# Sentinel for a session whose role can't be known without asking PostgreSQL.
+_UNKNOWN_ROLE = object()
+
+# Sentinel for a view without masking decorators.
+_UNDECIDED = object()
+
+_active_policy: ContextVar[str | None] = ContextVar(
+    "django_security_label_active_policy", default=None
+)
+
+
+def get_active_policy() -> str | None:
+    """Return the masking policy of the request being processed.
+
+    Set by the middleware classes for the duration of a masked request,
+    including async requests, and by
+    [masked_reads][django_security_label.middleware.masked_reads]. ``None``
+    when reads aren't masked.
+    """
+    return _active_policy.get()
+
+
+class _RoleState:
+    """The role a connection's session was switched to.
 
-from django_security_label import constants
+    Stored on the connection wrapper so repeated switches to the same role
+    can be skipped. ``SET SESSION ROLE`` and ``RESET ROLE`` are undone when
+    the transaction they ran in is rolled back, so a switch made inside an
+    atomic block is only trusted until that block ends, unless it commits.
+    ``SET LOCAL ROLE`` always ends with its transaction, after which the
+    ``previous`` state applies again.
+    """
+
+    def __init__(self, db, role: str | None, local: bool = False):
+        self.role = role
+        self.local = local
+        self.previous = _get_role_state(db) if local else None
+        self.raw_connection = db.connection
+        self.savepoint_ids: list[str | None] | None = None
+        if db.in_atomic_block:
+            self.savepoint_ids = list(db.savepoint_ids)
+            if not local:
+                transaction.on_commit(self._committed, using=db.alias)
+        elif not db.get_autocommit():
+            # Manual transaction management, there's no commit to hook into.
+            self.savepoint_ids = []
+
+    def _committed(self):
+        self.savepoint_ids = None
 
+    def is_current(self, db) -> bool:
+        if self.savepoint_ids is None:
+            return True
+        # Still inside the transaction (and savepoint) the switch ran in.
+        return (
+            db.in_atomic_block
+            and db.savepoint_ids[: len(self.savepoint_ids)] == self.savepoint_ids
+        )
 
-def set_session_role(role):
-    """Run ``SET SESSION ROLE`` for the given PostgreSQL role name."""
-    with connection.cursor() as cursor:
-        cursor.execute(f"SET SESSION ROLE {connection.ops.quote_name(role)};")
 
+def _get_role_state(db) -> _RoleState | None:
+    """Return the ``_RoleState`` in effect, skipping finished local roles."""
+    state = getattr(db, "_security_label_role", None)
+    while state is not None and state.local and not state.is_current(db):
+        state = state.previous
+    return state
 
-def enable_masked_reads():
+
+def _current_role(db):
+    """Return the tracked role of ``db``'s session.
+
+    ``None`` means the session uses the login role, which is always the
+    case for a new or closed connection.
+    """
+    if db.connection is None:
+        return None
+    state = _get_role_state(db)
+    if state is None or state.raw_connection is not db.connection:
+        return None
+    if state.is_current(db):
+        return state.role
+    return _UNKNOWN_ROLE
+
+
+def _switch_role(db, role: str | None, local: bool = False, cursor=None) -> bool:
+    """Switch ``db``'s session to ``role``, or reset it when ``None``.
+
+    Nothing is sent when the session is already in that role. The statement
+    runs on a raw cursor so it can be issued from within an execute wrapper.
+    Pass ``cursor`` to use an existing raw cursor. Returns ``True`` when a
+    statement was sent.
+
+    With ``local``, ``SET LOCAL ROLE`` is used, which only lasts until the
+    end of the current transaction.
+    """
+    if local and not db.in_atomic_block:
+        raise TransactionManagementError(
+            "SET LOCAL ROLE can only be used inside an atomic block."
+        )
+    if _current_role(db) == role:
+        return False
+    if role is None:
+        sql = "RESET ROLE;"
+    elif local:
+        sql = f"SET LOCAL ROLE {db.ops.quote_name(role)};"
+    else:
+        sql = f"SET SESSION ROLE {db.ops.quote_name(role)};"
+    db.ensure_connection()
+    start = time.perf_counter()
+    with db.wrap_database_errors:
+        if cursor is None:
+            with db.connection.cursor() as cursor:
+                cursor.execute(sql)
+        else:
+            cursor.execute(sql)
+    duration = time.perf_counter() - start
+    db._security_label_role = _RoleState(db, role, local=local)
+    _record_role_switch(db, role, local, duration)
+    return True
+
+
+def _record_role_switch(db, role, local, duration):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.record(role, duration)
+    signal = role_reset if role is None else role_switched
+    signal.send(
+        sender=db.__class__,
+        connection=db,
+        alias=db.alias,
+        role=role,
+        policy=_active_policy.get(),
+        local=local,
+        duration=duration,
+    )
+
+
+def _execute_with_role(role, local, pipeline, execute, sql, params, many, context):
+    """Run a wrapped query after switching its connection to ``role``.
+
+    With ``pipeline``, the role switch and the query are sent together in
+    psycopg's pipeline mode, sharing one network round trip. That needs
+    libpq 14 or newer and isn't possible for server-side cursors or
+    ``executemany()``, which fall back to a separate round trip.
+    """
+    db = context["connection"]
+    if (
+        not pipeline
+        or many
+        or not compat.pipeline_supported(db.connection, context["cursor"].cursor)
+        or _current_role(db) == role
+    ):
+        _switch_role(db, role, local=local)
+        return execute(sql, params, many, context)
+
+    role_cursor = db.connection.cursor()
+    try:
+        with db.wrap_database_errors, db.connection.pipeline():
+            _switch_role(db, role, local=local, cursor=role_cursor)
+            return execute(sql, params, many, context)
+    except Exception:
+        # Outside of a transaction, both statements share an implicit one,
+        # so a failing query undoes the role switch too.
+        db._security_label_role = _RoleState(db, _UNKNOWN_ROLE, local=local)
+        raise
+    finally:
+        role_cursor.close()
+
+
+def _reset_deferred_role(execute, sql, params, many, context):
+    """Execute wrapper that resets a deferred role before the next query."""
+    db = context["connection"]
+    if db._security_label_reset_pending:
+        _switch_role(db, None)
+    return execute(sql, params, many, context)
+
+
+def set_session_role(role, using=DEFAULT_DB_ALIAS):
+    """Run ``SET SESSION ROLE`` for the given PostgreSQL role name.
+
+    The statement is skipped when the connection is already in ``role``.
+    """
+    db = connections[using]
+    db._security_label_reset_pending = False
+    _switch_role(db, role)
+
+
+def set_local_role(role, using=DEFAULT_DB_ALIAS):
+    """Run ``SET LOCAL ROLE`` for the given PostgreSQL role name.
+
+    The role only lasts until the end of the current transaction, so no
+    ``RESET ROLE`` is needed afterwards. This is safe to use behind a
+    transaction-pooling connection pooler such as PgBouncer. Must be called
+    inside an atomic block.
+    """
+    _switch_role(connections[using], role, local=True)
+
+
+def enable_masked_reads(using=DEFAULT_DB_ALIAS):
     """Switch the session to the default masked reader role."""
-    set_session_role(constants.MASKED_READER_ROLE)
+    set_session_role(constants.MASKED_READER_ROLE, using=using)
+
+
+def disable_masked_reads(defer: bool = False, using=DEFAULT_DB_ALIAS):
+    """Reset the session role back to the connection default.
+
+    Nothing is sent when the session already uses the default role.
+
+    Args:
+        defer: Postpone ``RESET ROLE`` until the connection runs a query
+            outside of a masked request. If the next request switches to
+            the same role, neither statement is sent. Pooled connections
+            are always reset immediately, since they are handed back to
+            the pool at the end of the request.
+        using: The database alias.
+    """
+    db = connections[using]
+    if defer and getattr(db, "pool", None) is None:
+        _defer_role_reset(db)
+    else:
+        db._security_label_reset_pending = False
+        _switch_role(db, None)
+
+
+def _defer_role_reset(db):
+    db._security_label_reset_pending = True
+    if _reset_deferred_role not in db.execute_wrappers:
+        # Outermost, so it can't be popped by a scoped execute_wrapper().
+        db.execute_wrappers.insert(0, _reset_deferred_role)
+
+
+def _reset_role_on_exit(db, defer: bool = False, raised: bool = False):
+    """Reset ``db``'s role when leaving a masked block, however it's left.
+
+    In a transaction that must be rolled back, ``RESET ROLE`` would fail,
+    so it's deferred until the next query after the rollback. A connection
+    whose role can't be reset, such as a broken one, is closed so it isn't
+    reused in the masked role. The error is only raised if the block
+    itself didn't raise.
+    """
+    try:
+        if db.in_atomic_block and db.needs_rollback:
+            _defer_role_reset(db)
+        else:
+            disable_masked_reads(defer=defer, using=db.alias)
+    except Error:
+        db.close()
+        if not raised:
+            raise
+
+
+class LazySessionRole:
+    """Execute wrapper that defers ``SET SESSION ROLE`` until the first query.
+
+    Install it with ``connection.execute_wrapper()``. The role is switched
+    on a separate cursor immediately before the first statement runs, so
+    a request that never queries the database doesn't pay for the round
+    trip. ``applied`` tells you afterwards whether a query ran. The role
+    applies to whichever connection the wrapper is installed on.
+
+    Switching roles is transactional in PostgreSQL. If the role was set
+    inside an atomic block that is later rolled back, it is set again
+    before the next statement.
+
+    Args:
+        role: The PostgreSQL role to switch to.
+        local: Use ``SET LOCAL ROLE``. Queries must then run inside an
+            atomic block.
+        pipeline: Send the role switch in the same network round trip as
+            the query that triggered it, using psycopg's pipeline mode.
+        tables: Only switch before the first statement that references
+            one of these
+            [LabeledTables][django_security_label.tables.LabeledTables].
+            Statements before it run in the session's current role.
+    """
+
+    def __init__(
+        self,
+        role: str,
+        local: bool = False,
+        pipeline: bool = False,
+        tables: LabeledTables | None = None,
+    ):
+        self.role = role
+        self.local = local
+        self.pipeline = pipeline
+        self.tables = tables
+        self.applied = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if not self.applied:
+            if self.tables is not None and not self.tables.referenced_by(sql):
+                return execute(sql, params, many, context)
+            self.applied = True
+        return _execute_with_role(
+            self.role, self.local, self.pipeline, execute, sql, params, many, context
+        )
+
+
+@contextmanager
+def lazy_session_role(
+    role: str,
+    defer_reset: bool = False,
+    pipeline: bool = False,
+    using=DEFAULT_DB_ALIAS,
+    tables: LabeledTables | None = None,
+):
+    """Switch to ``role`` on the first query run within the block.
+
+    ``RESET ROLE`` is only issued on exit if the session's role was
+    switched. It's issued whether the block exits normally or raises, and
+    a connection whose role can't be reset is closed. Yields the installed
+    [LazySessionRole][django_security_label.middleware.LazySessionRole].
+
+    Args:
+        role: The PostgreSQL role to switch to.
+        defer_reset: Passed on to
+            [disable_masked_reads][django_security_label.middleware.disable_masked_reads]
+            as ``defer`` on exit.
+        pipeline: Send the role switch together with the first query. See
+            [LazySessionRole][django_security_label.middleware.LazySessionRole].
+        using: The database alias.
+        tables: Only switch before the first query on one of these tables.
+            See [LazySessionRole][django_security_label.middleware.LazySessionRole].
+    """
+    db = connections[using]
+    lazy_role = LazySessionRole(role, pipeline=pipeline, tables=tables)
+    db._security_label_reset_pending = False
+    try:
+        with db.execute_wrapper(lazy_role):
+            yield lazy_role
+    except BaseException:
+        _reset_role_on_exit(db, defer=defer_reset, raised=True)
+        raise
+    _reset_role_on_exit(db, defer=defer_reset)
+
+
+class LazyTransactionRole(LazySessionRole):
+    """Execute wrapper that opens a transaction using ``role`` on the first query.
+
+    Install it with ``connection.execute_wrapper()`` and call ``close()``
+    when the block it covers ends. Before the first statement, it enters
+    an atomic block and runs ``SET LOCAL ROLE``, so a block that never
+    queries the connection doesn't connect or open a transaction at all.
+    The atomic block lasts until ``close()``, so the role applies to the
+    rest of the block's queries.
+
+    A statement that already runs inside an atomic block opened within the
+    block, such as the view's own, sets the role in that transaction
+    instead. Once it ends, the next statement outside of it opens the
+    transaction again.
+
+    Args:
+        role: The PostgreSQL role to switch to.
+        pipeline: Send the role switch in the same network round trip as
+            the query that triggered it. See
+            [LazySessionRole][django_security_label.middleware.LazySessionRole].
+        tables: Only switch before the first statement that references
+            one of these
+            [LabeledTables][django_security_label.tables.LabeledTables].
+    """
+
+    def __init__(
+        self,
+        role: str,
+        pipeline: bool = False,
+        tables: LabeledTables | None = None,
+    ):
+        super().__init__(role, local=True, pipeline=pipeline, tables=tables)
+        self.atomic = None
+
+    def __call__(self, execute, sql, params, many, context):
+        if not self.applied:
+            if self.tables is not None and not self.tables.referenced_by(sql):
+                return execute(sql, params, many, context)
+            self.applied = True
+        db = context["connection"]
+        if not db.in_atomic_block:
+            self.atomic = transaction.atomic(using=db.alias)
+            self.atomic.__enter__()
+        return _execute_with_role(
+            self.role, self.local, self.pipeline, execute, sql, params, many, context
+        )
+
+    def close(self, exc_type=None, exc_value=None, traceback=None):
+        """Commit the transaction opened for the block, or roll it back on error."""
+        if self.atomic is not None:
+            atomic, self.atomic = self.atomic, None
+            atomic.__exit__(exc_type, exc_value, traceback)
+
+
+@contextmanager
+def transaction_role(
+    role: str,
+    lazy: bool = False,
+    pipeline: bool = False,
+    using=DEFAULT_DB_ALIAS,
+    tables: LabeledTables | None = None,
+):
+    """Run the block in a transaction that uses ``role``.
+
+    Opens an atomic block and runs ``SET LOCAL ROLE`` inside of it. The
+    role ends with the transaction, so there is no ``RESET ROLE`` round
+    trip and the role can't leak to another client of a transaction-pooling
+    connection pooler. Nested atomic blocks, such as ``ATOMIC_REQUESTS``,
+    become savepoints of this transaction.
+
+    Args:
+        role: The PostgreSQL role to switch to.
+        lazy: Defer opening the transaction and ``SET LOCAL ROLE`` until
+            the first query of the block. See
+            [LazyTransactionRole][django_security_label.middleware.LazyTransactionRole].
+        pipeline: With ``lazy``, send the role switch together with the
+            first query. See
+            [LazySessionRole][django_security_label.middleware.LazySessionRole].
+        using: The database alias.
+        tables: With ``lazy``, only switch before the first query on one of
+            these tables. See
+            [LazySessionRole][django_security_label.middleware.LazySessionRole].
+    """
+    if not lazy:
+        with transaction.atomic(using=using):
+            set_local_role(role, using=using)
+            yield
+        return
+    lazy_role = LazyTransactionRole(role, pipeline=pipeline, tables=tables)
+    try:
+        with connections[using].execute_wrapper(lazy_role):
+            yield
+    except BaseException as exc:
+        lazy_role.close(type(exc), exc, exc.__traceback__)
+        raise
+    lazy_role.close()
+
+
+# The session's role, and the role RESET ROLE returns to: the login role, or
+# the one set with "-c role=..." when connecting.
+_ROLE_QUERY = """
+SELECT current_user,
+       CASE reset_val WHEN 'none' THEN session_user ELSE reset_val END
+FROM pg_settings WHERE name = 'role';
+"""
+
+
+def _query_role(db):
+    """Ask PostgreSQL for the role of ``db``'s session, ``None`` for the default."""
+    db.ensure_connection()
+    with db.wrap_database_errors, db.connection.cursor() as cursor:
+        cursor.execute(_ROLE_QUERY)
+        current_user, default_user = cursor.fetchone()
+    role = None if current_user == default_user else current_user
+    db._security_label_role = _RoleState(db, role)
+    return role
+
 
+def check_connection_role(using=DEFAULT_DB_ALIAS, verify: bool = True) -> bool:
+    """Make sure ``using``'s connection isn't left in a masked role.
 
-def disable_masked_reads():
-    """Reset the session role back to the connection default."""
-    with connection.cursor() as cursor:
-        cursor.execute("RESET ROLE;")
+    Run it before reusing a persistent connection. A connection found in
+    another role is reset, and one that can't be reset is closed, so the
+    next query opens a new connection. Connections in a transaction, or
+    waiting for a deferred reset, are left alone.
+
+    Args:
+        using: The database alias.
+        verify: Ask PostgreSQL for ``current_user``, which costs a round
+            trip. Otherwise only the role tracked by this package's
+            helpers is checked, which catches roles left behind by them
+            without any query, but not ``SET ROLE`` statements run
+            directly.
+
+    Returns:
+        ``False`` if the connection was closed.
+    """
+    db = connections[using]
+    if (
+        db.connection is None
+        or db.in_atomic_block
+        or getattr(db, "_security_label_reset_pending", False)
+    ):
+        return True
+    try:
+        role = _current_role(db)
+        if verify or role is _UNKNOWN_ROLE:
+            role = _query_role(db)
+        if role is not None:
+            _switch_role(db, None)
+    except Error:
+        db.close()
+        return False
+    return True
+
+
+def check_connection_roles(**kwargs):
+    """Check the role of each open PostgreSQL connection.
+
+    See [check_connection_role][django_security_label.middleware.check_connection_role].
+    Connected to ``request_started`` by ``SECURITY_LABEL_CHECK_CONNECTION_ROLE``.
+    """
+    for db in connections.all(initialized_only=True):
+        if db.vendor == "postgresql":
+            check_connection_role(db.alias)
+
+
+def check_pool_connection(conn):
+    """Reset a pooled connection's role when it's checked out of the pool.
+
+    Pass it as the ``check`` argument of the pool, which needs
+    ``psycopg_pool`` 3.2 or newer::
+
+        "OPTIONS": {"pool": {"check": check_pool_connection}}
+
+    Pooled connections are returned to the pool at the end of each request,
+    so ``request_started`` can't check them. If the check fails, the pool
+    discards the connection.
+    """
+    autocommit = conn.autocommit
+    # Don't leave a transaction open on the checked out connection.
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(_ROLE_QUERY)
+            current_user, default_user = cursor.fetchone()
+            if current_user != default_user:
+                cursor.execute("RESET ROLE;")
+    finally:
+        conn.autocommit = autocommit
+
+
+class MaskedReadsScope(ContextDecorator):
+    """Context manager and decorator that switches to a policy's role.
+
+    Use [masked_reads][django_security_label.middleware.masked_reads] to
+    create one.
+    """
+
+    def __init__(self, policy: str | None, using: str):
+        self.policy = policy or constants.MASKED_READER_ROLE
+        self.using = using
+        self._stack = []
+
+    def _recreate_cm(self):
+        # A decorated function may run in several threads at once.
+        return type(self)(self.policy, self.using)
+
+    def __enter__(self):
+        db = connections[self.using]
+        pending = getattr(db, "_security_label_reset_pending", False)
+        if pending:
+            previous = None
+        else:
+            previous = _current_role(db)
+            if previous is _UNKNOWN_ROLE:
+                previous = _query_role(db)
+        state = _get_role_state(db)
+        # Within a SET LOCAL ROLE transaction, switch with SET LOCAL ROLE too
+        # and restore the outer role as such. A session-level switch would
+        # outlive the transaction, COMMIT only ends the local roles.
+        local = state is not None and state.local
+        db._security_label_reset_pending = False
+        self._stack.append((previous, local, pending, _active_policy.set(self.policy)))
+        _switch_role(db, self.policy, local=local)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        previous, local, pending, token = self._stack.pop()
+        db = connections[self.using]
+        try:
+            if db.in_atomic_block and db.needs_rollback:
+                # Rolling back the transaction undoes the role switch.
+                return
+            if previous is None and pending:
+                disable_masked_reads(defer=True, using=self.using)
+            else:
+                _switch_role(db, previous, local=local)
+        except Error:
+            # Don't reuse a connection stuck in the block's role.
+            db.close()
+            if exc_type is None:
+                raise
+        finally:
+            _active_policy.reset(token)
+
+
+def masked_reads(policy=None, using=DEFAULT_DB_ALIAS):
+    """Run queries on ``using`` in ``policy``'s role, outside of requests.
+
+    Use it as a context manager or a decorator, for example in background
+    tasks and management commands::
+
+        with masked_reads("analyst"):
+            export_rows()
+
+        @masked_reads
+        def nightly_report(): ...
+
+    The role is switched once when the block is entered, however many
+    queries run in it. On exit, the role the session had before is
+    restored, so blocks can be nested, and nested blocks using the same
+    role don't send any statement. Within a
+    [transaction_role][django_security_label.middleware.transaction_role]
+    block, ``SET LOCAL ROLE`` is used, so the role still ends with the
+    transaction. The policy is available from
+    [get_active_policy][django_security_label.middleware.get_active_policy]
+    within the block.
+
+    Args:
+        policy: The masking policy, which shares its name with the role.
+            Defaults to the default masked reader role.
+        using: The database alias.
+    """
+    # Bare decorator: @masked_reads
+    if callable(policy):
+        return MaskedReadsScope(None, using)(policy)
+    return MaskedReadsScope(policy, using)
 
 
 def use_masked_reads(request: HttpRequest) -> bool:
@@ -48,33 +659,348 @@ def use_masked_reads(request: HttpRequest) -> bool:
     return user is None or not user.is_authenticated or not user.is_superuser
 
 
-class MaskedReadsMiddleware:
-    """Enables masked reads for every non-superuser request.
+@contextmanager
+def _request_context(policy, stats):
+    """Make ``policy`` and ``stats`` the current request's within the block."""
+    policy_token = _active_policy.set(policy)
+    stats_token = _request_stats.set(stats)
+    try:
+        yield
+    finally:
+        _request_stats.reset(stats_token)
+        _active_policy.reset(policy_token)
 
-    Uses [use_masked_reads][django_security_label.middleware.use_masked_reads]
-    to decide. Subclass and override ``__call__`` or replace
-    [use_masked_reads][django_security_label.middleware.use_masked_reads]
-    for a custom policy.
+
+class _BaseStreamingRoleScope:
+    """Iterates streaming content with the request's role in place.
+
+    The role scope is entered when iteration starts, after the middleware
+    further out have processed the response, and is exited once the
+    content is exhausted, fails or is closed, whichever comes first.
+    Django closes the response, and so this iterator, when the server is
+    done with it.
+    """
+
+    def __init__(self, content, role: str, role_scope, stats):
+        self.content = content
+        self.role = role
+        self.role_scope = role_scope
+        self.stats = stats
+        self.scope = None
+        self.closed = False
+
+    def _enter(self):
+        if self.scope is None:
+            self.scope = self.role_scope(self.role)
+            self.scope.__enter__()
+
+    def _exit(self, exc=None):
+        if self.closed:
+            return
+        self.closed = True
+        if self.scope is None:
+            return
+        if exc is None:
+            self.scope.__exit__(None, None, None)
+        else:
+            self.scope.__exit__(type(exc), exc, exc.__traceback__)
+
+    def close(self):
+        with _request_context(self.role, self.stats):
+            self._exit()
+
+
+class _StreamingRoleScope(_BaseStreamingRoleScope):
+    def __iter__(self):
+        content = iter(self.content)
+        while not self.closed:
+            with _request_context(self.role, self.stats):
+                try:
+                    self._enter()
+                    chunk = next(content)
+                except StopIteration:
+                    break
+                except BaseException as exc:
+                    self._exit(exc)
+                    raise
+            yield chunk
+        self.close()
+
+
+class _AsyncStreamingRoleScope(_BaseStreamingRoleScope):
+    async def __aiter__(self):
+        content = aiter(self.content)
+        while not self.closed:
+            with _request_context(self.role, self.stats):
+                try:
+                    if self.scope is None:
+                        await sync_to_async(self._enter, thread_sensitive=True)()
+                    chunk = await anext(content)
+                except StopAsyncIteration:
+                    break
+                except BaseException as exc:
+                    await sync_to_async(self._exit, thread_sensitive=True)(exc)
+                    raise
+            yield chunk
+        await sync_to_async(self.close, thread_sensitive=True)()
+
+
+class BaseMaskingMiddleware:
+    """Switches the PostgreSQL role for requests that need masked reads.
+
+    Subclasses implement
+    [get_role][django_security_label.middleware.BaseMaskingMiddleware.get_role].
+    Views decorated with
+    [masking_exempt][django_security_label.decorators.masking_exempt] or
+    [masking_policy][django_security_label.decorators.masking_policy] skip
+    it.
+    How the role is switched is controlled by these settings:
+
+    - ``SECURITY_LABEL_LAZY_ROLE_SWITCH``: defer the switch until the
+      request's first query. See
+      [lazy_session_role][django_security_label.middleware.lazy_session_role].
+    - ``SECURITY_LABEL_DEFER_ROLE_RESET``: keep the role on a persistent
+      connection until something needs the default role. See
+      [disable_masked_reads][django_security_label.middleware.disable_masked_reads].
+    - ``SECURITY_LABEL_TRANSACTION_ROLE``: run masked requests in a
+      transaction using ``SET LOCAL ROLE``. See
+      [transaction_role][django_security_label.middleware.transaction_role].
+    - ``SECURITY_LABEL_PIPELINE_ROLE_SWITCH``: with lazy switching, send the
+      role switch in the same round trip as the first query. See
+      [LazySessionRole][django_security_label.middleware.LazySessionRole].
+    - ``SECURITY_LABEL_DATABASES``: the database aliases to mask, defaults
+      to ``["default"]``. With more than one alias, each alias is switched
+      lazily, only once the request queries it. That includes opening the
+      transaction of ``SECURITY_LABEL_TRANSACTION_ROLE``.
+    - ``SECURITY_LABEL_LABELED_TABLES_ONLY``: only switch the role before
+      the first statement that references a table with security labels.
+      Implies lazy switching. See
+      [django_security_label.tables][django_security_label.tables].
+    - ``SECURITY_LABEL_POLICY_DATABASES``: policies with a dedicated alias
+      that connects as the policy's role. Use it with
+      [MaskedDatabaseRouter][django_security_label.routers.MaskedDatabaseRouter],
+      so the role doesn't need to be switched at all.
+
+    The role is reset however the request ends, including when the view
+    raises. Set ``SECURITY_LABEL_CHECK_CONNECTION_ROLE`` to also check that
+    each persistent connection is back in its default role when a request
+    starts, see
+    [check_connection_role][django_security_label.middleware.check_connection_role].
+
+    The content of a streaming response is iterated with the role in place
+    as well, so querysets consumed by a ``StreamingHttpResponse``, including
+    ``QuerySet.iterator()`` on server-side cursors, are masked. The role is
+    held until the content is exhausted or the response is closed.
+
+    The middleware supports both sync and async requests. Under ASGI,
+    ``get_role()`` and the role switch run in a single call on the
+    thread-sensitive executor, which is where Django runs sync views and
+    ORM queries made through ``sync_to_async()``, so the role applies to
+    the connection those queries use. The role of the request being
+    processed is available from
+    [get_active_policy][django_security_label.middleware.get_active_policy].
+
+    Masked requests get a ``security_label_stats`` attribute counting the
+    role switches sent for them, see
+    [django_security_label.stats][django_security_label.stats].
     """
 
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        self.lazy = getattr(settings, "SECURITY_LABEL_LAZY_ROLE_SWITCH", False)
+        self.defer_reset = getattr(settings, "SECURITY_LABEL_DEFER_ROLE_RESET", False)
+        self.transaction_scoped = getattr(
+            settings, "SECURITY_LABEL_TRANSACTION_ROLE", False
+        )
+        self.pipeline = getattr(settings, "SECURITY_LABEL_PIPELINE_ROLE_SWITCH", False)
+        self.databases = list(
+            getattr(settings, "SECURITY_LABEL_DATABASES", [DEFAULT_DB_ALIAS])
+        )
+        self.labeled_tables = None
+        if getattr(settings, "SECURITY_LABEL_LABELED_TABLES_ONLY", False):
+            self.labeled_tables = get_labeled_tables()
+        self._view_roles = {}
+
+    def get_role(self, request: HttpRequest) -> str | None:
+        """Return the PostgreSQL role for this request, or ``None`` to skip masking."""
+        raise NotImplementedError(
+            "subclasses of BaseMaskingMiddleware must provide a get_role() method"
+        )
+
+    def _get_view_role(self, request):
+        """Return the role set by the decorators of the view ``request`` resolves to.
+
+        Returns ``_UNDECIDED`` for an undecorated view or a path that doesn't
+        resolve. The decision is cached per view function, and paths are only
+        resolved once some view is decorated.
+        """
+        resolver = get_resolver(getattr(request, "urlconf", None))
+        # Loading the URLconf imports, and so decorates, its views.
+        resolver.url_patterns  # noqa: B018
+        if not decorators._views_decorated:
+            return _UNDECIDED
+        try:
+            match = resolver.resolve(request.path_info)
+        except Resolver404:
+            return _UNDECIDED
+        view_func = match.func
+        try:
+            return self._view_roles[view_func]
+        except KeyError:
+            pass
+        if getattr(view_func, "masking_exempt", False):
+            role = None
+        else:
+            role = getattr(view_func, "masking_policy", _UNDECIDED)
+        self._view_roles[view_func] = role
+        return role
+
+    def _get_request_role(self, request):
+        role = self._get_view_role(request)
+        if role is _UNDECIDED:
+            role = self.get_role(request)
+        return role
+
+    @contextmanager
+    def role_scope(self, role: str):
+        """Use ``role`` for the queries run within the block."""
+        with ExitStack() as stack:
+            for using in self.databases:
+                stack.enter_context(self.database_role_scope(role, using))
+            yield
+
+    @contextmanager
+    def database_role_scope(self, role: str, using: str):
+        """Use ``role`` for the queries run on the ``using`` alias within the block."""
+        # With several aliases, only switch the ones the request queries.
+        # MaskedDatabaseRouter sends the queries of a policy with its own
+        # alias there, which connects as the role already, so only queries
+        # bypassing the router switch roles.
+        lazy = (
+            self.lazy
+            or len(self.databases) > 1
+            or self.labeled_tables is not None
+            or get_policy_database(role) is not None
+        )
+        if self.transaction_scoped:
+            with transaction_role(
+                role,
+                lazy=lazy,
+                pipeline=self.pipeline,
+                using=using,
+                tables=self.labeled_tables,
+            ):
+                yield
+            return
+        if lazy:
+            with lazy_session_role(
+                role,
+                defer_reset=self.defer_reset,
+                pipeline=self.pipeline,
+                using=using,
+                tables=self.labeled_tables,
+            ):
+                yield
+            return
+        set_session_role(role, using=using)
+        db = connections[using]
+        try:
+            yield
+        except BaseException:
+            _reset_role_on_exit(db, defer=self.defer_reset, raised=True)
+            raise
+        _reset_role_on_exit(db, defer=self.defer_reset)
 
     def __call__(self, request):
-        if use_masked_reads(request):
-            enable_masked_reads()
-            try:
-                response = self.get_response(request)
-            except InternalError:
-                disable_masked_reads()
-                raise
-            disable_masked_reads()
+        # Exit out to async mode, if needed
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        role = self._get_request_role(request)
+        if role is None:
+            return self.get_response(request)
+
+        stats = request.security_label_stats = RequestRoleStats(role)
+        with _request_context(role, stats), self.role_scope(role):
+            response = self.get_response(request)
+        return self._stream_with_role(response, role, stats)
+
+    def _stream_with_role(self, response, role, stats):
+        """Use ``role`` again while a streaming response's content is iterated."""
+        if not getattr(response, "streaming", False):
             return response
+        if response.is_async:
+            streaming_role_scope = _AsyncStreamingRoleScope
+        else:
+            streaming_role_scope = _StreamingRoleScope
+        response.streaming_content = streaming_role_scope(
+            response.streaming_content, role, self.role_scope, stats
+        )
+        return response
+
+    def _enter_role_scope(self, request):
+        role = self._get_request_role(request)
+        if role is None:
+            return None, None, None
+        stats = request.security_label_stats = RequestRoleStats(role)
+        scope = self.role_scope(role)
+        with _request_context(role, stats):
+            scope.__enter__()
+        return role, scope, stats
+
+    def _exit_role_scope(self, scope, role, stats, exc=None):
+        with _request_context(role, stats):
+            if exc is None:
+                scope.__exit__(None, None, None)
+            else:
+                scope.__exit__(type(exc), exc, exc.__traceback__)
+
+    async def __acall__(self, request):
+        # Deciding on the role and switching to it share one hop to the
+        # thread the request's queries run on.
+        role, scope, stats = await sync_to_async(
+            self._enter_role_scope, thread_sensitive=True
+        )(request)
+        if scope is None:
+            return await self.get_response(request)
+
+        try:
+            with _request_context(role, stats):
+                response = await self.get_response(request)
+        except BaseException as exc:
+            await sync_to_async(self._exit_role_scope, thread_sensitive=True)(
+                scope, role, stats, exc
+            )
+            raise
+        await sync_to_async(self._exit_role_scope, thread_sensitive=True)(
+            scope, role, stats
+        )
+        return self._stream_with_role(response, role, stats)
 
-        return self.get_response(request)
 
+class MaskedReadsMiddleware(BaseMaskingMiddleware):
+    """Enables masked reads for every non-superuser request.
+
+    Uses [use_masked_reads][django_security_label.middleware.use_masked_reads]
+    to decide. Subclass and override ``get_role`` or replace
+    [use_masked_reads][django_security_label.middleware.use_masked_reads]
+    for a custom policy. See
+    [BaseMaskingMiddleware][django_security_label.middleware.BaseMaskingMiddleware]
+    for the settings that control how the role is switched.
+    """
 
-class GroupMaskingMiddleware:
+    def get_role(self, request: HttpRequest) -> str | None:
+        if use_masked_reads(request):
+            return constants.MASKED_READER_ROLE
+        return None
+
+
+class GroupMaskingMiddleware(BaseMaskingMiddleware):
     """Switches to a PostgreSQL role based on the user's Django group.
 
     Reads ``settings.SECURITY_LABEL_GROUPS_TO_POLICIES`` — a list of
@@ -87,18 +1013,19 @@ class GroupMaskingMiddleware:
 
     Subclass and override
     [determine_policy][django_security_label.middleware.GroupMaskingMiddleware.determine_policy]
-    to change the policy selection logic.
+    to change the policy selection logic. See
+    [BaseMaskingMiddleware][django_security_label.middleware.BaseMaskingMiddleware]
+    for the settings that control how the role is switched.
     """
 
-    def __init__(self, get_response):
-        self.get_response = get_response
-
     def determine_policy(self, request: HttpRequest) -> str | None:
         """Return the PostgreSQL masking policy to use for this request.
 
         Iterates ``settings.SECURITY_LABEL_GROUPS_TO_POLICIES`` and returns
         the ``policy`` for the first group the user belongs to. The masking ``policy``
         and PostgreSQL role share the same name, but are different schema objects.
+        The result is cached per user when a policy cache is configured, see
+        [django_security_label.policies][django_security_label.policies].
 
         Returns ``None`` to skip masking entirely and the default masked reader role if no group matches.
         """
@@ -106,22 +1033,8 @@ class GroupMaskingMiddleware:
         if user is not None:
             if getattr(user, "is_superuser", False):
                 return None
-            user_groups = user.groups.in_bulk(field_name="name")
-            for group_name, policy in settings.SECURITY_LABEL_GROUPS_TO_POLICIES:
-                if group_name in user_groups:
-                    return policy
+            return get_group_policy(user)
         return constants.MASKED_READER_ROLE
 
-    def __call__(self, request):
-        policy = self.determine_policy(request)
-        if policy is not None:
-            set_session_role(policy)
-            try:
-                response = self.get_response(request)
-            except InternalError:
-                disable_masked_reads()
-                raise
-            disable_masked_reads()
-            return response
-
-        return self.get_response(request)
+    def get_role(self, request: HttpRequest) -> str | None:
+        return self.determine_policy(request)
@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [("django_security_label", "0001_initial")]
+    operations = [
+        # The batches of anonymize_static's runs, see static_masking.py.
+        migrations.RunSQL(
+            "CREATE TABLE dsl_static_masking ("
+            "policy text NOT NULL, "
+            "table_name text NOT NULL, "
+            "batch integer NOT NULL, "
+            "start_pk text, "
+            "end_pk text, "
+            "row_count bigint, "
+            "done_at timestamp with time zone, "
+            "PRIMARY KEY (policy, table_name, batch))",
+            "DROP TABLE dsl_static_masking",
+        ),
+    ]
@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [("django_security_label", "0002_static_masking")]
+    operations = [
+        # The rows logged by sync_masked_replica's triggers on the source.
+        migrations.RunSQL(
+            [
+                "CREATE TABLE dsl_change_log ("
+                "id bigserial PRIMARY KEY, "
+                "table_name text NOT NULL, "
+                "pk text NOT NULL, "
+                "changed_at timestamp with time zone NOT NULL DEFAULT now())",
+                "CREATE INDEX dsl_change_log_table ON dsl_change_log (table_name, id)",
+            ],
+            "DROP TABLE dsl_change_log",
+        ),
+        # The last timestamp sync_masked_replica synced, on the target.
+        migrations.RunSQL(
+            "CREATE TABLE dsl_sync_state ("
+            "source text NOT NULL, "
+            "table_name text NOT NULL, "
+            "position text NOT NULL, "
+            "synced_at timestamp with time zone NOT NULL DEFAULT now(), "
+            "PRIMARY KEY (source, table_name))",
+            "DROP TABLE dsl_sync_state",
+        ),
+    ]
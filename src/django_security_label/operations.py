@@ -18,18 +18,32 @@ from django_security_label import compat
 
 
 def create_role(
-    schema_editor: BaseDatabaseSchemaEditor, name: str, inherit_from_db_user: bool
+    schema_editor: BaseDatabaseSchemaEditor,
+    name: str,
+    inherit_from_db_user: bool,
+    login: bool = False,
+    password: str | None = None,
 ) -> None:
-    """Create (or recreate) a PostgreSQL ``NOLOGIN`` role.
+    """Create (or recreate) a PostgreSQL role.
 
     Args:
         schema_editor: The active schema editor.
         name: The role name to create.
         inherit_from_db_user: When ``True``, grants the current database
             user's permissions to the new role.
+        login: When ``True``, creates a ``LOGIN`` role, so a ``DATABASES``
+            alias can connect as it directly. Otherwise the role is
+            ``NOLOGIN``.
+        password: The password of a ``LOGIN`` role.
     """
     schema_editor.execute(f"DROP ROLE IF EXISTS {schema_editor.quote_name(name)}")
-    schema_editor.execute(f"CREATE ROLE {schema_editor.quote_name(name)} NOLOGIN")
+    if login:
+        sql = f"CREATE ROLE {schema_editor.quote_name(name)} LOGIN"
+        if password is not None:
+            sql += f" PASSWORD {schema_editor.quote_value(password)}"
+        schema_editor.execute(sql)
+    else:
+        schema_editor.execute(f"CREATE ROLE {schema_editor.quote_name(name)} NOLOGIN")
     if inherit_from_db_user:
         user = schema_editor.connection.settings_dict["USER"]
         schema_editor.execute(
@@ -70,14 +84,21 @@ class CreateRole(Operation):
         name: The role name to create.
         inherit_from_db_user: Whether the new role should inherit
             permissions from the ``DATABASES`` user.
+        login: Whether the new role can log in, for a ``DATABASES`` alias
+            that connects as the role directly.
+        password: The password of a ``LOGIN`` role. Avoid committing it
+            to a migration, set it afterwards or use another
+            authentication method where possible.
     """
 
     reversible = True
     category = compat.ADDITION
 
-    def __init__(self, name, inherit_from_db_user=False):
+    def __init__(self, name, inherit_from_db_user=False, login=False, password=None):
         self.name = name
         self.inherit_from_db_user = inherit_from_db_user
+        self.login = login
+        self.password = password
 
     def state_forwards(self, app_label, state):
         pass
@@ -87,6 +108,8 @@ class CreateRole(Operation):
             schema_editor,
             name=self.name,
             inherit_from_db_user=self.inherit_from_db_user,
+            login=self.login,
+            password=self.password,
         )
 
     def database_backwards(self, app_label, schema_editor, from_state, to_state):
@@ -0,0 +1,350 @@
+"""Resolve which masking policy applies to a user.
+
+[GroupMaskingMiddleware][django_security_label.middleware.GroupMaskingMiddleware]
+uses [get_group_policy][django_security_label.policies.get_group_policy] to
+map a user's Django groups to a policy with
+``settings.SECURITY_LABEL_GROUPS_TO_POLICIES``.
+
+Looking up the user's groups costs a query on every request. The result
+can be cached per user with these settings:
+
+- ``SECURITY_LABEL_POLICY_CACHE_SIZE``: the number of users kept in a
+  process-local LRU cache. ``0``, the default, disables it.
+- ``SECURITY_LABEL_POLICY_CACHE_ALIAS``: the alias of a Django cache in
+  ``CACHES`` shared by all processes. ``None``, the default, disables it.
+- ``SECURITY_LABEL_POLICY_CACHE_TIMEOUT``: the number of seconds a cached
+  policy is trusted. Defaults to ``300``.
+
+Cached policies are invalidated when a user's groups change and when a
+group is saved or deleted. The process-local cache can only be invalidated
+within the process making the change, so other processes may use a stale
+policy until it times out.
+
+``SECURITY_LABEL_POLICY_DATABASES`` maps policies to ``DATABASES`` aliases
+that connect as the policy's role, see
+[get_policy_database][django_security_label.policies.get_policy_database].
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+
+from django_security_label import constants
+
+# Sentinel for a user without a cached policy. ``None`` is a valid policy.
+_MISSING = object()
+
+_CACHE_KEY_PREFIX = "django_security_label.policy"
+
+
+class PolicyCache:
+    """Per-user cache of resolved masking policies.
+
+    Entries are kept in a process-local LRU cache, a shared Django cache,
+    or both. The shared cache is invalidated as a whole by bumping a
+    generation number stored alongside the entries.
+
+    Args:
+        maxsize: The number of users in the process-local cache. ``0``
+            disables it.
+        timeout: Seconds an entry is trusted, or ``None`` to never expire.
+        alias: The Django cache alias to share entries through, if any.
+        version: Namespaces the shared cache's keys, so entries resolved
+            with a different ``SECURITY_LABEL_GROUPS_TO_POLICIES`` are
+            ignored.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 0,
+        timeout: float | None = 300,
+        alias=None,
+        version: str = "",
+    ):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.alias = alias
+        self.key_prefix = f"{_CACHE_KEY_PREFIX}.{version}"
+        self.generation_key = f"{self.key_prefix}.generation"
+        self._local: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        return caches[self.alias] if self.alias is not None else None
+
+    def get_or_set(self, user_pk, compute):
+        """Return the cached policy for ``user_pk``, calling ``compute`` on a miss."""
+        policy = self._local_get(user_pk)
+        if policy is not _MISSING:
+            return policy
+
+        generation = None
+        if self.alias is not None:
+            generation, policy = self._shared_get(user_pk)
+        if policy is _MISSING:
+            policy = compute()
+            if self.alias is not None:
+                self.backend.set(self._key(user_pk), (generation, policy), self.timeout)
+        self._local_set(user_pk, policy)
+        return policy
+
+    def invalidate(self, user_pks=None):
+        """Forget the policies of ``user_pks``, or of every user when ``None``."""
+        with self._lock:
+            if user_pks is None:
+                self._local.clear()
+            else:
+                for user_pk in user_pks:
+                    self._local.pop(user_pk, None)
+
+        if self.alias is None:
+            return
+        backend = self.backend
+        if user_pks is None:
+            backend.add(self.generation_key, 0, None)
+            try:
+                backend.incr(self.generation_key)
+            except ValueError:
+                # Evicted between add() and incr().
+                backend.set(self.generation_key, 1, None)
+        else:
+            backend.delete_many([self._key(user_pk) for user_pk in user_pks])
+
+    def _key(self, user_pk):
+        return f"{self.key_prefix}.{user_pk}"
+
+    def _local_get(self, user_pk):
+        if not self.maxsize:
+            return _MISSING
+        with self._lock:
+            entry = self._local.get(user_pk)
+            if entry is None:
+                return _MISSING
+            expires_at, policy = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._local[user_pk]
+                return _MISSING
+            self._local.move_to_end(user_pk)
+            return policy
+
+    def _local_set(self, user_pk, policy):
+        if not self.maxsize:
+            return
+        expires_at = None
+        if self.timeout is not None:
+            expires_at = time.monotonic() + self.timeout
+        with self._lock:
+            self._local[user_pk] = (expires_at, policy)
+            self._local.move_to_end(user_pk)
+            while len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+
+    def _shared_get(self, user_pk):
+        key = self._key(user_pk)
+        values = self.backend.get_many([self.generation_key, key])
+        generation = values.get(self.generation_key, 0)
+        entry = values.get(key)
+        if entry is not None and entry[0] == generation:
+            return generation, entry[1]
+        return generation, _MISSING
+
+
+_policy_cache: PolicyCache | None | object = _MISSING
+
+
+def get_policy_cache() -> PolicyCache | None:
+    """Return the cache configured by the settings, or ``None`` if disabled."""
+    global _policy_cache
+    if _policy_cache is _MISSING:
+        maxsize = getattr(settings, "SECURITY_LABEL_POLICY_CACHE_SIZE", 0)
+        alias = getattr(settings, "SECURITY_LABEL_POLICY_CACHE_ALIAS", None)
+        timeout = getattr(settings, "SECURITY_LABEL_POLICY_CACHE_TIMEOUT", 300)
+        if maxsize or alias is not None:
+            _policy_cache = PolicyCache(
+                maxsize=maxsize,
+                timeout=timeout,
+                alias=alias,
+                version=get_policy_index().fingerprint,
+            )
+        else:
+            _policy_cache = None
+    return _policy_cache
+
+
+class PolicyIndex:
+    """``SECURITY_LABEL_GROUPS_TO_POLICIES`` compiled for lookups by group name.
+
+    Maps each group name to its ``(precedence, policy)``, where a lower
+    precedence comes first in the setting. Resolving a user's groups then
+    costs a dictionary lookup per group, however long the setting is.
+
+    Args:
+        groups_to_policies: ``(group_name, policy)`` pairs in order of
+            precedence. Only the first entry for a group name is used.
+    """
+
+    def __init__(self, groups_to_policies):
+        self.groups: dict[str, tuple[int, str | None]] = {}
+        for precedence, (group_name, policy) in enumerate(groups_to_policies):
+            self.groups.setdefault(group_name, (precedence, policy))
+        self.fingerprint = hashlib.md5(
+            repr(sorted(self.groups.items())).encode(), usedforsecurity=False
+        ).hexdigest()[:12]
+
+    def __bool__(self):
+        return bool(self.groups)
+
+    def resolve(self, group_names) -> str | None:
+        """Return the policy of the group with the highest precedence.
+
+        Falls back to the default masked reader role if none of
+        ``group_names`` are in the index.
+        """
+        best = None
+        for group_name in group_names:
+            entry = self.groups.get(group_name)
+            if entry is not None and (best is None or entry[0] < best[0]):
+                best = entry
+        if best is None:
+            return constants.MASKED_READER_ROLE
+        return best[1]
+
+
+_policy_index: PolicyIndex | None = None
+
+
+def get_policy_index() -> PolicyIndex:
+    """Return the compiled ``SECURITY_LABEL_GROUPS_TO_POLICIES`` setting."""
+    global _policy_index
+    if _policy_index is None:
+        _policy_index = PolicyIndex(
+            getattr(settings, "SECURITY_LABEL_GROUPS_TO_POLICIES", [])
+        )
+    return _policy_index
+
+
+@receiver(setting_changed, dispatch_uid="django_security_label.reset_policies")
+def _reset_policies(setting, **kwargs):
+    global _policy_cache, _policy_index
+    if setting == "SECURITY_LABEL_GROUPS_TO_POLICIES":
+        _policy_index = None
+        _policy_cache = _MISSING
+    elif setting.startswith("SECURITY_LABEL_POLICY_CACHE"):
+        _policy_cache = _MISSING
+
+
+def get_policy_database(policy: str | None) -> str | None:
+    """Return the database alias dedicated to ``policy``, if there is one.
+
+    Reads ``settings.SECURITY_LABEL_POLICY_DATABASES``, a mapping of policies
+    to aliases in ``DATABASES`` that connect as the policy's role, either by
+    logging in as it or with ``-c role=<policy>`` in the connection options.
+    Queries on such an alias are masked without switching roles.
+    """
+    if policy is None:
+        return None
+    return getattr(settings, "SECURITY_LABEL_POLICY_DATABASES", {}).get(policy)
+
+
+def get_configured_policies() -> list[str]:
+    """Return the masking policies requests can be masked with.
+
+    The default masked reader role, then each policy of
+    ``settings.SECURITY_LABEL_GROUPS_TO_POLICIES`` in order, without
+    duplicates. Groups with unmasked reads, a ``None`` policy, are skipped.
+    """
+    policies = [constants.MASKED_READER_ROLE]
+    for _group_name, policy in getattr(
+        settings, "SECURITY_LABEL_GROUPS_TO_POLICIES", []
+    ):
+        if policy is not None and policy not in policies:
+            policies.append(policy)
+    return policies
+
+
+def _lookup_group_policy(user) -> str | None:
+    index = get_policy_index()
+    if not index:
+        return constants.MASKED_READER_ROLE
+    # Only fetch the names, the group rows aren't needed.
+    return index.resolve(user.groups.values_list("name", flat=True))
+
+
+def get_group_policy(user) -> str | None:
+    """Return the policy for the first configured group ``user`` belongs to.
+
+    Precedence follows the order of ``settings.SECURITY_LABEL_GROUPS_TO_POLICIES``,
+    see [PolicyIndex][django_security_label.policies.PolicyIndex]. Falls back
+    to the default masked reader role if no group matches. Uses the policy
+    cache when one is configured.
+    """
+    cache = get_policy_cache()
+    if cache is None or user.pk is None:
+        return _lookup_group_policy(user)
+    return cache.get_or_set(user.pk, partial(_lookup_group_policy, user))
+
+
+def invalidate_policies(user_pks=None):
+    """Forget the cached policies of ``user_pks``, or of every user when ``None``.
+
+    Runs again once the current transaction commits, so a policy cached by
+    another request in the meantime doesn't outlive the change.
+    """
+    cache = get_policy_cache()
+    if cache is None:
+        return
+    cache.invalidate(user_pks)
+    transaction.on_commit(partial(cache.invalidate, user_pks))
+
+
+def _user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in {"post_add", "post_remove", "post_clear"}:
+        return
+    if not reverse:
+        invalidate_policies([instance.pk])
+    elif pk_set:
+        invalidate_policies(pk_set)
+    else:
+        # Clearing a group's users doesn't report which users were removed.
+        invalidate_policies()
+
+
+def _group_changed(sender, **kwargs):
+    invalidate_policies()
+
+
+def connect_signals():
+    """Invalidate cached policies when users' groups or groups change."""
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.models import Group
+    from django.db.models.signals import m2m_changed, post_delete, post_save
+
+    user_model = get_user_model()
+    groups = getattr(user_model, "groups", None)
+    if groups is not None:
+        m2m_changed.connect(
+            _user_groups_changed,
+            sender=groups.through,
+            dispatch_uid="django_security_label.user_groups_changed",
+        )
+    post_save.connect(
+        _group_changed,
+        sender=Group,
+        dispatch_uid="django_security_label.group_saved",
+    )
+    post_delete.connect(
+        _group_changed,
+        sender=Group,
+        dispatch_uid="django_security_label.group_deleted",
+    )
@@ -0,0 +1,130 @@
+"""Measure how long masking functions take per row.
+
+Masked reads evaluate a labeled column's masking function for every row
+they return, so a slow function makes every masked list slow.
+[profile_mask_functions][django_security_label.profiling.profile_mask_functions]
+times each function over a generated set of rows on a database, so cheap
+functions can be picked for hot tables. The ``profile_mask_functions``
+management command wraps it and prints a ranked report.
+"""
+
+from __future__ import annotations
+
+import time
+
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from django_security_label.labels import MaskFunction
+
+
+class MaskFunctionProfile:
+    """The timing of one masking function.
+
+    Attributes:
+        name: The [MaskFunction][django_security_label.labels.MaskFunction]
+            member name, or the custom function string.
+        expression: The SQL expression that was timed.
+        rows: The number of rows it was evaluated for.
+        duration: The seconds of the fastest run, without the time the
+            same query takes without the function.
+        error: The database error, if the function couldn't be run.
+    """
+
+    def __init__(self, name, expression, rows, duration=None, error=None):
+        self.name = name
+        self.expression = expression
+        self.rows = rows
+        self.duration = duration
+        self.error = error
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: {self.name} {self.per_row}>"
+
+    @property
+    def per_row(self) -> float | None:
+        """The microseconds per row."""
+        if self.duration is None:
+            return None
+        return self.duration / self.rows * 1_000_000
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "expression": self.expression,
+            "rows": self.rows,
+            "seconds": self.duration,
+            "microseconds_per_row": self.per_row,
+            "error": self.error,
+        }
+
+
+def mask_function_expression(mask_function) -> str:
+    """Return the SQL expression for a ``mask_function``, as ``MaskColumn`` does."""
+    return f"anon.{mask_function}"
+
+
+def _time_query(cursor, expression, rows, repeat):
+    """Return the seconds of the fastest of ``repeat`` runs."""
+    # The query has parameters, so a literal % must be escaped.
+    expression = expression.replace("%", "%%")
+    sql = f"SELECT count({expression}) FROM generate_series(1, %s)"
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cursor.execute(sql, [rows])
+        cursor.fetchone()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def profile_mask_functions(
+    mask_functions=None,
+    rows: int = 10_000,
+    repeat: int = 3,
+    using=DEFAULT_DB_ALIAS,
+    progress=None,
+) -> list[MaskFunctionProfile]:
+    """Time each of ``mask_functions`` over ``rows`` rows and rank them.
+
+    Each function is evaluated once per row of ``generate_series``,
+    ``repeat`` times, and the fastest run is kept. The time of the same
+    query with a constant instead of the function is subtracted.
+
+    Args:
+        mask_functions: [MaskFunction][django_security_label.labels.MaskFunction]
+            members or ``mask_function`` strings, such as
+            ``"random_int_between(0, 50)"``. Defaults to every member.
+        rows: The number of rows to evaluate each function for.
+        repeat: The number of times each function is timed.
+        using: The database alias.
+        progress: Called with each profile once it's measured.
+
+    Returns:
+        The profiles, fastest first. Functions that failed come last,
+        with their ``error``.
+    """
+    if mask_functions is None:
+        mask_functions = list(MaskFunction)
+    profiles = []
+    with connections[using].cursor() as cursor:
+        baseline = _time_query(cursor, "1", rows, repeat)
+        for mask_function in mask_functions:
+            if isinstance(mask_function, MaskFunction):
+                name = mask_function.name
+            else:
+                name = str(mask_function)
+            expression = mask_function_expression(mask_function)
+            profile = MaskFunctionProfile(name, expression, rows)
+            try:
+                duration = _time_query(cursor, expression, rows, repeat)
+            except DatabaseError as exc:
+                profile.error = str(exc).strip()
+            else:
+                profile.duration = max(duration - baseline, 0.0)
+            if progress is not None:
+                progress(profile)
+            profiles.append(profile)
+    return sorted(
+        profiles,
+        key=lambda profile: (profile.duration is None, profile.duration or 0),
+    )
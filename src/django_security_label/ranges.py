@@ -0,0 +1,79 @@
+"""Split tables into primary key ranges for work done by several threads.
+
+[clone_masked][django_security_label.cloning.clone_masked] and
+[anonymize_static][django_security_label.static_masking.anonymize_static]
+split large tables with
+[split_table][django_security_label.ranges.split_table] and hand each
+[KeyRange][django_security_label.ranges.KeyRange] to a worker thread.
+"""
+
+from __future__ import annotations
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class KeyRange:
+    """A primary key range of a table, ``None`` for an open end.
+
+    Args:
+        model: The model whose table the range is part of.
+        start: The first primary key of the range.
+        end: The primary key the range stops before.
+    """
+
+    def __init__(self, model, start=None, end=None):
+        self.model = model
+        self.start = start
+        self.end = end
+
+    def where_sql(self, connection) -> tuple[str, list]:
+        """Return the ``WHERE`` clause selecting the range, and its parameters.
+
+        The bounds are cast to the primary key's type, so they can be
+        passed as text.
+        """
+        pk = self.model._meta.pk
+        pk_column = connection.ops.quote_name(pk.column)
+        pk_type = pk.db_type(connection)
+        conditions, params = [], []
+        if self.start is not None:
+            conditions.append(f"{pk_column} >= CAST(%s AS {pk_type})")
+            params.append(self.start)
+        if self.end is not None:
+            conditions.append(f"{pk_column} < CAST(%s AS {pk_type})")
+            params.append(self.end)
+        if not conditions:
+            return "", params
+        return " WHERE " + " AND ".join(conditions), params
+
+
+def split_table(model, size: int, using: str = DEFAULT_DB_ALIAS) -> list[KeyRange]:
+    """Split ``model``'s table into ranges of ``size`` rows, in primary key order.
+
+    A table without a single primary key column is one open range.
+    """
+    pk = model._meta.pk
+    if getattr(pk, "column", None) is None:
+        return [KeyRange(model)]
+    connection = connections[using]
+    pk_column = connection.ops.quote_name(pk.column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT pk FROM (SELECT {pk_column} AS pk, "
+            f"row_number() OVER (ORDER BY {pk_column}) AS n "
+            f"FROM {connection.ops.quote_name(model._meta.db_table)}) AS keys "
+            f"WHERE n %% %s = 1 AND n > 1 ORDER BY pk",
+            [size],
+        )
+        bounds = [None, *(row[0] for row in cursor.fetchall()), None]
+    return [KeyRange(model, start, end) for start, end in zip(bounds, bounds[1:])]
+
+
+def close_worker_connections(*aliases: str):
+    """Close the current thread's connections to ``aliases``.
+
+    Django only closes connections at the end of a request, so a worker
+    thread calls this once its task is done.
+    """
+    for alias in aliases:
+        connections[alias].close()
@@ -0,0 +1,483 @@
+"""Keep a masked copy of the database up to date incrementally.
+
+After a full copy with
+[clone_masked][django_security_label.cloning.clone_masked],
+[sync_masked_replica][django_security_label.replicas.sync_masked_replica]
+only copies the rows that changed since its last run. Changed rows are
+found in one of two ways:
+
+- Triggers installed by
+  [install_change_tracking][django_security_label.replicas.install_change_tracking]
+  log the primary key of each inserted, updated or deleted row in the
+  ``dsl_change_log`` table of the source. The log is emptied as it's
+  applied, so a source's log can only feed one replica.
+- A timestamp field, such as ``updated_at``, set on every save. The last
+  value seen is kept in the ``dsl_sync_state`` table of the target.
+  Deleted rows aren't noticed, and neither are rows committed with a
+  timestamp older than the last one seen.
+
+Both tables are created by the app's migrations. Changed rows are read in
+a masking policy's role, as ``clone_masked`` does, and upserted into the
+target in batches. The ``sync_masked_replica`` management command wraps it.
+"""
+
+from __future__ import annotations
+
+import time
+from contextlib import nullcontext
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from django_security_label.cloning import _columns, dependency_levels, get_cloned_models
+from django_security_label.middleware import masked_reads
+from django_security_label.tables import collect_labeled_tables
+
+CHANGE_LOG_TABLE = "dsl_change_log"
+SYNC_STATE_TABLE = "dsl_sync_state"
+TRIGGER_NAME = "dsl_log_change"
+
+_TRIGGER_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION {TRIGGER_NAME}() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        INSERT INTO {CHANGE_LOG_TABLE} (table_name, pk)
+        VALUES (TG_TABLE_NAME, to_jsonb(OLD) ->> TG_ARGV[0]);
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        INSERT INTO {CHANGE_LOG_TABLE} (table_name, pk)
+        VALUES (TG_TABLE_NAME, to_jsonb(NEW) ->> TG_ARGV[0]);
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+
+
+def _pk_column(model):
+    column = getattr(model._meta.pk, "column", None)
+    if column is None:
+        raise ValueError(
+            f"{model._meta.label} needs a single primary key column to be synced."
+        )
+    return column
+
+
+def _check_table(using, table):
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [table])
+        if cursor.fetchone()[0] is None:
+            raise ValueError(
+                f"Run the django_security_label migrations on '{using}' first, "
+                f"to create the {table} table."
+            )
+
+
+def install_change_tracking(models=None, using=DEFAULT_DB_ALIAS):
+    """Log the primary keys of the rows of ``models`` that change.
+
+    Creates a trigger on each model's table that logs inserted, updated
+    and deleted rows in the ``dsl_change_log`` table. ``TRUNCATE`` isn't
+    logged. Installing it again replaces the triggers.
+
+    Args:
+        models: The models to track. Defaults to
+            [get_cloned_models][django_security_label.cloning.get_cloned_models].
+        using: The alias of the source database.
+    """
+    if models is None:
+        models = get_cloned_models()
+    _check_table(using, CHANGE_LOG_TABLE)
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(_TRIGGER_FUNCTION)
+        for model in models:
+            table = quote_name(model._meta.db_table)
+            pk_column = connection.ops.quote_value(_pk_column(model))
+            cursor.execute(f"DROP TRIGGER IF EXISTS {TRIGGER_NAME} ON {table}")
+            cursor.execute(
+                f"CREATE TRIGGER {TRIGGER_NAME} "
+                f"AFTER INSERT OR UPDATE OR DELETE ON {table} "
+                f"FOR EACH ROW EXECUTE FUNCTION {TRIGGER_NAME}({pk_column})"
+            )
+
+
+def uninstall_change_tracking(using=DEFAULT_DB_ALIAS):
+    """Drop the change tracking triggers and empty the ``dsl_change_log`` table."""
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        # Dropping the function drops every trigger using it.
+        cursor.execute(f"DROP FUNCTION IF EXISTS {TRIGGER_NAME}() CASCADE")
+        cursor.execute(f"TRUNCATE {quote_name(CHANGE_LOG_TABLE)}")
+
+
+class _ChangeLog:
+    """The changed rows of a table, from the ``dsl_change_log`` triggers."""
+
+    def __init__(self, sync, model):
+        self.sync = sync
+        self.model = model
+        self.batch = {}
+        self.missing = set()
+        self.ids = []
+
+    def primary_keys(self):
+        """Yield the primary keys of the changed rows, in batches.
+
+        Only the log entries read are deleted, as their batch is applied.
+        Entries committed meanwhile, even with a lower id, are left for the
+        next run.
+        """
+        connection = connections[self.sync.source]
+        seen = set()
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(
+                f"SELECT id, pk FROM {connection.ops.quote_name(CHANGE_LOG_TABLE)} "
+                "WHERE table_name = %s",
+                [self.model._meta.db_table],
+            )
+            while rows := cursor.fetchmany(self.sync.batch_size):
+                self.batch = {}
+                for log_id, pk in rows:
+                    self.batch.setdefault(pk, []).append(log_id)
+                primary_keys = [pk for pk in self.batch if pk not in seen]
+                seen.update(primary_keys)
+                if primary_keys:
+                    yield primary_keys
+                else:
+                    # Every row of the batch was in an earlier one.
+                    self.applied([])
+
+    def applied(self, missing):
+        """Delete the log entries of the batch just upserted.
+
+        The entries of rows ``missing`` from the source are kept until
+        they're deleted from the target, and so are the entries of tables
+        in a cycle until their transaction commits.
+        """
+        self.missing.update(missing)
+        deferred = connections[self.sync.target].in_atomic_block
+        ids = []
+        for pk, pk_ids in self.batch.items():
+            (self.ids if deferred or pk in self.missing else ids).extend(pk_ids)
+        self._delete(ids)
+
+    def done(self):
+        self._delete(self.ids)
+        self.ids = []
+
+    def _delete(self, ids):
+        connection = connections[self.sync.source]
+        with connection.cursor() as cursor:
+            for start in range(0, len(ids), self.sync.batch_size):
+                cursor.execute(
+                    f"DELETE FROM {connection.ops.quote_name(CHANGE_LOG_TABLE)} "
+                    "WHERE id = ANY(%s)",
+                    [ids[start : start + self.sync.batch_size]],
+                )
+
+
+class _Timestamps:
+    """The changed rows of a table, from a timestamp field."""
+
+    def __init__(self, sync, model):
+        self.sync = sync
+        self.model = model
+        try:
+            self.field = model._meta.get_field(sync.updated_field)
+        except FieldDoesNotExist as exc:
+            raise ValueError(
+                f"{model._meta.label} has no '{sync.updated_field}' field to find "
+                "changed rows by."
+            ) from exc
+        self.position = None
+
+    def primary_keys(self):
+        """Yield the primary keys of the changed rows, in batches."""
+        connection = connections[self.sync.source]
+        quote_name = connection.ops.quote_name
+        table = quote_name(self.model._meta.db_table)
+        column = quote_name(self.field.column)
+        column_type = self.field.db_type(connection)
+        last_position = self.sync.get_position(self.model)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT max({column})::text FROM {table}")
+            self.position = cursor.fetchone()[0]
+        if self.position is None:
+            return
+        # Rows with the last timestamp seen are copied again, in case more
+        # of them were committed after the last run.
+        sql = (
+            f"SELECT {quote_name(self.model._meta.pk.column)}::text FROM {table} "
+            f"WHERE {column} <= CAST(%s AS {column_type})"
+        )
+        params = [self.position]
+        if last_position is not None:
+            sql += f" AND {column} >= CAST(%s AS {column_type})"
+            params.append(last_position)
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(sql, params)
+            while rows := cursor.fetchmany(self.sync.batch_size):
+                yield [row[0] for row in rows]
+
+    def applied(self, missing):
+        """The position is only saved once every batch is applied."""
+
+    def done(self):
+        if self.position is not None:
+            self.sync.set_position(self.model, self.position)
+
+
+class MaskedReplicaSync:
+    """Copies the changed rows of ``source`` into ``target``, masking them.
+
+    Args:
+        target: The alias of the masked copy.
+        source: The alias to copy from.
+        policy: The role the labeled tables are read in. Defaults to the
+            default masked reader role.
+        batch_size: The number of changed rows copied and committed at
+            once.
+        updated_field: The name of a timestamp field to find changed rows
+            by. Defaults to the ``dsl_change_log`` triggers.
+        progress: Called with the model, the number of rows upserted and
+            deleted and the seconds it took once each table is synced.
+    """
+
+    def __init__(
+        self,
+        target: str,
+        source: str = DEFAULT_DB_ALIAS,
+        policy: str | None = None,
+        batch_size: int = 10_000,
+        updated_field: str | None = None,
+        progress=None,
+    ):
+        self.target = target
+        self.source = source
+        self.policy = policy
+        self.batch_size = batch_size
+        self.updated_field = updated_field
+        self.progress = progress
+        self.labeled_tables = collect_labeled_tables()
+
+    def sync(self, models) -> dict:
+        """Sync ``models``' tables and return the rows upserted and deleted."""
+        changes = {}
+        for model in models:
+            _pk_column(model)
+            if self.updated_field is None:
+                changes[model] = _ChangeLog(self, model)
+            else:
+                changes[model] = _Timestamps(self, model)
+        if self.updated_field is not None:
+            _check_table(self.target, SYNC_STATE_TABLE)
+        elif not self.is_tracking_changes():
+            raise ValueError(
+                f"Install change tracking on '{self.source}' first, or find changed "
+                "rows by a timestamp field."
+            )
+        levels, cyclic = dependency_levels(models)
+        ordered = [model for level in levels for model in level]
+        upserted, missing, durations = {}, {}, {}
+
+        def upsert(model):
+            start = time.perf_counter()
+            upserted[model], missing[model] = self._upsert_changes(changes[model])
+            durations[model] = time.perf_counter() - start
+
+        def delete(model):
+            start = time.perf_counter()
+            self._delete(model, missing[model])
+            durations[model] += time.perf_counter() - start
+
+        # Rows are upserted after the rows they reference, and deleted before
+        # them. Tables in a cycle are synced in a single transaction.
+        for model in ordered:
+            upsert(model)
+        if cyclic:
+            with transaction.atomic(using=self.target):
+                for model in cyclic:
+                    upsert(model)
+                for model in cyclic:
+                    delete(model)
+        for model in reversed(ordered):
+            delete(model)
+
+        # The last changes are only forgotten once the rows missing from the
+        # source are deleted. Applying them again after an interruption is
+        # harmless.
+        results = {}
+        for model in [*ordered, *cyclic]:
+            changes[model].done()
+            results[model] = (upserted[model], len(missing[model]))
+            if self.progress is not None:
+                self.progress(model, *results[model], durations[model])
+        return results
+
+    def is_tracking_changes(self) -> bool:
+        """Return ``True`` if the source has the change tracking triggers."""
+        with connections[self.source].cursor() as cursor:
+            cursor.execute("SELECT to_regproc(%s)", [TRIGGER_NAME])
+            return cursor.fetchone()[0] is not None
+
+    def get_position(self, model):
+        """Return the last timestamp synced for ``model``, as text."""
+        connection = connections[self.target]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT position FROM {connection.ops.quote_name(SYNC_STATE_TABLE)} "
+                "WHERE source = %s AND table_name = %s",
+                [self.source, model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        return None if row is None else row[0]
+
+    def set_position(self, model, position):
+        connection = connections[self.target]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {connection.ops.quote_name(SYNC_STATE_TABLE)} "
+                "(source, table_name, position) VALUES (%s, %s, %s) "
+                "ON CONFLICT (source, table_name) "
+                "DO UPDATE SET position = EXCLUDED.position, synced_at = now()",
+                [self.source, model._meta.db_table, position],
+            )
+
+    def _upsert_changes(self, changes):
+        upserted, missing = 0, []
+        for primary_keys in changes.primary_keys():
+            batch_upserted, batch_missing = self._upsert(changes.model, primary_keys)
+            upserted += batch_upserted
+            missing.extend(batch_missing)
+            changes.applied(batch_missing)
+        return upserted, missing
+
+    def _upsert(self, model, primary_keys):
+        """Copy the rows with ``primary_keys`` and return the ones missing.
+
+        Returns:
+            The number of rows upserted, and the primary keys of the rows
+            that no longer exist in the source.
+        """
+        source = connections[self.source]
+        target = connections[self.target]
+        quote_name = target.ops.quote_name
+        table = model._meta.db_table
+        pk = model._meta.pk
+        pk_column = quote_name(pk.column)
+        pk_array = f"CAST(%s AS {pk.db_type(target)}[])"
+        columns = _columns(model, target)
+        updates = ", ".join(
+            f"{quote_name(field.column)} = EXCLUDED.{quote_name(field.column)}"
+            for field in model._meta.concrete_fields
+            if not field.primary_key
+        )
+        conflict = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+        copy_out = (
+            f"COPY (SELECT {_columns(model, source)} FROM {quote_name(table)} "
+            f"WHERE {pk_column} = ANY({pk_array})) TO STDOUT (FORMAT BINARY)"
+        )
+        if table in self.labeled_tables:
+            role_scope = masked_reads(self.policy, using=self.source)
+        else:
+            role_scope = nullcontext()
+        source.ensure_connection()
+        with transaction.atomic(using=self.target):
+            target.ensure_connection()
+            with (
+                target.wrap_database_errors,
+                target.connection.cursor() as target_cursor,
+            ):
+                target_cursor.execute(
+                    "CREATE TEMPORARY TABLE dsl_sync_stage "
+                    f"(LIKE {quote_name(table)}) ON COMMIT DROP"
+                )
+                with (
+                    role_scope,
+                    source.wrap_database_errors,
+                    source.connection.cursor() as source_cursor,
+                    source_cursor.copy(copy_out, [primary_keys]) as reader,
+                    target_cursor.copy(
+                        f"COPY dsl_sync_stage ({columns}) FROM STDIN (FORMAT BINARY)"
+                    ) as writer,
+                ):
+                    for data in reader:
+                        writer.write(data)
+                target_cursor.execute(
+                    f"INSERT INTO {quote_name(table)} ({columns}) "
+                    f"SELECT {columns} FROM dsl_sync_stage "
+                    f"ON CONFLICT ({pk_column}) {conflict}"
+                )
+                upserted = target_cursor.rowcount
+                target_cursor.execute(
+                    f"SELECT changed::text FROM unnest({pk_array}) AS changed "
+                    f"WHERE changed NOT IN (SELECT {pk_column} FROM dsl_sync_stage)",
+                    [primary_keys],
+                )
+                missing = [row[0] for row in target_cursor.fetchall()]
+                target_cursor.execute("DROP TABLE dsl_sync_stage")
+        return upserted, missing
+
+    def _delete(self, model, primary_keys):
+        connection = connections[self.target]
+        quote_name = connection.ops.quote_name
+        pk = model._meta.pk
+        for start in range(0, len(primary_keys), self.batch_size):
+            with transaction.atomic(using=self.target), connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {quote_name(model._meta.db_table)} "
+                    f"WHERE {quote_name(pk.column)} = "
+                    f"ANY(CAST(%s AS {pk.db_type(connection)}[]))",
+                    [primary_keys[start : start + self.batch_size]],
+                )
+
+
+def sync_masked_replica(
+    target: str,
+    source: str = DEFAULT_DB_ALIAS,
+    policy: str | None = None,
+    models=None,
+    batch_size: int = 10_000,
+    updated_field: str | None = None,
+    progress=None,
+) -> dict:
+    """Copy the rows of ``source`` that changed since the last sync into ``target``.
+
+    Labeled tables are read in ``policy``'s role and the other tables are
+    copied as they are, as
+    [clone_masked][django_security_label.cloning.clone_masked] does.
+    Rows that changed are upserted into ``target`` in batches, after the
+    rows they reference, and rows that were deleted are deleted from it.
+
+    Args:
+        target: The alias of the masked copy.
+        source: The alias to copy from.
+        policy: The role labeled tables are read in. Defaults to the
+            default masked reader role.
+        models: The models to sync. Defaults to
+            [get_cloned_models][django_security_label.cloning.get_cloned_models].
+        batch_size: See
+            [MaskedReplicaSync][django_security_label.replicas.MaskedReplicaSync].
+        updated_field: See
+            [MaskedReplicaSync][django_security_label.replicas.MaskedReplicaSync].
+        progress: See
+            [MaskedReplicaSync][django_security_label.replicas.MaskedReplicaSync].
+
+    Returns:
+        The number of rows upserted and deleted, by model.
+    """
+    if models is None:
+        models = get_cloned_models()
+    replica_sync = MaskedReplicaSync(
+        target,
+        source=source,
+        policy=policy,
+        batch_size=batch_size,
+        updated_field=updated_field,
+        progress=progress,
+    )
+    return replica_sync.sync(models)
@@ -0,0 +1,49 @@
+"""Database router for policies with a dedicated masked database alias.
+
+Add [MaskedDatabaseRouter][django_security_label.routers.MaskedDatabaseRouter]
+to ``settings.DATABASE_ROUTERS`` and map policies to aliases with
+``settings.SECURITY_LABEL_POLICY_DATABASES``. Queries made while a masking
+middleware handles a request for one of those policies are sent to the
+policy's alias, which connects as the masked role, so no ``SET ROLE`` is
+needed.
+"""
+
+from __future__ import annotations
+
+from django.conf import settings
+
+from django_security_label.middleware import get_active_policy
+from django_security_label.policies import get_policy_database
+
+
+class MaskedDatabaseRouter:
+    """Routes queries of masked requests to the policy's database alias.
+
+    Reads and writes are both routed, so a masked request can't write
+    through an unmasked connection. Requests whose policy has no dedicated
+    alias are left to the next router.
+
+    The masked aliases must point to the same database as the aliases they
+    stand in for. Relations between their objects are allowed, and no
+    migrations are run on them.
+    """
+
+    def db_for_read(self, model, **hints):
+        return get_policy_database(get_active_policy())
+
+    def db_for_write(self, model, **hints):
+        return get_policy_database(get_active_policy())
+
+    def allow_relation(self, obj1, obj2, **hints):
+        masked_databases = self._masked_databases()
+        if obj1._state.db in masked_databases or obj2._state.db in masked_databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in self._masked_databases():
+            return False
+        return None
+
+    def _masked_databases(self):
+        return set(getattr(settings, "SECURITY_LABEL_POLICY_DATABASES", {}).values())
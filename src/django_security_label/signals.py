@@ -0,0 +1,25 @@
+"""Signals sent when a connection's PostgreSQL role changes.
+
+Both signals are sent with the connection's class as the sender and these
+keyword arguments:
+
+- ``connection``: the database connection.
+- ``alias``: the connection's database alias.
+- ``role``: the role switched to, ``None`` for ``role_reset``.
+- ``policy``: the masking policy active when the statement was sent, see
+  [get_active_policy][django_security_label.middleware.get_active_policy].
+- ``local``: whether ``SET LOCAL ROLE`` was used.
+- ``duration``: the seconds spent sending the statement. In pipeline mode,
+  the statement shares a round trip with the query that triggered it, and
+  this only covers queueing it.
+
+See [django_security_label.stats][django_security_label.stats] for a
+receiver that aggregates them.
+"""
+
+from __future__ import annotations
+
+from django.dispatch import Signal
+
+role_switched = Signal()
+role_reset = Signal()
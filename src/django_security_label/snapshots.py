@@ -0,0 +1,244 @@
+"""Materialized snapshots of labeled tables, per masking policy.
+
+Dynamic masking evaluates each column's mask for every row a masked role
+reads. A snapshot stores the masked rows of a table instead, as a
+materialized view in the policy's own schema, so masked reads cost the
+same as unmasked ones. The snapshot is as fresh as its last refresh.
+
+Create and refresh snapshots with the ``refresh_masked_snapshots``
+management command, or with
+[refresh_snapshots][django_security_label.snapshots.refresh_snapshots].
+Masked roles read a snapshot when its schema comes first in their
+``search_path``, see ``snapshots`` in
+[policy_databases][django_security_label.databases.policy_databases].
+"""
+
+from __future__ import annotations
+
+import time
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from django_security_label.labels import (
+    ColumnSecurityLabel,
+    get_column_labels,
+    get_table_labels,
+)
+
+
+def snapshot_schema(policy: str) -> str:
+    """Return the name of the schema holding ``policy``'s snapshots."""
+    return f"masked_{policy}"
+
+
+def policy_roles(policy: str, using=DEFAULT_DB_ALIAS) -> list[str]:
+    """Return the roles labeled ``MASKED`` for ``policy``."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT objname FROM pg_seclabels "
+            "WHERE objtype = 'role' AND provider = %s AND label = 'MASKED' "
+            "ORDER BY objname",
+            [policy],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class MaskedSnapshot:
+    """A materialized view of a model's table, masked for one policy.
+
+    The view has the table's name and columns, with each column labeled
+    for ``policy`` replaced by its masking expression, cast to the
+    column's type. A table labeled with a ``TABLESAMPLE`` for ``policy``,
+    see [SampleTable][django_security_label.labels.SampleTable], is
+    sampled alike. It has a unique index on the primary key, so it can be
+    refreshed without blocking reads.
+
+    Args:
+        model: A model with security labels for ``policy``.
+        policy: The masking policy, the labels' ``provider``.
+    """
+
+    def __init__(self, model, policy: str):
+        self.model = model
+        self.policy = policy
+        self.schema = snapshot_schema(policy)
+        self.table = model._meta.db_table
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: {self.schema}.{self.table}>"
+
+    def qualified_name(self, connection) -> str:
+        quote_name = connection.ops.quote_name
+        return f"{quote_name(self.schema)}.{quote_name(self.table)}"
+
+    def select_sql(self, connection) -> str:
+        """Return the query selecting the masked rows of the table."""
+        quote_name = connection.ops.quote_name
+        labels = get_column_labels(self.model, self.policy)
+        columns = []
+        for field in self.model._meta.concrete_fields:
+            column = quote_name(field.column)
+            label = labels.get(field.name)
+            expression = label.masking_expression if label is not None else None
+            if expression is None:
+                columns.append(column)
+            else:
+                columns.append(
+                    f"CAST({expression} AS {field.db_type(connection)}) AS {column}"
+                )
+        table = quote_name(self.table)
+        for label in get_table_labels(self.model, self.policy):
+            if label.tablesample is not None:
+                table += f" TABLESAMPLE {label.tablesample}"
+                break
+        return f"SELECT {', '.join(columns)} FROM {table}"
+
+    def exists(self, using=DEFAULT_DB_ALIAS) -> bool:
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_matviews WHERE schemaname = %s AND matviewname = %s",
+                [self.schema, self.table],
+            )
+            return cursor.fetchone() is not None
+
+    def create(self, using=DEFAULT_DB_ALIAS, roles=None):
+        """Create and populate the snapshot.
+
+        Args:
+            using: The database alias.
+            roles: The roles allowed to read the snapshot. Defaults to the
+                roles labeled ``MASKED`` for the policy.
+        """
+        connection = connections[using]
+        quote_name = connection.ops.quote_name
+        name = self.qualified_name(connection)
+        pk_column = quote_name(self.model._meta.pk.column)
+        if roles is None:
+            roles = policy_roles(self.policy, using=using)
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {quote_name(self.schema)}")
+            cursor.execute(
+                f"CREATE MATERIALIZED VIEW {name} AS {self.select_sql(connection)}"
+            )
+            cursor.execute(f"CREATE UNIQUE INDEX ON {name} ({pk_column})")
+            for role in roles:
+                cursor.execute(
+                    f"GRANT USAGE ON SCHEMA {quote_name(self.schema)} "
+                    f"TO {quote_name(role)}"
+                )
+                cursor.execute(f"GRANT SELECT ON {name} TO {quote_name(role)}")
+
+    def refresh(self, using=DEFAULT_DB_ALIAS, concurrently: bool = True):
+        """Recompute the masked rows.
+
+        Args:
+            using: The database alias.
+            concurrently: Keep the snapshot readable during the refresh.
+                PostgreSQL compares the old and new rows and only writes
+                the ones that changed, which is slower for a snapshot
+                whose masks return random values on every call.
+        """
+        connection = connections[using]
+        concurrently_sql = " CONCURRENTLY" if concurrently else ""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"REFRESH MATERIALIZED VIEW{concurrently_sql} "
+                f"{self.qualified_name(connection)}"
+            )
+
+    def drop(self, using=DEFAULT_DB_ALIAS):
+        connection = connections[using]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DROP MATERIALIZED VIEW IF EXISTS {self.qualified_name(connection)}"
+            )
+
+
+def get_snapshots(policies=None, models=None) -> list[MaskedSnapshot]:
+    """Return a snapshot for each model and policy it has masked columns for.
+
+    Args:
+        policies: The masking policies. Defaults to every policy used by a
+            label.
+        models: The models. Defaults to every installed model.
+    """
+    if models is None:
+        models = apps.get_models()
+    snapshots = []
+    for model in models:
+        model_policies = {
+            index.provider
+            for index in model._meta.indexes
+            if isinstance(index, ColumnSecurityLabel)
+            and index.masking_expression is not None
+        }
+        if policies is not None:
+            model_policies &= set(policies)
+        snapshots.extend(
+            MaskedSnapshot(model, policy) for policy in sorted(model_policies)
+        )
+    return snapshots
+
+
+def refresh_snapshots(
+    policies=None,
+    models=None,
+    using=DEFAULT_DB_ALIAS,
+    concurrently: bool = True,
+    rebuild: bool = False,
+    progress=None,
+) -> list[tuple[MaskedSnapshot, bool]]:
+    """Create missing snapshots and refresh the others.
+
+    Args:
+        policies: See [get_snapshots][django_security_label.snapshots.get_snapshots].
+        models: See [get_snapshots][django_security_label.snapshots.get_snapshots].
+        using: The database alias.
+        concurrently: See
+            [MaskedSnapshot.refresh][django_security_label.snapshots.MaskedSnapshot.refresh].
+        rebuild: Drop and create existing snapshots, which is needed after
+            a labeled table's columns or labels change.
+        progress: Called with each snapshot, ``True`` if it was created,
+            and the seconds it took.
+
+    Returns:
+        Each snapshot, with ``True`` if it was created.
+    """
+    results = []
+    for snapshot in get_snapshots(policies, models):
+        start = time.perf_counter()
+        if rebuild:
+            snapshot.drop(using=using)
+        created = not snapshot.exists(using=using)
+        if created:
+            snapshot.create(using=using)
+        else:
+            snapshot.refresh(using=using, concurrently=concurrently)
+        results.append((snapshot, created))
+        if progress is not None:
+            progress(snapshot, created, time.perf_counter() - start)
+    return results
+
+
+def drop_snapshots(
+    policies=None, models=None, using=DEFAULT_DB_ALIAS, progress=None
+) -> list[MaskedSnapshot]:
+    """Drop the snapshots, if they exist.
+
+    Args:
+        policies: See [get_snapshots][django_security_label.snapshots.get_snapshots].
+        models: See [get_snapshots][django_security_label.snapshots.get_snapshots].
+        using: The database alias.
+        progress: Called with each snapshot and the seconds it took.
+
+    Returns:
+        The snapshots.
+    """
+    snapshots = get_snapshots(policies, models)
+    for snapshot in snapshots:
+        start = time.perf_counter()
+        snapshot.drop(using=using)
+        if progress is not None:
+            progress(snapshot, time.perf_counter() - start)
+    return snapshots
@@ -0,0 +1,310 @@
+"""Irreversibly replace labeled columns with their masked values.
+
+Static masking rewrites the stored data, so even the owner role only reads
+masked values afterwards. It's meant for staging copies of a database,
+never for the database the application writes to.
+
+Unlike ``anon.anonymize_database()``, which updates every table in one
+long transaction,
+[anonymize_static][django_security_label.static_masking.anonymize_static]
+splits each labeled table into primary key ranges and updates them in
+short transactions, several at once on connections of their own. Each
+committed range is recorded in the ``dsl_static_masking`` table, created by
+the app's migrations, in the same transaction, so an interrupted run
+resumes with the ranges that are left. Once every range of a table is
+committed its records are deleted, so the next run updates the whole table
+again. The ``anonymize_static`` management command wraps it.
+"""
+
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from django_security_label.labels import get_column_labels
+from django_security_label.ranges import KeyRange, close_worker_connections, split_table
+
+CHECKPOINT_TABLE = "dsl_static_masking"
+
+
+def _masked_columns(model, policy, connection):
+    """Return the ``SET`` assignments of ``model``'s columns labeled for ``policy``."""
+    quote_name = connection.ops.quote_name
+    assignments = []
+    for name, label in get_column_labels(model, policy).items():
+        expression = label.masking_expression
+        if expression is None:
+            continue
+        field = model._meta.get_field(name)
+        if field.primary_key:
+            raise ValueError(
+                f"Can't statically mask the primary key of {model._meta.label}, "
+                "it's used to track progress."
+            )
+        # The UPDATE has parameters, so a literal % must be escaped.
+        expression = expression.replace("%", "%%")
+        assignments.append(
+            f"{quote_name(field.column)} = "
+            f"CAST({expression} AS {field.db_type(connection)})"
+        )
+    return assignments
+
+
+def get_static_models(policy: str = "anon", models=None):
+    """Return the models with columns masked for ``policy``.
+
+    Args:
+        policy: The masking policy, the labels' ``provider``.
+        models: The models to look through. Defaults to every installed model.
+    """
+    if models is None:
+        models = apps.get_models()
+    return [
+        model
+        for model in models
+        if any(
+            label.masking_expression is not None
+            for label in get_column_labels(model, policy).values()
+        )
+    ]
+
+
+class StaticAnonymizer:
+    """Masks the stored values of labeled tables in checkpointed batches.
+
+    Args:
+        using: The database alias to anonymize.
+        policy: The masking policy whose labels are applied, the labels'
+            ``provider``.
+        workers: The number of batches updated at once.
+        batch_size: The number of rows updated and committed at once.
+            Tables are split into primary key ranges of this size when
+            they're first anonymized, and the ranges are kept until the
+            table is done, for resumed runs.
+        progress: Called with the model, the number of its batches done,
+            its number of batches, the rows updated so far and the seconds
+            spent updating them, each time a batch is committed.
+    """
+
+    def __init__(
+        self,
+        using: str = DEFAULT_DB_ALIAS,
+        policy: str = "anon",
+        workers: int = 4,
+        batch_size: int = 10_000,
+        progress=None,
+    ):
+        self.using = using
+        self.policy = policy
+        self.workers = workers
+        self.batch_size = batch_size
+        self.progress = progress
+        self.assignments = {}
+
+    def anonymize(self, models) -> dict:
+        """Mask ``models``' tables and return the rows updated in each.
+
+        Batches committed by an interrupted run aren't updated again. Once
+        every batch of a table is committed, its checkpoints are deleted.
+        """
+        connection = connections[self.using]
+        # Check every table's labels before updating any of them.
+        self.assignments = {
+            model: _masked_columns(model, self.policy, connection) for model in models
+        }
+        models = [model for model in models if self.assignments[model]]
+        self.check_checkpoint_table()
+        batches = {model: self._pending_batches(model) for model in models}
+        totals = {model: self._batch_count(model) for model in models}
+        done = {model: totals[model] - len(batches[model]) for model in models}
+        rows = dict.fromkeys(models, 0)
+        durations = dict.fromkeys(models, 0.0)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(self._update_batch, number, key_range): model
+                for model, model_batches in batches.items()
+                for number, key_range in model_batches
+            }
+            for future in as_completed(futures):
+                model = futures[future]
+                batch_rows, duration = future.result()
+                rows[model] += batch_rows
+                durations[model] += duration
+                done[model] += 1
+                if self.progress is not None:
+                    self.progress(
+                        model, done[model], totals[model], rows[model], durations[model]
+                    )
+        self._clear_done(models)
+        return rows
+
+    def check_checkpoint_table(self):
+        """Raise ``ValueError`` if the database lacks the checkpoint table.
+
+        The ``django_security_label`` migrations create it.
+        """
+        with connections[self.using].cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s)", [CHECKPOINT_TABLE])
+            if cursor.fetchone()[0] is None:
+                raise ValueError(
+                    f"Run the django_security_label migrations on '{self.using}' "
+                    f"first, to create the {CHECKPOINT_TABLE} table."
+                )
+
+    def reset(self, models=None):
+        """Forget the batches of ``models``, or of every table, for the policy.
+
+        The next run splits the tables again and updates every row.
+        """
+        connection = connections[self.using]
+        sql = (
+            f"DELETE FROM {connection.ops.quote_name(CHECKPOINT_TABLE)} "
+            "WHERE policy = %s"
+        )
+        params = [self.policy]
+        if models is not None:
+            sql += " AND table_name = ANY(%s)"
+            params.append([model._meta.db_table for model in models])
+        self.check_checkpoint_table()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def _clear_done(self, models):
+        """Delete the checkpoints of ``models`` whose batches are all done."""
+        connection = connections[self.using]
+        checkpoints = connection.ops.quote_name(CHECKPOINT_TABLE)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {checkpoints} WHERE policy = %s "
+                "AND table_name = ANY(%s) AND table_name NOT IN ("
+                f"SELECT table_name FROM {checkpoints} "
+                "WHERE policy = %s AND done_at IS NULL)",
+                [
+                    self.policy,
+                    [model._meta.db_table for model in models],
+                    self.policy,
+                ],
+            )
+
+    def _batch_count(self, model):
+        connection = connections[self.using]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT count(*) FROM {connection.ops.quote_name(CHECKPOINT_TABLE)} "
+                "WHERE policy = %s AND table_name = %s",
+                [self.policy, model._meta.db_table],
+            )
+            return cursor.fetchone()[0]
+
+    def _pending_batches(self, model):
+        """Return the batches of ``model`` left to update, splitting it if new."""
+        connection = connections[self.using]
+        checkpoints = connection.ops.quote_name(CHECKPOINT_TABLE)
+        with transaction.atomic(using=self.using), connection.cursor() as cursor:
+            # Only one run splits the table.
+            cursor.execute(
+                "SELECT pg_advisory_xact_lock(hashtext(%s))",
+                [f"{CHECKPOINT_TABLE}.{self.policy}.{model._meta.db_table}"],
+            )
+            if not self._batch_count(model):
+                cursor.executemany(
+                    f"INSERT INTO {checkpoints} "
+                    "(policy, table_name, batch, start_pk, end_pk) "
+                    # The bounds are kept as text, whatever the key's type.
+                    "VALUES (%s, %s, %s, CAST(%s AS text), CAST(%s AS text))",
+                    [
+                        (
+                            self.policy,
+                            model._meta.db_table,
+                            number,
+                            key_range.start,
+                            key_range.end,
+                        )
+                        for number, key_range in enumerate(
+                            split_table(model, self.batch_size, using=self.using)
+                        )
+                    ],
+                )
+            cursor.execute(
+                f"SELECT batch, start_pk, end_pk FROM {checkpoints} "
+                "WHERE policy = %s AND table_name = %s AND done_at IS NULL "
+                "ORDER BY batch",
+                [self.policy, model._meta.db_table],
+            )
+            return [
+                (number, KeyRange(model, start, end))
+                for number, start, end in cursor.fetchall()
+            ]
+
+    def _update_batch(self, number, key_range):
+        """Update one batch and return its rows and the seconds it took."""
+        start = time.perf_counter()
+        connection = connections[self.using]
+        model = key_range.model
+        where, params = key_range.where_sql(connection)
+        assignments = ", ".join(self.assignments[model])
+        try:
+            with transaction.atomic(using=self.using), connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {connection.ops.quote_name(model._meta.db_table)} "
+                    f"SET {assignments}{where}",
+                    params,
+                )
+                rows = cursor.rowcount
+                cursor.execute(
+                    f"UPDATE {connection.ops.quote_name(CHECKPOINT_TABLE)} "
+                    "SET row_count = %s, done_at = now() "
+                    "WHERE policy = %s AND table_name = %s AND batch = %s",
+                    [rows, self.policy, model._meta.db_table, number],
+                )
+            return rows, time.perf_counter() - start
+        finally:
+            close_worker_connections(self.using)
+
+
+def anonymize_static(
+    using: str = DEFAULT_DB_ALIAS,
+    policy: str = "anon",
+    models=None,
+    workers: int = 4,
+    batch_size: int = 10_000,
+    reset: bool = False,
+    progress=None,
+) -> dict:
+    """Replace the values of labeled columns with their masked values.
+
+    Each column labeled ``MASKED WITH FUNCTION`` or ``MASKED WITH VALUE``
+    for ``policy`` is set to its masking expression. This can't be undone.
+
+    Args:
+        using: The database alias to anonymize.
+        policy: The masking policy whose labels are applied.
+        models: The models to anonymize. Defaults to
+            [get_static_models][django_security_label.static_masking.get_static_models].
+        workers: See
+            [StaticAnonymizer][django_security_label.static_masking.StaticAnonymizer].
+        batch_size: See
+            [StaticAnonymizer][django_security_label.static_masking.StaticAnonymizer].
+        reset: Forget the progress of an interrupted run and update every
+            row again.
+        progress: See
+            [StaticAnonymizer][django_security_label.static_masking.StaticAnonymizer].
+
+    Returns:
+        The number of rows updated, by model.
+    """
+    if models is None:
+        models = get_static_models(policy)
+    anonymizer = StaticAnonymizer(
+        using=using,
+        policy=policy,
+        workers=workers,
+        batch_size=batch_size,
+        progress=progress,
+    )
+    if reset:
+        anonymizer.reset(models)
+    return anonymizer.anonymize(models)
@@ -0,0 +1,137 @@
+"""Measure the cost of switching PostgreSQL roles.
+
+The masking middleware attaches a
+[RequestRoleStats][django_security_label.stats.RequestRoleStats] to each
+masked request as ``request.security_label_stats``, counting the role
+switches and resets sent while handling it.
+
+[RoleSwitchAggregator][django_security_label.stats.RoleSwitchAggregator]
+receives the [signals][django_security_label.signals] and keeps counts and
+latency percentiles per policy for the whole process. Set
+``SECURITY_LABEL_ROLE_SWITCH_STATS = True`` to connect the default one,
+available from
+[get_role_switch_aggregator][django_security_label.stats.get_role_switch_aggregator].
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+from collections import defaultdict, deque
+from contextvars import ContextVar
+
+from django_security_label.signals import role_reset, role_switched
+
+
+class RequestRoleStats:
+    """The role switches of one request.
+
+    Attributes:
+        policy: The request's masking policy.
+        switches: The number of ``SET ROLE`` statements sent.
+        resets: The number of ``RESET ROLE`` statements sent.
+        duration: The total seconds spent sending them.
+    """
+
+    def __init__(self, policy: str | None = None):
+        self.policy = policy
+        self.switches = 0
+        self.resets = 0
+        self.duration = 0.0
+
+    def __repr__(self):
+        return (
+            f"<{self.__class__.__name__} policy={self.policy!r} "
+            f"switches={self.switches} resets={self.resets} "
+            f"duration={self.duration:.6f}>"
+        )
+
+    def record(self, role: str | None, duration: float):
+        if role is None:
+            self.resets += 1
+        else:
+            self.switches += 1
+        self.duration += duration
+
+
+_request_stats: ContextVar[RequestRoleStats | None] = ContextVar(
+    "django_security_label_request_stats", default=None
+)
+
+
+def get_request_stats() -> RequestRoleStats | None:
+    """Return the stats of the masked request being processed, if any."""
+    return _request_stats.get()
+
+
+def _percentile(sorted_values, percent):
+    # Nearest-rank method.
+    index = max(math.ceil(percent / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[index]
+
+
+class RoleSwitchAggregator:
+    """Process-wide counts and latencies of role switches per policy.
+
+    Percentiles are computed over the most recent ``sample_size`` statements
+    of each policy and kind, so memory use stays constant.
+
+    Args:
+        sample_size: The number of durations kept per policy and kind.
+    """
+
+    def __init__(self, sample_size: int = 1000):
+        self.sample_size = sample_size
+        self._lock = threading.Lock()
+        self._counts = defaultdict(int)
+        self._samples = defaultdict(lambda: deque(maxlen=self.sample_size))
+
+    def connect(self):
+        """Start receiving the role switch signals."""
+        role_switched.connect(self._switched, dispatch_uid=id(self))
+        role_reset.connect(self._reset, dispatch_uid=id(self))
+
+    def disconnect(self):
+        """Stop receiving the role switch signals."""
+        role_switched.disconnect(dispatch_uid=id(self))
+        role_reset.disconnect(dispatch_uid=id(self))
+
+    def _switched(self, policy, duration, **kwargs):
+        self.record(policy, "switch", duration)
+
+    def _reset(self, policy, duration, **kwargs):
+        self.record(policy, "reset", duration)
+
+    def record(self, policy: str | None, kind: str, duration: float):
+        """Record a statement of ``kind``, ``"switch"`` or ``"reset"``."""
+        with self._lock:
+            self._counts[policy, kind] += 1
+            self._samples[policy, kind].append(duration)
+
+    def summary(self) -> dict:
+        """Return ``{policy: {kind: {"count", "p50", "p99"}}}`` in seconds."""
+        with self._lock:
+            samples = {key: sorted(values) for key, values in self._samples.items()}
+            counts = dict(self._counts)
+        summary = defaultdict(dict)
+        for (policy, kind), values in samples.items():
+            summary[policy][kind] = {
+                "count": counts[policy, kind],
+                "p50": _percentile(values, 50),
+                "p99": _percentile(values, 99),
+            }
+        return dict(summary)
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        with self._lock:
+            self._counts.clear()
+            self._samples.clear()
+
+
+_aggregator = RoleSwitchAggregator()
+
+
+def get_role_switch_aggregator() -> RoleSwitchAggregator:
+    """Return the aggregator connected by ``SECURITY_LABEL_ROLE_SWITCH_STATS``."""
+    return _aggregator
@@ -0,0 +1,103 @@
+"""Find the database tables that masking applies to.
+
+Only tables with a column labeled by a
+[ColumnSecurityLabel][django_security_label.labels.ColumnSecurityLabel] in a
+model's ``Meta.indexes``, or labeled by a
+[TableSecurityLabel][django_security_label.labels.TableSecurityLabel] in its
+``Meta.constraints``, return masked data.
+[get_labeled_tables][django_security_label.tables.get_labeled_tables]
+collects them from the installed models, so the middleware can skip the role
+switch for statements that don't reference any of them. See
+``SECURITY_LABEL_LABELED_TABLES_ONLY`` in
+[BaseMaskingMiddleware][django_security_label.middleware.BaseMaskingMiddleware].
+"""
+
+from __future__ import annotations
+
+import re
+
+from django.apps import apps
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from django_security_label.labels import ColumnSecurityLabel, TableSecurityLabel
+
+
+class LabeledTables:
+    """A set of labeled table names, matched against SQL statements.
+
+    Args:
+        tables: The table names.
+    """
+
+    def __init__(self, tables):
+        self.tables = frozenset(tables)
+        self._pattern = None
+        if self.tables:
+            # Longest first, so a table isn't matched by a prefix of its name.
+            names = sorted(self.tables, key=len, reverse=True)
+            self._pattern = re.compile(
+                rf"\b(?:{'|'.join(map(re.escape, names))})\b", re.IGNORECASE
+            )
+
+    def __contains__(self, table):
+        return table in self.tables
+
+    def referenced_by(self, sql) -> bool:
+        """Return ``True`` if ``sql`` may reference one of the tables.
+
+        The table names are matched as words, quoted or not, so the result
+        errs on the side of ``True``. SQL that isn't a string, such as a
+        psycopg ``sql.Composed`` object, is assumed to reference them.
+        """
+        if self._pattern is None:
+            return False
+        if not isinstance(sql, str):
+            return True
+        return self._pattern.search(sql) is not None
+
+
+def collect_labeled_tables(models=None) -> set[str]:
+    """Return the ``db_table`` of each model with a security labeled column or table.
+
+    Args:
+        models: The models to look through. Defaults to every installed model.
+    """
+    if models is None:
+        models = apps.get_models()
+    return {
+        model._meta.db_table
+        for model in models
+        if any(isinstance(index, ColumnSecurityLabel) for index in model._meta.indexes)
+        or any(
+            isinstance(constraint, TableSecurityLabel)
+            for constraint in model._meta.constraints
+        )
+    }
+
+
+_labeled_tables: LabeledTables | None = None
+
+
+def get_labeled_tables() -> LabeledTables:
+    """Return the labeled tables of the installed models.
+
+    Tables listed in ``settings.SECURITY_LABEL_LABELED_TABLES`` are added,
+    for tables that are masked but aren't labeled through a model, or that
+    are only read through database views or functions.
+    """
+    global _labeled_tables
+    if _labeled_tables is None:
+        _labeled_tables = LabeledTables(
+            collect_labeled_tables()
+            | set(getattr(settings, "SECURITY_LABEL_LABELED_TABLES", ()))
+        )
+    return _labeled_tables
+
+
+@receiver(setting_changed, dispatch_uid="django_security_label.reset_labeled_tables")
+def _reset_labeled_tables(setting, **kwargs):
+    global _labeled_tables
+    if setting in {"SECURITY_LABEL_LABELED_TABLES", "INSTALLED_APPS"}:
+        _labeled_tables = None
@@ -16,6 +16,23 @@ DATABASES = {
         "PORT": os.environ.get("DB_PORT", "6432"),
     },
 }
+# A second alias on the same database, for testing masking across aliases.
+DATABASES["replica"] = {**DATABASES["default"], "TEST": {"MIRROR": "default"}}
+# An alias that connects as the masked reader role.
+DATABASES["masked"] = {
+    **DATABASES["default"],
+    "OPTIONS": {"options": "-c role=dsl_masked_reader"},
+    "TEST": {"MIRROR": "default"},
+}
+# An alias on the same database that keeps its tables in another schema, for
+# testing copies between aliases. The tests create and drop the schema.
+DATABASES["clone"] = {
+    **DATABASES["default"],
+    "OPTIONS": {"options": "-c search_path=dsl_clone"},
+    "TEST": {"MIRROR": "default"},
+}
+
+ROOT_URLCONF = "tests.urls"
 
 TIME_ZONE = "UTC"
 
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import threading
+import uuid
+from unittest import mock
+
+from django.contrib.auth.models import Group, Permission, User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import CommandError
+from django.db import DatabaseError, connection, connections
+from django.test import SimpleTestCase
+
+from django_security_label.cloning import (
+    MaskedCloner,
+    clone_masked,
+    dependency_levels,
+    get_cloned_models,
+)
+from tests.testapp.models import MaskedColumn
+from tests.utils import (
+    AnonTransactionTestCase,
+    create_masked_column,
+    create_masked_columns,
+    run_command,
+)
+
+
+class TestGetClonedModels(SimpleTestCase):
+    def test_app_label(self):
+        self.assertEqual(get_cloned_models(["testapp"]), [MaskedColumn])
+
+    def test_model_includes_many_to_many_tables(self):
+        self.assertEqual(
+            set(get_cloned_models(["auth.User"])),
+            {User, User.groups.through, User.user_permissions.through},
+        )
+
+    def test_exclude(self):
+        models = get_cloned_models(exclude=["auth", "contenttypes"])
+
+        self.assertEqual(models, [MaskedColumn])
+
+
+class TestDependencyLevels(SimpleTestCase):
+    def test_referenced_models_first(self):
+        levels, cyclic = dependency_levels(
+            [Group.permissions.through, Permission, Group, ContentType]
+        )
+
+        self.assertEqual(
+            levels,
+            [[Group, ContentType], [Permission], [Group.permissions.through]],
+        )
+        self.assertEqual(cyclic, [])
+
+    def test_missing_models_are_ignored(self):
+        levels, cyclic = dependency_levels([Permission])
+
+        self.assertEqual(levels, [[Permission]])
+
+
+class CloneTestCase(AnonTransactionTestCase):
+    databases = {"default", "clone"}
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE SCHEMA dsl_clone")
+        self.addCleanup(self.drop_schema)
+        with connections["clone"].schema_editor() as schema_editor:
+            schema_editor.create_model(ContentType)
+            schema_editor.create_model(MaskedColumn)
+        self.records = create_masked_columns(3)
+
+    def drop_schema(self):
+        connections["clone"].close()
+        with connection.cursor() as cursor:
+            cursor.execute("DROP SCHEMA dsl_clone CASCADE")
+
+
+class TestCloneMasked(CloneTestCase):
+    def test_labeled_table_is_masked(self):
+        rows = clone_masked("clone", models=[MaskedColumn], chunk_size=2)
+
+        self.assertEqual(rows, {MaskedColumn: 3})
+        clones = list(MaskedColumn.objects.using("clone").order_by("pk"))
+        self.assertEqual(
+            [clone.pk for clone in clones], [record.pk for record in self.records]
+        )
+        for clone in clones:
+            self.assertNotEqual(clone.text, "secret_text_value")
+            self.assertEqual(clone.confidential, "CONFIDENTIAL")
+        self.assertEqual(
+            [clone.safe_text for clone in clones],
+            ["safe_text_value_0", "safe_text_value_1", "safe_text_value_2"],
+        )
+
+    def test_policy(self):
+        clone_masked("clone", policy="analysts_reader", models=[MaskedColumn])
+
+        clone = MaskedColumn.objects.using("clone").first()
+        self.assertEqual(clone.text, "secret_text_value")
+        self.assertEqual(clone.uuid, uuid.UUID(int=0))
+
+    def test_unlabeled_table_is_copied(self):
+        ContentType.objects.get_for_model(MaskedColumn)
+
+        clone_masked("clone", models=[ContentType], workers=1)
+
+        self.assertEqual(
+            list(ContentType.objects.using("clone").values_list("app_label", "model")),
+            list(ContentType.objects.values_list("app_label", "model")),
+        )
+
+    def test_sequences_are_reset(self):
+        clone_masked("clone", models=[MaskedColumn])
+
+        record = MaskedColumn.objects.using("clone").create(
+            text="",
+            uuid=uuid.uuid4(),
+            safe_text="",
+            safe_uuid=uuid.uuid4(),
+            confidential="",
+            random_int=0,
+        )
+
+        self.assertGreater(record.pk, self.records[-1].pk)
+
+    def test_truncate(self):
+        clone_masked("clone", models=[MaskedColumn])
+
+        clone_masked("clone", models=[MaskedColumn], truncate=True)
+
+        self.assertEqual(MaskedColumn.objects.using("clone").count(), 3)
+
+    def test_truncate_keeps_referencing_tables(self):
+        with connections["clone"].schema_editor() as schema_editor:
+            schema_editor.create_model(Permission)
+
+        with self.assertRaises(DatabaseError):
+            clone_masked("clone", models=[ContentType], truncate=True)
+
+    def test_reads_one_snapshot(self):
+        chunks = MaskedCloner._chunks
+
+        def insert_after_chunking(cloner, model):
+            result = chunks(cloner, model)
+            # Committed on another connection while the copy runs.
+            thread = threading.Thread(target=self.insert_record)
+            thread.start()
+            thread.join()
+            return result
+
+        with mock.patch.object(
+            MaskedCloner, "_chunks", autospec=True, side_effect=insert_after_chunking
+        ):
+            rows = clone_masked("clone", models=[MaskedColumn], chunk_size=2)
+
+        self.assertEqual(rows, {MaskedColumn: 3})
+        self.assertEqual(MaskedColumn.objects.count(), 4)
+        self.assertEqual(MaskedColumn.objects.using("clone").count(), 3)
+
+    def insert_record(self):
+        try:
+            create_masked_column(safe_text="inserted during the copy")
+        finally:
+            connection.close()
+
+
+class TestCloneMaskedCommand(CloneTestCase):
+    def test_command(self):
+        out, err, returncode = run_command(
+            "clone_masked", "clone", "testapp", "--chunk-size", "2"
+        )
+
+        self.assertEqual(returncode, 0)
+        self.assertIn("Copied 3 rows of testapp_maskedcolumn", out)
+        self.assertIn("Copied 3 rows of 1 tables into 'clone'.", out)
+        self.assertEqual(MaskedColumn.objects.using("clone").count(), 3)
+
+    def test_same_database(self):
+        with self.assertRaisesMessage(
+            CommandError, "The target must differ from the source database."
+        ):
+            run_command("clone_masked", "default")
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+from django.test import SimpleTestCase
+
+from django_security_label.databases import (
+    policy_alias,
+    policy_database,
+    policy_databases,
+)
+
+DEFAULT = {
+    "ENGINE": "django.db.backends.postgresql",
+    "NAME": "app",
+    "USER": "app",
+    "OPTIONS": {"options": "-c statement_timeout=5000"},
+}
+
+
+class TestPolicyDatabase(SimpleTestCase):
+    def test_role_option(self):
+        settings_dict = policy_database({"NAME": "app"}, "analyst", pool=None)
+
+        self.assertEqual(
+            settings_dict, {"NAME": "app", "OPTIONS": {"options": "-c role=analyst"}}
+        )
+
+    def test_keeps_options(self):
+        settings_dict = policy_database(DEFAULT, "analyst")
+
+        self.assertEqual(
+            settings_dict["OPTIONS"],
+            {"options": "-c statement_timeout=5000 -c role=analyst", "pool": True},
+        )
+        self.assertEqual(DEFAULT["OPTIONS"], {"options": "-c statement_timeout=5000"})
+
+    def test_escapes_role(self):
+        settings_dict = policy_database({}, "masked reader", pool=None)
+
+        self.assertEqual(settings_dict["OPTIONS"]["options"], "-c role=masked\\ reader")
+
+    def test_snapshots_search_path(self):
+        settings_dict = policy_database({}, "analyst", pool=None, snapshots=True)
+
+        self.assertEqual(
+            settings_dict["OPTIONS"]["options"],
+            "-c role=analyst -c search_path=masked_analyst,public",
+        )
+
+    def test_snapshots_of_default_masked_reader(self):
+        settings_dict = policy_database(
+            {}, "dsl_masked_reader", pool=None, snapshots=True
+        )
+
+        self.assertEqual(
+            settings_dict["OPTIONS"]["options"],
+            "-c role=dsl_masked_reader -c search_path=masked_anon,public",
+        )
+
+    def test_snapshots_provider(self):
+        settings_dict = policy_database(
+            {}, "analysts_reader", pool=None, snapshots=True, provider="analysts"
+        )
+
+        self.assertEqual(
+            settings_dict["OPTIONS"]["options"],
+            "-c role=analysts_reader -c search_path=masked_analysts,public",
+        )
+
+
+class TestPolicyDatabases(SimpleTestCase):
+    def test_adds_alias_per_policy(self):
+        databases = {"default": DEFAULT}
+
+        aliases = policy_databases(
+            databases, {"analyst": {"max_size": 10}, "dsl_masked_reader": True}
+        )
+
+        self.assertEqual(
+            aliases,
+            {
+                "analyst": "default__analyst",
+                "dsl_masked_reader": "default__dsl_masked_reader",
+            },
+        )
+        self.assertEqual(
+            databases["default__analyst"]["OPTIONS"]["pool"], {"max_size": 10}
+        )
+        self.assertEqual(databases["default__analyst"]["TEST"], {"MIRROR": "default"})
+        self.assertEqual(databases["default__dsl_masked_reader"]["USER"], "app")
+
+    def test_using(self):
+        databases = {"default": DEFAULT, "shard": DEFAULT}
+
+        aliases = policy_databases(databases, {"analyst": True}, using="shard")
+
+        self.assertEqual(aliases, {"analyst": policy_alias("analyst", "shard")})
+        self.assertEqual(databases["shard__analyst"]["TEST"], {"MIRROR": "shard"})
+
+    def test_snapshots_providers(self):
+        databases = {"default": {}}
+
+        policy_databases(
+            databases,
+            {"dsl_masked_reader": None, "analysts_reader": None},
+            snapshots=True,
+            providers={"analysts_reader": "analysts"},
+        )
+
+        self.assertEqual(
+            databases["default__dsl_masked_reader"]["OPTIONS"]["options"],
+            "-c role=dsl_masked_reader -c search_path=masked_anon,public",
+        )
+        self.assertEqual(
+            databases["default__analysts_reader"]["OPTIONS"]["options"],
+            "-c role=analysts_reader -c search_path=masked_analysts,public",
+        )
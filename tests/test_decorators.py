@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+from unittest import mock
+
+from asgiref.sync import iscoroutinefunction
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from django_security_label import constants, decorators
+from django_security_label.decorators import masking_exempt, masking_policy
+from django_security_label.middleware import _UNDECIDED, GroupMaskingMiddleware
+from tests.utils import AnonTransactionTestCase, create_masked_column
+
+
+class TestDecorators(SimpleTestCase):
+    def test_masking_exempt(self):
+        def view(request):
+            return "response"
+
+        decorated = masking_exempt(view)
+
+        self.assertTrue(decorated.masking_exempt)
+        self.assertFalse(hasattr(view, "masking_exempt"))
+        self.assertEqual(decorated(None), "response")
+
+    def test_masking_policy(self):
+        decorated = masking_policy("analysts_reader")(lambda request: None)
+
+        self.assertEqual(decorated.masking_policy, "analysts_reader")
+
+    def test_masking_policy_none(self):
+        decorated = masking_policy(None)(lambda request: None)
+
+        self.assertTrue(decorated.masking_exempt)
+
+    def test_async_view(self):
+        async def view(request):
+            return "response"
+
+        self.assertTrue(iscoroutinefunction(masking_exempt(view)))
+        self.assertTrue(iscoroutinefunction(masking_policy("policy")(view)))
+
+
+@override_settings(
+    MIDDLEWARE=["django_security_label.middleware.MaskedReadsMiddleware"]
+)
+class TestDecoratedViews(AnonTransactionTestCase):
+    def setUp(self):
+        create_masked_column()
+
+    def test_undecorated_view_masked(self):
+        response = self.client.get("/read/")
+
+        self.assertEqual(response.content.split()[0], b"CONFIDENTIAL")
+
+    def test_masking_exempt(self):
+        response = self.client.get("/exempt/")
+
+        self.assertEqual(
+            response.content.decode(),
+            "hunter2 12345678-1234-5678-1234-567812345678",
+        )
+
+    def test_masking_policy(self):
+        response = self.client.get("/analysts/")
+
+        self.assertEqual(
+            response.content.decode(),
+            "hunter2 00000000-0000-0000-0000-000000000000",
+        )
+
+
+class TestViewDecisionCache(SimpleTestCase):
+    request_factory = RequestFactory()
+
+    def test_exempt_view_skips_policy_lookup(self):
+        middleware = GroupMaskingMiddleware(lambda request: "response")
+        request = self.request_factory.get("/exempt/")
+        request.user = mock.Mock(is_superuser=False)
+
+        with mock.patch.object(middleware, "get_role") as get_role:
+            self.assertEqual(middleware(request), "response")
+
+        get_role.assert_not_called()
+
+    def test_cached_per_view(self):
+        middleware = GroupMaskingMiddleware(lambda request: "response")
+
+        middleware._get_view_role(self.request_factory.get("/analysts/"))
+        middleware._get_view_role(self.request_factory.get("/exempt/"))
+
+        self.assertEqual(
+            sorted(middleware._view_roles.values(), key=str),
+            [None, "analysts_reader"],
+        )
+
+    def test_unresolved_path(self):
+        middleware = GroupMaskingMiddleware(lambda request: "response")
+
+        with (
+            mock.patch.object(
+                middleware, "get_role", return_value=constants.MASKED_READER_ROLE
+            ) as get_role,
+            mock.patch.object(middleware, "role_scope") as role_scope,
+        ):
+            middleware(self.request_factory.get("/missing/"))
+
+        get_role.assert_called_once()
+        role_scope.assert_called_once_with(constants.MASKED_READER_ROLE)
+
+    def test_no_decorated_views(self):
+        middleware = GroupMaskingMiddleware(lambda request: "response")
+
+        with (
+            mock.patch.object(decorators, "_views_decorated", False),
+            mock.patch("django.urls.resolvers.URLResolver.resolve") as resolve,
+        ):
+            role = middleware._get_view_role(self.request_factory.get("/exempt/"))
+
+        self.assertIs(role, _UNDECIDED)
+        resolve.assert_not_called()
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+from django.core.management import CommandError
+from django.test import SimpleTestCase, override_settings
+
+from django_security_label import constants
+from django_security_label.explain import (
+    MaskingComparison,
+    QueryPlan,
+    explain_masking,
+    resolve_queryset,
+)
+from django_security_label.policies import get_configured_policies
+from tests.testapp.models import MaskedColumn
+from tests.utils import AnonTransactionTestCase, run_command
+
+
+def masked_columns():
+    return MaskedColumn.objects.filter(text="secret_text_value").order_by("uuid")
+
+
+def not_a_queryset():
+    return [1, 2, 3]
+
+
+def index_scan_plan(policy=None, execution_time=1.0):
+    return QueryPlan(
+        policy,
+        {
+            "Plan": {
+                "Node Type": "Sort",
+                "Shared Hit Blocks": 4,
+                "Shared Read Blocks": 1,
+                "Actual Rows": 1,
+                "Actual Total Time": 0.5,
+                "Plans": [
+                    {
+                        "Node Type": "Index Scan",
+                        "Relation Name": "testapp_maskedcolumn",
+                        "Index Name": "text_idx",
+                        "Actual Rows": 1,
+                        "Actual Total Time": 0.25,
+                    }
+                ],
+            },
+            "Planning Time": 0.1,
+            "Execution Time": execution_time,
+        },
+    )
+
+
+def seq_scan_plan(policy, execution_time=3.0):
+    return QueryPlan(
+        policy,
+        {
+            "Plan": {
+                "Node Type": "Sort",
+                "Plans": [
+                    {"Node Type": "Seq Scan", "Relation Name": "testapp_maskedcolumn"}
+                ],
+            },
+            "Planning Time": 0.2,
+            "Execution Time": execution_time,
+        },
+    )
+
+
+class TestQueryPlan(SimpleTestCase):
+    def test_shape(self):
+        self.assertEqual(
+            index_scan_plan().shape(),
+            [
+                (0, "Sort", None, None),
+                (1, "Index Scan", "testapp_maskedcolumn", "text_idx"),
+            ],
+        )
+
+    def test_scans(self):
+        self.assertEqual(
+            index_scan_plan().scans(),
+            {
+                "testapp_maskedcolumn": [
+                    "Index Scan using text_idx on testapp_maskedcolumn"
+                ]
+            },
+        )
+
+    def test_buffers(self):
+        plan = index_scan_plan()
+
+        self.assertEqual(plan.shared_hit_blocks, 4)
+        self.assertEqual(plan.shared_read_blocks, 1)
+
+    def test_format(self):
+        self.assertEqual(
+            index_scan_plan().format(),
+            "Sort (rows=1 time=0.500 ms)\n"
+            "  -> Index Scan using text_idx on testapp_maskedcolumn "
+            "(rows=1 time=0.250 ms)",
+        )
+
+
+class TestMaskingComparison(SimpleTestCase):
+    def test_plan_changed(self):
+        masked = seq_scan_plan("analysts_reader")
+        same = index_scan_plan("dsl_masked_reader", execution_time=2.0)
+        comparison = MaskingComparison(index_scan_plan(), [masked, same])
+
+        self.assertTrue(comparison.plan_changed(masked))
+        self.assertFalse(comparison.plan_changed(same))
+        self.assertEqual(comparison.time_delta(masked), 2.0)
+        self.assertEqual(
+            comparison.scan_changes(masked),
+            [
+                "testapp_maskedcolumn: Index Scan using text_idx on "
+                "testapp_maskedcolumn -> Seq Scan on testapp_maskedcolumn"
+            ],
+        )
+        self.assertEqual(comparison.scan_changes(same), [])
+
+
+class TestGetConfiguredPolicies(SimpleTestCase):
+    def test_default(self):
+        self.assertEqual(get_configured_policies(), [constants.MASKED_READER_ROLE])
+
+    @override_settings(
+        SECURITY_LABEL_GROUPS_TO_POLICIES=[
+            ("Analysts", "analysts_reader"),
+            ("Unmasked", None),
+            ("Masked Readers", constants.MASKED_READER_ROLE),
+            ("Senior Analysts", "analysts_reader"),
+        ]
+    )
+    def test_groups(self):
+        self.assertEqual(
+            get_configured_policies(),
+            [constants.MASKED_READER_ROLE, "analysts_reader"],
+        )
+
+
+class TestResolveQueryset(SimpleTestCase):
+    def test_dotted_path(self):
+        queryset = resolve_queryset("tests.test_explain.masked_columns")
+
+        self.assertEqual(queryset.model, MaskedColumn)
+
+    def test_queryset(self):
+        queryset = MaskedColumn.objects.all()
+
+        self.assertIs(resolve_queryset(queryset), queryset)
+
+    def test_not_a_queryset(self):
+        with self.assertRaisesMessage(ValueError, "returned list, not a QuerySet."):
+            resolve_queryset("tests.test_explain.not_a_queryset")
+
+    def test_missing(self):
+        with self.assertRaisesMessage(ValueError, "Can't import 'tests.missing'"):
+            resolve_queryset("tests.missing")
+
+    def test_command_not_a_queryset(self):
+        with self.assertRaisesMessage(CommandError, "not a QuerySet"):
+            run_command("explain_masking", "tests.test_explain.not_a_queryset")
+
+
+class TestExplainMasking(AnonTransactionTestCase):
+    def test_policies(self):
+        comparison = explain_masking(
+            masked_columns(), policies=["analysts_reader", "dsl_masked_reader"]
+        )
+
+        self.assertIsNone(comparison.unmasked.policy)
+        self.assertEqual(
+            [plan.policy for plan in comparison.masked],
+            ["analysts_reader", "dsl_masked_reader"],
+        )
+        for plan in [comparison.unmasked, *comparison.masked]:
+            self.assertGreaterEqual(plan.execution_time, 0)
+            self.assertIn("testapp_maskedcolumn", plan.format())
+
+    def test_command(self):
+        out, err, returncode = run_command(
+            "explain_masking",
+            "tests.test_explain.masked_columns",
+            "--policy",
+            "analysts_reader",
+            "--repeat",
+            "1",
+            "--plans",
+        )
+
+        self.assertEqual(returncode, 0)
+        self.assertIn("Execution ms", out)
+        self.assertIn("unmasked", out)
+        self.assertIn("analysts_reader:", out)
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import csv
+import gzip
+import io
+import json
+import tempfile
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from django_security_label.exports import (
+    count_exported_rows,
+    export_masked,
+    export_queryset,
+)
+from tests.testapp.models import MaskedColumn
+from tests.utils import AnonTransactionTestCase, create_masked_columns, run_command
+
+
+class TestCountExportedRows(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def test_csv(self):
+        path = self.directory / "table.csv"
+        path.write_bytes(b'id,text\n1,"multi\nline"\n2,b\n3,partial')
+
+        self.assertEqual(count_exported_rows(path, "csv"), 2)
+        self.assertEqual(path.read_bytes(), b'id,text\n1,"multi\nline"\n2,b\n')
+
+        path.write_bytes(b'id,text\n1,a\n2,"cut\noff ""mid\nfield')
+
+        self.assertEqual(count_exported_rows(path, "csv"), 1)
+        self.assertEqual(path.read_bytes(), b"id,text\n1,a\n")
+
+    def test_jsonl(self):
+        path = self.directory / "table.jsonl"
+        path.write_bytes(b'{"id": 1}\n{"id": 2}\n{"id"')
+
+        self.assertEqual(count_exported_rows(path, "jsonl"), 2)
+        self.assertEqual(path.read_bytes(), b'{"id": 1}\n{"id": 2}\n')
+
+    def test_compressed(self):
+        path = self.directory / "table.jsonl.gz"
+
+        with self.assertRaisesMessage(ValueError, "Can't resume the compressed"):
+            count_exported_rows(path, "jsonl")
+
+    def test_duplicate_models(self):
+        with self.assertRaisesMessage(ValueError, "Export each model once"):
+            export_masked([MaskedColumn, MaskedColumn], self.directory)
+
+    def test_unknown_format(self):
+        with self.assertRaisesMessage(ValueError, "Unknown export format 'xml'"):
+            export_masked([MaskedColumn], self.directory, format="xml")
+
+
+class ExportTestCase(AnonTransactionTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.records = create_masked_columns(3)
+
+
+class TestExportQueryset(ExportTestCase):
+    def test_csv(self):
+        file = io.BytesIO()
+
+        rows = export_queryset(MaskedColumn.objects.all(), file)
+
+        self.assertEqual(rows, 3)
+        reader = csv.DictReader(io.StringIO(file.getvalue().decode()))
+        exported = list(reader)
+        self.assertEqual(
+            [row["safe_text"] for row in exported],
+            ["safe_text_value_0", "safe_text_value_1", "safe_text_value_2"],
+        )
+        for row in exported:
+            self.assertNotEqual(row["text"], "secret_text_value")
+            self.assertEqual(row["confidential"], "CONFIDENTIAL")
+
+    def test_jsonl_values(self):
+        file = io.BytesIO()
+
+        export_queryset(
+            MaskedColumn.objects.values("uuid", "safe_text").filter(
+                safe_text__endswith="_1"
+            ),
+            file,
+            format="jsonl",
+            policy="analysts_reader",
+        )
+
+        self.assertEqual(
+            [json.loads(line) for line in file.getvalue().splitlines()],
+            [
+                {
+                    "uuid": "00000000-0000-0000-0000-000000000000",
+                    "safe_text": "safe_text_value_1",
+                }
+            ],
+        )
+
+    def test_after(self):
+        file = io.BytesIO()
+
+        rows = export_queryset(
+            MaskedColumn.objects.values("safe_text"),
+            file,
+            format="csv",
+            after=self.records[1].pk,
+        )
+
+        self.assertEqual(rows, 1)
+        self.assertEqual(file.getvalue(), b"safe_text_value_2\n")
+
+    def test_after_other_order(self):
+        with self.assertRaisesMessage(ValueError, "Only exports in primary key"):
+            export_queryset(
+                MaskedColumn.objects.order_by("safe_text"),
+                io.BytesIO(),
+                after=self.records[1].pk,
+            )
+
+
+class TestExportMasked(ExportTestCase):
+    def test_gzip(self):
+        rows = export_masked(
+            [MaskedColumn.objects.values("safe_text")],
+            self.directory,
+            format="jsonl",
+            compress=True,
+        )
+
+        path = self.directory / "testapp_maskedcolumn.jsonl.gz"
+        self.assertEqual(rows, {path: 3})
+        with gzip.open(path, "rt") as file:
+            self.assertEqual(
+                [json.loads(line)["safe_text"] for line in file],
+                ["safe_text_value_0", "safe_text_value_1", "safe_text_value_2"],
+            )
+
+    def test_resume(self):
+        path = self.directory / "testapp_maskedcolumn.csv"
+        first, second, third = (record.pk for record in self.records)
+        path.write_bytes(
+            f'id,safe_text\n{first},safe_text_value_0\n{second},"safe'.encode()
+        )
+        # Rows deleted since are skipped by primary key, not by offset.
+        self.records[0].delete()
+
+        rows = export_masked(
+            [MaskedColumn.objects.values("id", "safe_text")],
+            self.directory,
+            resume=True,
+        )
+
+        self.assertEqual(rows, {path: 2})
+        self.assertEqual(
+            path.read_bytes(),
+            f"id,safe_text\n{first},safe_text_value_0\n"
+            f"{second},safe_text_value_1\n{third},safe_text_value_2\n".encode(),
+        )
+
+    def test_resume_without_pk(self):
+        path = self.directory / "testapp_maskedcolumn.csv"
+        path.write_bytes(b"safe_text\nsafe_text_value_0\n")
+
+        with self.assertRaisesMessage(ValueError, "without a primary key column"):
+            export_masked(
+                [MaskedColumn.objects.values("safe_text")],
+                self.directory,
+                resume=True,
+            )
+
+
+class TestExportMaskedCommand(ExportTestCase):
+    def test_command(self):
+        out, err, returncode = run_command(
+            "export_masked", str(self.directory), "testapp", "--format", "jsonl"
+        )
+
+        self.assertEqual(returncode, 0)
+        path = self.directory / "testapp_maskedcolumn.jsonl"
+        self.assertIn(f"Exported 3 rows to {path}", out)
+        self.assertIn("Exported 3 rows to 1 files.", out)
+        self.assertEqual(len(path.read_text().splitlines()), 3)
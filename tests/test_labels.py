@@ -2,14 +2,26 @@ from __future__ import annotations
 
 from unittest.mock import Mock
 
-from django.db import connection
-from django.test import TestCase
+from django.db import connection, models
+from django.db.migrations.autodetector import MigrationAutodetector
+from django.db.migrations.operations import AddConstraint, RemoveConstraint
+from django.db.migrations.questioner import MigrationQuestioner
+from django.db.migrations.state import ModelState, ProjectState
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import isolate_apps
 
 from django_security_label.labels import (
+    AnonymizeColumn,
     ColumnSecurityLabel,
     MaskColumn,
     MaskFunction,
+    SampleTable,
+    TableSecurityLabel,
+    check_table_labels,
+    get_column_labels,
+    get_table_labels,
 )
+from tests.testapp.models import MaskedColumn
 
 
 class TestColumnSecurityLabel(TestCase):
@@ -194,3 +206,258 @@ class TestMaskColumn(TestCase):
         self.assertEqual(kwargs["policy"], "anon")
         self.assertEqual(kwargs["provider"], "anon")
         self.assertEqual(kwargs["mask_function"], MaskFunction.dummy_name)
+
+
+class TestMaskingExpression(SimpleTestCase):
+    def test_function(self):
+        label = MaskColumn(fields=["name"], mask_function=MaskFunction.dummy_name)
+
+        self.assertEqual(label.masking_expression, "anon.dummy_name()")
+
+    def test_value(self):
+        label = AnonymizeColumn(
+            fields=["name"], string_literal="MASKED WITH VALUE $$REDACTED$$"
+        )
+
+        self.assertEqual(label.masking_expression, "$$REDACTED$$")
+
+    def test_not_masked(self):
+        label = AnonymizeColumn(fields=["name"], string_literal="NOT MASKED")
+
+        self.assertIsNone(label.masking_expression)
+
+
+class TestGetColumnLabels(SimpleTestCase):
+    def test_policy(self):
+        labels = get_column_labels(MaskedColumn, "analysts")
+
+        self.assertEqual(list(labels), ["uuid"])
+        self.assertEqual(
+            labels["uuid"].masking_expression,
+            "$$00000000-0000-0000-0000-000000000000$$",
+        )
+
+    def test_all_policies(self):
+        labels = get_column_labels(MaskedColumn)
+
+        self.assertEqual(set(labels), {"text", "uuid", "confidential", "random_int"})
+
+
+def event_state(*constraints):
+    state = ProjectState()
+    state.add_model(
+        ModelState(
+            "testapp",
+            "Event",
+            [("id", models.AutoField(primary_key=True))],
+            {"constraints": list(constraints)},
+        )
+    )
+    return state
+
+
+class TestTableSecurityLabel(TestCase):
+    def make_label(self):
+        return TableSecurityLabel(
+            name="test_label",
+            provider="test_provider",
+            string_literal="TABLESAMPLE BERNOULLI(5)",
+        )
+
+    def make_model(self):
+        mock_model = Mock()
+        mock_model._meta.db_table = "test_table"
+        return mock_model
+
+    def test_create_sql(self):
+        with connection.schema_editor(collect_sql=True) as schema_editor:
+            statement = self.make_label().create_sql(self.make_model(), schema_editor)
+
+        self.assertEqual(
+            str(statement),
+            'SECURITY LABEL FOR "test_provider" ON TABLE "test_table" '
+            "IS 'TABLESAMPLE BERNOULLI(5)'",
+        )
+
+    def test_remove_sql(self):
+        with connection.schema_editor(collect_sql=True) as schema_editor:
+            statement = self.make_label().remove_sql(self.make_model(), schema_editor)
+
+        self.assertEqual(
+            str(statement),
+            'SECURITY LABEL FOR "test_provider" ON TABLE "test_table" IS NULL',
+        )
+
+    def test_constraint_sql_is_deferred(self):
+        with connection.schema_editor(collect_sql=True) as schema_editor:
+            sql = self.make_label().constraint_sql(self.make_model(), schema_editor)
+
+            self.assertIsNone(sql)
+            self.assertEqual(
+                [str(statement) for statement in schema_editor.deferred_sql],
+                [
+                    'SECURITY LABEL FOR "test_provider" ON TABLE "test_table" '
+                    "IS 'TABLESAMPLE BERNOULLI(5)'"
+                ],
+            )
+
+    def test_tablesample(self):
+        self.assertEqual(self.make_label().tablesample, "BERNOULLI(5)")
+        self.assertIsNone(
+            TableSecurityLabel(
+                name="test_label", provider="anon", string_literal="NOT MASKED"
+            ).tablesample
+        )
+
+    def test_deconstruct(self):
+        path, args, kwargs = self.make_label().deconstruct()
+
+        self.assertEqual(path, "django_security_label.labels.TableSecurityLabel")
+        self.assertEqual(args, ())
+        self.assertEqual(
+            kwargs,
+            {
+                "name": "test_label",
+                "provider": "test_provider",
+                "string_literal": "TABLESAMPLE BERNOULLI(5)",
+            },
+        )
+        self.assertEqual(self.make_label().clone(), self.make_label())
+
+
+class TestSampleTable(SimpleTestCase):
+    def test_init(self):
+        label = SampleTable(name="event_sample", ratio=10)
+
+        self.assertEqual(label.provider, "anon")
+        self.assertEqual(label.string_literal, "TABLESAMPLE SYSTEM(10)")
+        self.assertEqual(label.tablesample, "SYSTEM(10)")
+
+    def test_policy_method_and_seed(self):
+        label = SampleTable(
+            name="event_sample_analysts",
+            policy="analysts",
+            ratio=0.5,
+            method="BERNOULLI",
+            seed=42,
+        )
+
+        self.assertEqual(label.provider, "analysts")
+        self.assertEqual(
+            label.string_literal, "TABLESAMPLE BERNOULLI(0.5) REPEATABLE(42)"
+        )
+
+    def test_invalid_ratio(self):
+        for ratio in [0, -1, 101]:
+            with (
+                self.subTest(ratio=ratio),
+                self.assertRaisesMessage(
+                    ValueError, "ratio must be above 0 and up to 100"
+                ),
+            ):
+                SampleTable(name="event_sample", ratio=ratio)
+
+    def test_invalid_method(self):
+        with self.assertRaises(ValueError):
+            SampleTable(name="event_sample", ratio=10, method="RANDOM")
+
+    def test_deconstruct(self):
+        label = SampleTable(name="event_sample", policy="analysts", ratio=1)
+        path, args, kwargs = label.deconstruct()
+
+        self.assertEqual(path, "django_security_label.labels.SampleTable")
+        self.assertEqual(kwargs["policy"], "analysts")
+        self.assertEqual(kwargs["ratio"], 1)
+        self.assertEqual(kwargs["method"], "SYSTEM")
+        self.assertNotIn("seed", kwargs)
+        self.assertEqual(label.clone(), label)
+
+    def test_get_table_labels(self):
+        model = Mock()
+        anon = SampleTable(name="event_sample", ratio=10)
+        analysts = SampleTable(name="event_sample_analysts", policy="analysts", ratio=1)
+        unique = models.UniqueConstraint("id", name="event_unique")
+        model._meta.constraints = [anon, unique, analysts]
+
+        self.assertEqual(get_table_labels(model), [anon, analysts])
+        self.assertEqual(get_table_labels(model, "analysts"), [analysts])
+
+
+@isolate_apps("tests.testapp", attr_name="apps")
+class TestCheckTableLabels(SimpleTestCase):
+    def test_duplicate_provider(self):
+        class Event(models.Model):
+            class Meta:
+                app_label = "testapp"
+                constraints = [
+                    SampleTable(name="event_sample", ratio=10),
+                    SampleTable(name="event_sample_small", ratio=1),
+                    SampleTable(
+                        name="event_sample_analysts", policy="analysts", ratio=1
+                    ),
+                ]
+
+        errors = check_table_labels([self.apps.get_app_config("testapp")])
+
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0].id, "django_security_label.E001")
+        self.assertEqual(errors[0].obj, Event)
+        self.assertEqual(
+            errors[0].msg, "testapp.Event has 2 table labels for the 'anon' provider."
+        )
+
+    def test_one_label_per_provider(self):
+        class Event(models.Model):
+            class Meta:
+                app_label = "testapp"
+                constraints = [
+                    SampleTable(name="event_sample", ratio=10),
+                    SampleTable(
+                        name="event_sample_analysts", policy="analysts", ratio=1
+                    ),
+                ]
+
+        self.assertEqual(check_table_labels([self.apps.get_app_config("testapp")]), [])
+
+
+class TestSampleTableMigrations(SimpleTestCase):
+    def changes(self, before, after):
+        autodetector = MigrationAutodetector(
+            before, after, MigrationQuestioner(defaults={"ask_initial": True})
+        )
+        changes = autodetector._detect_changes()
+        return [
+            operation
+            for migration in changes.get("testapp", [])
+            for operation in migration.operations
+        ]
+
+    def test_add(self):
+        label = SampleTable(name="event_sample", ratio=10)
+
+        operations = self.changes(event_state(), event_state(label))
+
+        self.assertEqual(len(operations), 1)
+        self.assertIsInstance(operations[0], AddConstraint)
+        self.assertEqual(operations[0].constraint, label)
+
+    def test_unchanged(self):
+        self.assertEqual(
+            self.changes(
+                event_state(SampleTable(name="event_sample", ratio=10)),
+                event_state(SampleTable(name="event_sample", ratio=10)),
+            ),
+            [],
+        )
+
+    def test_change_ratio(self):
+        operations = self.changes(
+            event_state(SampleTable(name="event_sample", ratio=10)),
+            event_state(SampleTable(name="event_sample", ratio=1)),
+        )
+
+        self.assertEqual(
+            [type(operation) for operation in operations],
+            [RemoveConstraint, AddConstraint],
+        )
+        self.assertEqual(operations[1].constraint.ratio, 1)
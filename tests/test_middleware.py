@@ -1,20 +1,41 @@
 from __future__ import annotations
 
+import unittest
 import uuid
 from functools import partial
+from unittest import mock
 
+from asgiref.sync import iscoroutinefunction, sync_to_async
 from django.contrib.auth.models import Group, User
-from django.db import InternalError
+from django.db import InternalError, connection, connections, transaction
+from django.db.transaction import TransactionManagementError
+from django.http import Http404, StreamingHttpResponse
 from django.test import RequestFactory, override_settings
+from psycopg import Pipeline
 
 from django_security_label import constants
+from django_security_label import middleware as middleware_module
 from django_security_label.middleware import (
     GroupMaskingMiddleware,
     MaskedReadsMiddleware,
+    check_connection_role,
+    check_pool_connection,
+    disable_masked_reads,
+    enable_masked_reads,
+    get_active_policy,
+    lazy_session_role,
+    masked_reads,
+    set_local_role,
+    set_session_role,
+    transaction_role,
 )
 from tests.testapp.middleware import AnalystsMaskedReadsMiddleware
 from tests.testapp.models import MaskedColumn
-from tests.utils import AnonTransactionTestCase
+from tests.utils import (
+    AnonTransactionTestCase,
+    create_masked_column,
+    create_masked_columns,
+)
 
 
 def get_response_read(request, test_record):
@@ -22,6 +43,16 @@ def get_response_read(request, test_record):
     return request
 
 
+def get_response_no_query(request):
+    return request
+
+
+def current_user():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT current_user")
+        return cursor.fetchone()[0]
+
+
 def get_response_update(request, test_record):
     MaskedColumn.objects.filter(pk=test_record.pk).update(
         safe_text="updated_via_queryset",
@@ -312,3 +343,814 @@ class TestGroupMaskingMiddleware(AnonTransactionTestCase):
 
         self.test_record.refresh_from_db()
         self.assertEqual(self.test_record.safe_text, "safe_text_value")
+
+
+class TestLazySessionRole(AnonTransactionTestCase):
+    def setUp(self):
+        self.db_user = connection.settings_dict["USER"]
+
+    def test_no_query_skips_role_switch(self):
+        with lazy_session_role(constants.MASKED_READER_ROLE) as lazy_role:
+            pass
+
+        self.assertFalse(lazy_role.applied)
+
+    def test_role_set_on_first_query_and_reset(self):
+        with lazy_session_role(constants.MASKED_READER_ROLE) as lazy_role:
+            self.assertFalse(lazy_role.applied)
+            self.assertEqual(current_user(), constants.MASKED_READER_ROLE)
+            self.assertTrue(lazy_role.applied)
+
+        self.assertEqual(current_user(), self.db_user)
+
+    def test_role_reapplied_after_rollback(self):
+        with lazy_session_role(constants.MASKED_READER_ROLE):
+            try:
+                with transaction.atomic():
+                    self.assertEqual(current_user(), constants.MASKED_READER_ROLE)
+                    raise ValueError
+            except ValueError:
+                pass
+            self.assertEqual(current_user(), constants.MASKED_READER_ROLE)
+
+        self.assertEqual(current_user(), self.db_user)
+
+
+@unittest.skipUnless(Pipeline.is_supported(), "libpq pipeline mode is unavailable")
+class TestPipelinedRoleSwitch(AnonTransactionTestCase):
+    def setUp(self):
+        self.db_user = connection.settings_dict["USER"]
+
+    def test_role_set_with_first_query(self):
+        with lazy_session_role(constants.MASKED_READER_ROLE, pipeline=True):
+            self.assertEqual(current_user(), constants.MASKED_READER_ROLE)
+
+        self.assertEqual(current_user(), self.db_user)
+
+    def test_transaction_role_set_with_first_query(self):
+        with transaction_role(constants.MASKED_READER_ROLE, lazy=True, pipeline=True):
+            self.assertEqual(current_user(), constants.MASKED_READER_ROLE)
+
+        self.assertEqual(current_user(), self.db_user)
+
+    def test_role_set_again_after_failed_query(self):
+        test_record = create_masked_column()
+
+        with lazy_session_role(constants.MASKED_READER_ROLE, pipeline=True):
+            with self.assertRaises(InternalError):
+                get_response_update(None, test_record)
+            self.assertEqual(current_user(), constants.MASKED_READER_ROLE)
+
+        self.assertEqual(current_user(), self.db_user)
+
+
+class TestSessionRoleTracking(AnonTransactionTestCase):
+    def setUp(self):
+        self.db_user = connection.settings_dict["USER"]
+
+    def reset_role_untracked(self):
+        # Leave the connection's tracked role out of sync for this test only.
+        self.addCleanup(connection.close)
+        with connection.connection.cursor() as cursor:
+            cursor.execute("RESET ROLE;")
+
+    def test_repeated_switch_is_skipped(self):
+        enable_masked_reads()
+        self.reset_role_untracked()
+
+        # The tracked role hasn't changed, so no statement is sent.
+        enable_masked_reads()
+
+        self.assertEqual(current_user(), self.db_user)
+
+    def test_reset_is_skipped_for_default_role(self):
+        disable_masked_reads()
+
+        self.assertEqual(current_user(), self.db_user)
+
+    def test_switch_after_reconnect(self):
+        enable_masked_reads()
+        connection.close()
+
+        enable_masked_reads()
+
+        self.assertEqual(current_user(), constants.MASKED_READER_ROLE)
+        disable_masked_reads()
+
+    def test_switch_after_rollback(self):
+        try:
+            with transaction.atomic():
+                enable_masked_reads()
+                raise ValueError
+        except ValueError:
+            pass
+
+        enable_masked_reads()
+
+        self.assertEqual(current_user(), constants.MASKED_READER_ROLE)
+        disable_masked_reads()
+
+    def test_deferred_reset_runs_before_next_query(self):
+        enable_masked_reads()
+        disable_masked_reads(defer=True)
+
+        self.assertEqual(current_user(), self.db_user)
+
+    def test_deferred_reset_skipped_when_role_reused(self):
+        enable_masked_reads()
+        disable_masked_reads(defer=True)
+        enable_masked_reads()
+
+        self.assertEqual(current_user(), constants.MASKED_READER_ROLE)
+        disable_masked_reads()
+        self.assertEqual(current_user(), self.db_user)
+
+
+class TestTransactionRole(AnonTransactionTestCase):
+    def setUp(self):
+        self.db_user = connection.settings_dict["USER"]
+
+    def test_set_local_role_requires_atomic_block(self):
+        with self.assertRaises(TransactionManagementError):
+            set_local_role(constants.MASKED_READER_ROLE)
+
+    def test_role_ends_with_transaction(self):
+        with transaction_role(constants.MASKED_READER_ROLE):
+            self.assertEqual(current_user(), constants.MASKED_READER_ROLE)
+
+        self.assertEqual(current_user(), self.db_user)
+
+    def test_lazy_role_ends_with_transaction(self):
+        with transaction_role(constants.MASKED_READER_ROLE, lazy=True):
+            self.assertEqual(current_user(), constants.MASKED_READER_ROLE)
+
+        self.assertEqual(current_user(), self.db_user)
+
+    def test_lazy_role_reapplied_after_savepoint_rollback(self):
+        with transaction_role(constants.MASKED_READER_ROLE, lazy=True):
+            try:
+                with transaction.atomic():
+                    self.assertEqual(current_user(), constants.MASKED_READER_ROLE)
+                    raise ValueError
+            except ValueError:
+                pass
+            self.assertEqual(current_user(), constants.MASKED_READER_ROLE)
+
+        self.assertEqual(current_user(), self.db_user)
+
+
+@override_settings(SECURITY_LABEL_TRANSACTION_ROLE=True)
+class TestTransactionRoleMiddleware(AnonTransactionTestCase):
+    request_factory = RequestFactory()
+
+    def setUp(self):
+        self.test_record = create_masked_column()
+
+    def test_masked_reads(self):
+        middleware = MaskedReadsMiddleware(
+            partial(get_response_read, test_record=self.test_record)
+        )
+
+        response = middleware(self.request_factory.get("/"))
+
+        self.assertNotEqual(response.row.text, "secret_text_value")
+        self.assertEqual(response.row.confidential, "CONFIDENTIAL")
+        self.assertEqual(current_user(), connection.settings_dict["USER"])
+
+    @override_settings(SECURITY_LABEL_LAZY_ROLE_SWITCH=True)
+    def test_lazy_masked_reads(self):
+        middleware = MaskedReadsMiddleware(
+            partial(get_response_read, test_record=self.test_record)
+        )
+
+        response = middleware(self.request_factory.get("/"))
+
+        self.assertEqual(response.row.confidential, "CONFIDENTIAL")
+        self.assertEqual(current_user(), connection.settings_dict["USER"])
+
+    def test_masked_user_cant_update(self):
+        middleware = MaskedReadsMiddleware(
+            partial(get_response_update, test_record=self.test_record)
+        )
+
+        with self.assertRaises(InternalError):
+            middleware(self.request_factory.get("/"))
+
+        self.test_record.refresh_from_db()
+        self.assertEqual(self.test_record.safe_text, "safe_text_value")
+
+
+@override_settings(SECURITY_LABEL_DEFER_ROLE_RESET=True)
+class TestDeferredResetMiddleware(AnonTransactionTestCase):
+    request_factory = RequestFactory()
+
+    def setUp(self):
+        self.test_record = create_masked_column()
+
+    def test_superuser_after_masked_request_sees_real_data(self):
+        middleware = MaskedReadsMiddleware(
+            partial(get_response_read, test_record=self.test_record)
+        )
+        response = middleware(self.request_factory.get("/"))
+        self.assertEqual(response.row.confidential, "CONFIDENTIAL")
+
+        request = self.request_factory.get("/")
+        request.user = type(
+            "User", (), {"is_authenticated": True, "is_superuser": True}
+        )()
+        response = middleware(request)
+
+        self.assertEqual(response.row.confidential, "hunter2")
+
+    def test_writes_after_masked_request(self):
+        middleware = MaskedReadsMiddleware(
+            partial(get_response_read, test_record=self.test_record)
+        )
+        middleware(self.request_factory.get("/"))
+
+        MaskedColumn.objects.filter(pk=self.test_record.pk).update(
+            safe_text="updated_via_queryset",
+        )
+
+        self.test_record.refresh_from_db()
+        self.assertEqual(self.test_record.safe_text, "updated_via_queryset")
+
+
+@override_settings(SECURITY_LABEL_LAZY_ROLE_SWITCH=True)
+class TestLazyMaskedReadsMiddleware(AnonTransactionTestCase):
+    request_factory = RequestFactory()
+
+    def setUp(self):
+        self.test_record = create_masked_column()
+
+    def test_masked_reads(self):
+        middleware = MaskedReadsMiddleware(
+            partial(get_response_read, test_record=self.test_record)
+        )
+
+        response = middleware(self.request_factory.get("/"))
+
+        self.assertNotEqual(response.row.text, "secret_text_value")
+        self.assertEqual(response.row.confidential, "CONFIDENTIAL")
+        self.assertEqual(current_user(), connection.settings_dict["USER"])
+
+    def test_group_masked_reads(self):
+        middleware = GroupMaskingMiddleware(
+            partial(get_response_read, test_record=self.test_record)
+        )
+
+        with self.settings(SECURITY_LABEL_GROUPS_TO_POLICIES=GROUPS_TO_POLICIES):
+            response = middleware(self.request_factory.get("/"))
+
+        self.assertNotEqual(response.row.text, "secret_text_value")
+        self.assertEqual(response.row.confidential, "CONFIDENTIAL")
+
+    def test_no_query_request(self):
+        middleware = MaskedReadsMiddleware(get_response_no_query)
+
+        with mock.patch(
+            "django_security_label.middleware._switch_role",
+            wraps=middleware_module._switch_role,
+        ) as switch_role:
+            middleware(self.request_factory.get("/"))
+
+        self.assertNotIn(
+            constants.MASKED_READER_ROLE,
+            [call.args[1] for call in switch_role.call_args_list],
+        )
+
+    def test_masked_user_cant_update(self):
+        middleware = MaskedReadsMiddleware(
+            partial(get_response_update, test_record=self.test_record)
+        )
+
+        with self.assertRaises(InternalError):
+            middleware(self.request_factory.get("/"))
+
+        self.test_record.refresh_from_db()
+        self.assertEqual(self.test_record.safe_text, "safe_text_value")
+
+
+class TestAsyncMiddleware(AnonTransactionTestCase):
+    request_factory = RequestFactory()
+
+    def setUp(self):
+        self.test_record = create_masked_column()
+
+    async def get_response_read(self, request):
+        request.row = await MaskedColumn.objects.aget(pk=self.test_record.pk)
+        request.policy = get_active_policy()
+        return request
+
+    def test_sync_and_async_capable(self):
+        async def get_response(request):
+            return request
+
+        self.assertTrue(iscoroutinefunction(MaskedReadsMiddleware(get_response)))
+        self.assertFalse(iscoroutinefunction(MaskedReadsMiddleware(lambda r: r)))
+        self.assertTrue(MaskedReadsMiddleware.async_capable)
+        self.assertTrue(GroupMaskingMiddleware.sync_capable)
+
+    async def test_masked_reads(self):
+        middleware = MaskedReadsMiddleware(self.get_response_read)
+
+        response = await middleware(self.request_factory.get("/"))
+
+        self.assertNotEqual(response.row.text, "secret_text_value")
+        self.assertEqual(response.row.confidential, "CONFIDENTIAL")
+        self.assertEqual(response.policy, constants.MASKED_READER_ROLE)
+        self.assertIsNone(get_active_policy())
+        self.assertEqual(
+            await sync_to_async(current_user)(), connection.settings_dict["USER"]
+        )
+
+    async def test_superuser_sees_real_data(self):
+        middleware = MaskedReadsMiddleware(self.get_response_read)
+        request = self.request_factory.get("/")
+        request.user = type(
+            "User", (), {"is_authenticated": True, "is_superuser": True}
+        )()
+
+        response = await middleware(request)
+
+        self.assertEqual(response.row.confidential, "hunter2")
+        self.assertIsNone(response.policy)
+
+    @override_settings(SECURITY_LABEL_GROUPS_TO_POLICIES=GROUPS_TO_POLICIES)
+    async def test_group_masked_reads(self):
+        user = await sync_to_async(User.objects.create_user)(
+            username="analyst_user", password="test"
+        )
+        group = await Group.objects.acreate(name="Analysts")
+        await user.groups.aadd(group)
+        middleware = GroupMaskingMiddleware(self.get_response_read)
+        request = self.request_factory.get("/")
+        request.user = user
+
+        response = await middleware(request)
+
+        self.assertEqual(
+            response.row.uuid, uuid.UUID("00000000-0000-0000-0000-000000000000")
+        )
+        self.assertEqual(response.policy, "analysts_reader")
+
+    @override_settings(SECURITY_LABEL_LAZY_ROLE_SWITCH=True)
+    async def test_lazy_masked_reads(self):
+        middleware = MaskedReadsMiddleware(self.get_response_read)
+
+        response = await middleware(self.request_factory.get("/"))
+
+        self.assertEqual(response.row.confidential, "CONFIDENTIAL")
+        self.assertEqual(
+            await sync_to_async(current_user)(), connection.settings_dict["USER"]
+        )
+
+    async def test_masked_user_cant_update(self):
+        async def get_response(request):
+            await sync_to_async(get_response_update)(request, self.test_record)
+
+        middleware = MaskedReadsMiddleware(get_response)
+
+        with self.assertRaises(InternalError):
+            await middleware(self.request_factory.get("/"))
+
+        await self.test_record.arefresh_from_db()
+        self.assertEqual(self.test_record.safe_text, "safe_text_value")
+
+
+def get_response_read_replica(request, test_record):
+    request.row = MaskedColumn.objects.using("replica").get(pk=test_record.pk)
+    return request
+
+
+@override_settings(SECURITY_LABEL_DATABASES=["default", "replica"])
+class TestMultipleDatabasesMiddleware(AnonTransactionTestCase):
+    databases = {"default", "replica"}
+    request_factory = RequestFactory()
+
+    def setUp(self):
+        self.test_record = create_masked_column()
+
+    def test_masked_reads_on_each_alias(self):
+        for get_response in (get_response_read, get_response_read_replica):
+            with self.subTest(get_response=get_response.__name__):
+                middleware = MaskedReadsMiddleware(
+                    partial(get_response, test_record=self.test_record)
+                )
+
+                response = middleware(self.request_factory.get("/"))
+
+                self.assertNotEqual(response.row.text, "secret_text_value")
+                self.assertEqual(response.row.confidential, "CONFIDENTIAL")
+
+    def test_only_used_alias_switched(self):
+        middleware = MaskedReadsMiddleware(
+            partial(get_response_read_replica, test_record=self.test_record)
+        )
+
+        with mock.patch(
+            "django_security_label.middleware._switch_role",
+            wraps=middleware_module._switch_role,
+        ) as switch_role:
+            middleware(self.request_factory.get("/"))
+
+        self.assertEqual(
+            {
+                call.args[0].alias
+                for call in switch_role.call_args_list
+                if call.args[1] == constants.MASKED_READER_ROLE
+            },
+            {"replica"},
+        )
+
+    @override_settings(SECURITY_LABEL_TRANSACTION_ROLE=True)
+    def test_transaction_only_opened_on_used_alias(self):
+        middleware = MaskedReadsMiddleware(
+            partial(get_response_read_replica, test_record=self.test_record)
+        )
+
+        with mock.patch(
+            "django_security_label.middleware.transaction.atomic",
+            wraps=transaction.atomic,
+        ) as atomic:
+            response = middleware(self.request_factory.get("/"))
+
+        self.assertEqual(response.row.confidential, "CONFIDENTIAL")
+        self.assertEqual(
+            {call.kwargs["using"] for call in atomic.call_args_list}, {"replica"}
+        )
+        self.assertFalse(connections["replica"].in_atomic_block)
+
+    def test_roles_reset(self):
+        middleware = MaskedReadsMiddleware(
+            partial(get_response_read_replica, test_record=self.test_record)
+        )
+
+        middleware(self.request_factory.get("/"))
+
+        for alias in ("default", "replica"):
+            with connections[alias].cursor() as cursor:
+                cursor.execute("SELECT current_user")
+                self.assertEqual(
+                    cursor.fetchone()[0], connections[alias].settings_dict["USER"]
+                )
+
+    def test_helpers_use_alias(self):
+        enable_masked_reads(using="replica")
+        try:
+            row = MaskedColumn.objects.using("replica").get(pk=self.test_record.pk)
+            self.assertEqual(row.confidential, "CONFIDENTIAL")
+            row = MaskedColumn.objects.using("default").get(pk=self.test_record.pk)
+            self.assertEqual(row.confidential, "hunter2")
+        finally:
+            disable_masked_reads(using="replica")
+
+
+class TestMaskedReads(AnonTransactionTestCase):
+    def setUp(self):
+        self.test_record = create_masked_column()
+
+    def read_confidential(self):
+        return MaskedColumn.objects.get(pk=self.test_record.pk).confidential
+
+    def test_context_manager(self):
+        with masked_reads():
+            self.assertEqual(self.read_confidential(), "CONFIDENTIAL")
+            self.assertEqual(get_active_policy(), constants.MASKED_READER_ROLE)
+
+        self.assertEqual(self.read_confidential(), "hunter2")
+        self.assertIsNone(get_active_policy())
+        self.assertEqual(current_user(), connection.settings_dict["USER"])
+
+    def test_decorator(self):
+        @masked_reads
+        def read():
+            return self.read_confidential()
+
+        @masked_reads(constants.MASKED_READER_ROLE)
+        def read_with_policy():
+            return self.read_confidential()
+
+        self.assertEqual(read(), "CONFIDENTIAL")
+        self.assertEqual(read_with_policy(), "CONFIDENTIAL")
+        self.assertEqual(self.read_confidential(), "hunter2")
+
+    def test_nested_same_policy_switches_once(self):
+        sent = []
+        original = middleware_module._switch_role
+
+        def switch_role(*args, **kwargs):
+            sent.append(original(*args, **kwargs))
+            return sent[-1]
+
+        with (
+            mock.patch(
+                "django_security_label.middleware._switch_role", side_effect=switch_role
+            ),
+            masked_reads(),
+        ):
+            with masked_reads():
+                self.read_confidential()
+            self.assertEqual(self.read_confidential(), "CONFIDENTIAL")
+
+        # The nested block neither switches nor restores the role.
+        self.assertEqual(sent, [True, False, False, True])
+        self.assertEqual(current_user(), connection.settings_dict["USER"])
+
+    def test_restores_previous_role(self):
+        set_session_role(constants.MASKED_READER_ROLE)
+        self.addCleanup(disable_masked_reads)
+
+        with masked_reads():
+            pass
+
+        self.assertEqual(current_user(), constants.MASKED_READER_ROLE)
+
+    def test_restores_untracked_role(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SET ROLE {constants.MASKED_READER_ROLE}")
+        connection._security_label_role = middleware_module._RoleState(
+            connection, middleware_module._UNKNOWN_ROLE
+        )
+        self.addCleanup(disable_masked_reads)
+
+        with masked_reads():
+            pass
+
+        self.assertEqual(current_user(), constants.MASKED_READER_ROLE)
+
+    def test_restores_on_exception(self):
+        with self.assertRaises(ValueError), masked_reads():
+            self.read_confidential()
+            raise ValueError
+
+        self.assertEqual(self.read_confidential(), "hunter2")
+
+    def test_nested_in_transaction_role(self):
+        with transaction_role(constants.MASKED_READER_ROLE):
+            with masked_reads():
+                pass
+            self.assertEqual(current_user(), constants.MASKED_READER_ROLE)
+            with masked_reads("analysts_reader"):
+                self.assertEqual(current_user(), "analysts_reader")
+            self.assertEqual(current_user(), constants.MASKED_READER_ROLE)
+
+        # The nested role ended with the transaction, not only the outer one.
+        self.assertEqual(current_user(), connection.settings_dict["USER"])
+
+
+def get_response_stream(request):
+    return StreamingHttpResponse(
+        f"{row.confidential}\n"
+        for row in MaskedColumn.objects.order_by("pk").iterator(chunk_size=1)
+    )
+
+
+class TestStreamingMiddleware(AnonTransactionTestCase):
+    request_factory = RequestFactory()
+
+    def setUp(self):
+        create_masked_columns(3)
+
+    def stream(self, middleware):
+        response = middleware(self.request_factory.get("/"))
+        try:
+            return b"".join(response).decode()
+        finally:
+            response.close()
+
+    def test_streamed_content_masked(self):
+        middleware = MaskedReadsMiddleware(get_response_stream)
+
+        self.assertEqual(self.stream(middleware), "CONFIDENTIAL\n" * 3)
+        self.assertEqual(current_user(), connection.settings_dict["USER"])
+
+    def test_streamed_content_masked_with_lazy_and_transaction_roles(self):
+        for setting in (
+            "SECURITY_LABEL_LAZY_ROLE_SWITCH",
+            "SECURITY_LABEL_TRANSACTION_ROLE",
+        ):
+            with self.subTest(setting=setting), self.settings(**{setting: True}):
+                middleware = MaskedReadsMiddleware(get_response_stream)
+
+                self.assertEqual(self.stream(middleware), "CONFIDENTIAL\n" * 3)
+                self.assertEqual(current_user(), connection.settings_dict["USER"])
+
+    def test_role_not_held_between_response_and_iteration(self):
+        middleware = MaskedReadsMiddleware(get_response_stream)
+
+        response = middleware(self.request_factory.get("/"))
+
+        self.assertEqual(current_user(), connection.settings_dict["USER"])
+        response.close()
+
+    def test_role_reset_when_closed_early(self):
+        middleware = MaskedReadsMiddleware(get_response_stream)
+        response = middleware(self.request_factory.get("/"))
+
+        self.assertEqual(next(iter(response)), b"CONFIDENTIAL\n")
+        response.close()
+
+        self.assertEqual(current_user(), connection.settings_dict["USER"])
+
+
+def get_response_unlabeled(request):
+    request.user_count = User.objects.count()
+    return request
+
+
+@override_settings(SECURITY_LABEL_LABELED_TABLES_ONLY=True)
+class TestLabeledTablesOnlyMiddleware(AnonTransactionTestCase):
+    request_factory = RequestFactory()
+
+    def setUp(self):
+        self.test_record = create_masked_column()
+
+    def masked_switches(self, middleware):
+        with mock.patch(
+            "django_security_label.middleware._switch_role",
+            wraps=middleware_module._switch_role,
+        ) as switch_role:
+            response = middleware(self.request_factory.get("/"))
+        switches = [
+            call
+            for call in switch_role.call_args_list
+            if call.args[1] == constants.MASKED_READER_ROLE
+        ]
+        return response, switches
+
+    def test_unlabeled_tables_skip_switch(self):
+        middleware = MaskedReadsMiddleware(get_response_unlabeled)
+
+        response, switches = self.masked_switches(middleware)
+
+        self.assertEqual(response.user_count, 0)
+        self.assertEqual(switches, [])
+
+    def test_labeled_table_masked(self):
+        def get_response(request):
+            get_response_unlabeled(request)
+            return get_response_read(request, self.test_record)
+
+        response, switches = self.masked_switches(MaskedReadsMiddleware(get_response))
+
+        self.assertEqual(response.row.confidential, "CONFIDENTIAL")
+        self.assertEqual(len(switches), 1)
+        self.assertEqual(current_user(), connection.settings_dict["USER"])
+
+    @override_settings(SECURITY_LABEL_TRANSACTION_ROLE=True)
+    def test_transaction_role(self):
+        middleware = MaskedReadsMiddleware(
+            partial(get_response_read, test_record=self.test_record)
+        )
+
+        response = middleware(self.request_factory.get("/"))
+
+        self.assertEqual(response.row.confidential, "CONFIDENTIAL")
+
+
+def get_response_not_found(request, test_record):
+    MaskedColumn.objects.get(pk=test_record.pk)
+    raise Http404
+
+
+class TestRoleResetOnError(AnonTransactionTestCase):
+    def setUp(self):
+        self.request_factory = RequestFactory()
+        self.test_record = create_masked_column()
+        self.get_response = partial(
+            get_response_not_found, test_record=self.test_record
+        )
+
+    def assert_reset_after_error(self, middleware):
+        with self.assertRaises(Http404):
+            middleware(self.request_factory.get("/"))
+
+        self.assertIsNotNone(connection.connection)
+        self.assertEqual(current_user(), connection.settings_dict["USER"])
+
+    def test_eager_switch(self):
+        self.assert_reset_after_error(MaskedReadsMiddleware(self.get_response))
+
+    @override_settings(SECURITY_LABEL_LAZY_ROLE_SWITCH=True)
+    def test_lazy_switch(self):
+        self.assert_reset_after_error(MaskedReadsMiddleware(self.get_response))
+
+    def test_custom_middleware(self):
+        self.assert_reset_after_error(AnalystsMaskedReadsMiddleware(self.get_response))
+
+    def test_failed_reset_closes_connection(self):
+        middleware = MaskedReadsMiddleware(self.get_response)
+
+        # The view's error is raised, not the reset's.
+        with (
+            mock.patch.object(
+                middleware_module, "disable_masked_reads", side_effect=InternalError
+            ),
+            self.assertRaises(Http404),
+        ):
+            middleware(self.request_factory.get("/"))
+
+        self.assertIsNone(connection.connection)
+        self.assertEqual(current_user(), connection.settings_dict["USER"])
+
+    def test_masked_reads_after_error(self):
+        with self.assertRaises(ValueError), masked_reads():
+            MaskedColumn.objects.count()
+            raise ValueError
+
+        self.assertEqual(current_user(), connection.settings_dict["USER"])
+
+
+class TestCheckConnectionRole(AnonTransactionTestCase):
+    databases = {"default", "masked"}
+
+    def setUp(self):
+        self.db_user = connection.settings_dict["USER"]
+
+    def set_role_untracked(self, role):
+        with connection.connection.cursor() as cursor:
+            cursor.execute(f"SET ROLE {role};")
+
+    def test_resets_leaked_role(self):
+        connection.ensure_connection()
+        self.set_role_untracked(constants.MASKED_READER_ROLE)
+
+        self.assertTrue(check_connection_role())
+
+        self.assertEqual(current_user(), self.db_user)
+
+    def test_tracked_only(self):
+        enable_masked_reads()
+        # Forget the switch, so only a query can find the role.
+        del connection._security_label_role
+
+        self.assertTrue(check_connection_role(verify=False))
+        self.assertEqual(current_user(), constants.MASKED_READER_ROLE)
+
+        self.assertTrue(check_connection_role())
+        self.assertEqual(current_user(), self.db_user)
+
+    def test_tracked_role_reset_without_verify(self):
+        enable_masked_reads()
+
+        self.assertTrue(check_connection_role(verify=False))
+
+        self.assertEqual(current_user(), self.db_user)
+
+    def test_closed_connection(self):
+        connection.close()
+
+        self.assertTrue(check_connection_role())
+
+        self.assertIsNone(connection.connection)
+
+    def test_deferred_reset_is_kept(self):
+        enable_masked_reads()
+        disable_masked_reads(defer=True)
+
+        self.assertTrue(check_connection_role())
+
+        with connection.connection.cursor() as cursor:
+            cursor.execute("SELECT current_user")
+            self.assertEqual(cursor.fetchone()[0], constants.MASKED_READER_ROLE)
+        self.assertEqual(current_user(), self.db_user)
+
+    def test_broken_connection_is_closed(self):
+        connection.ensure_connection()
+        with mock.patch.object(
+            middleware_module, "_query_role", side_effect=InternalError
+        ):
+            self.assertFalse(check_connection_role())
+
+        self.assertIsNone(connection.connection)
+
+    def test_startup_role_is_default(self):
+        masked = connections["masked"]
+        self.addCleanup(masked.close)
+        masked.ensure_connection()
+
+        self.assertTrue(check_connection_role("masked"))
+
+        with masked.cursor() as cursor:
+            cursor.execute("SELECT current_user")
+            self.assertEqual(cursor.fetchone()[0], constants.MASKED_READER_ROLE)
+
+    def test_request_started(self):
+        connection.ensure_connection()
+        self.set_role_untracked(constants.MASKED_READER_ROLE)
+
+        middleware_module.check_connection_roles()
+
+        self.assertEqual(current_user(), self.db_user)
+
+    def test_check_pool_connection(self):
+        connection.ensure_connection()
+        self.set_role_untracked(constants.MASKED_READER_ROLE)
+
+        autocommit = connection.connection.autocommit
+
+        check_pool_connection(connection.connection)
+
+        self.assertEqual(connection.connection.autocommit, autocommit)
+        self.assertEqual(current_user(), self.db_user)
@@ -73,6 +73,18 @@ class TestCreateRole(TestCase):
                 ],
             )
 
+    def test_database_forwards_with_login(self):
+        op = CreateRole("test_role", login=True, password="hunter2")
+        with connection.schema_editor(collect_sql=True) as schema_editor:
+            op.database_forwards("app", schema_editor, None, None)
+            self.assertListEqual(
+                schema_editor.collected_sql,
+                [
+                    'DROP ROLE IF EXISTS "test_role";',
+                    "CREATE ROLE \"test_role\" LOGIN PASSWORD 'hunter2';",
+                ],
+            )
+
     def test_database_backwards(self):
         op = CreateRole("test_role")
         with connection.schema_editor(collect_sql=True) as schema_editor:
@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from django_security_label import constants
+from django_security_label.policies import (
+    PolicyCache,
+    PolicyIndex,
+    get_group_policy,
+    get_policy_cache,
+    get_policy_index,
+    invalidate_policies,
+)
+
+GROUPS_TO_POLICIES = [
+    ("Masked Readers", constants.MASKED_READER_ROLE),
+    ("Analysts", "analysts_reader"),
+    ("Unmasked", None),
+]
+
+
+class TestPolicyIndex(SimpleTestCase):
+    def test_resolve_uses_setting_order(self):
+        index = PolicyIndex(GROUPS_TO_POLICIES)
+
+        self.assertEqual(index.resolve(["Unmasked", "Analysts"]), "analysts_reader")
+        self.assertIsNone(index.resolve(["Unmasked", "Other"]))
+
+    def test_resolve_without_match(self):
+        index = PolicyIndex(GROUPS_TO_POLICIES)
+
+        self.assertEqual(index.resolve([]), constants.MASKED_READER_ROLE)
+        self.assertEqual(index.resolve(["Other"]), constants.MASKED_READER_ROLE)
+
+    def test_first_entry_for_a_group_is_used(self):
+        index = PolicyIndex([("Analysts", "analysts_reader"), ("Analysts", None)])
+
+        self.assertEqual(index.groups, {"Analysts": (0, "analysts_reader")})
+
+    def test_large_setting(self):
+        index = PolicyIndex([(f"Org {i}", f"org_{i}") for i in range(5000)])
+
+        self.assertEqual(index.resolve(["Org 4999", "Org 1234"]), "org_1234")
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            PolicyIndex(GROUPS_TO_POLICIES).fingerprint,
+            PolicyIndex(GROUPS_TO_POLICIES).fingerprint,
+        )
+        self.assertNotEqual(
+            PolicyIndex(GROUPS_TO_POLICIES).fingerprint,
+            PolicyIndex(GROUPS_TO_POLICIES[:1]).fingerprint,
+        )
+
+    def test_recompiled_when_setting_changes(self):
+        with self.settings(SECURITY_LABEL_GROUPS_TO_POLICIES=GROUPS_TO_POLICIES):
+            self.assertEqual(len(get_policy_index().groups), 3)
+        with self.settings(SECURITY_LABEL_GROUPS_TO_POLICIES=[]):
+            self.assertFalse(get_policy_index())
+
+
+@override_settings(SECURITY_LABEL_GROUPS_TO_POLICIES=GROUPS_TO_POLICIES)
+class TestGetGroupPolicy(TestCase):
+    def test_first_matching_group_wins(self):
+        user = User.objects.create_user(username="user")
+        user.groups.add(
+            Group.objects.create(name="Analysts"),
+            Group.objects.create(name="Masked Readers"),
+        )
+
+        self.assertEqual(get_group_policy(user), constants.MASKED_READER_ROLE)
+
+    def test_no_matching_group(self):
+        user = User.objects.create_user(username="user")
+
+        self.assertEqual(get_group_policy(user), constants.MASKED_READER_ROLE)
+
+    def test_none_policy(self):
+        user = User.objects.create_user(username="user")
+        user.groups.add(Group.objects.create(name="Unmasked"))
+
+        self.assertIsNone(get_group_policy(user))
+
+    @override_settings(SECURITY_LABEL_GROUPS_TO_POLICIES=[])
+    def test_empty_setting_skips_query(self):
+        user = User.objects.create_user(username="user")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_group_policy(user), constants.MASKED_READER_ROLE)
+
+    def test_uncached_by_default(self):
+        user = User.objects.create_user(username="user")
+
+        self.assertIsNone(get_policy_cache())
+        with self.assertNumQueries(1):
+            get_group_policy(user)
+        with self.assertNumQueries(1):
+            get_group_policy(user)
+
+
+@override_settings(
+    SECURITY_LABEL_GROUPS_TO_POLICIES=GROUPS_TO_POLICIES,
+    SECURITY_LABEL_POLICY_CACHE_SIZE=10,
+)
+class TestLocalPolicyCache(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user")
+        self.analysts = Group.objects.create(name="Analysts")
+
+    def test_cached(self):
+        self.user.groups.add(self.analysts)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_group_policy(self.user), "analysts_reader")
+        with self.assertNumQueries(0):
+            self.assertEqual(get_group_policy(self.user), "analysts_reader")
+
+    def test_none_policy_cached(self):
+        self.user.groups.add(Group.objects.create(name="Unmasked"))
+        get_group_policy(self.user)
+
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_group_policy(self.user))
+
+    def test_anonymous_user_not_cached(self):
+        self.assertEqual(
+            get_group_policy(AnonymousUser()), constants.MASKED_READER_ROLE
+        )
+        self.assertEqual(len(get_policy_cache()._local), 0)
+
+    def test_invalidated_by_adding_group(self):
+        get_group_policy(self.user)
+
+        self.user.groups.add(self.analysts)
+
+        self.assertEqual(get_group_policy(self.user), "analysts_reader")
+
+    def test_invalidated_by_removing_group(self):
+        self.user.groups.add(self.analysts)
+        get_group_policy(self.user)
+
+        self.user.groups.remove(self.analysts)
+
+        self.assertEqual(get_group_policy(self.user), constants.MASKED_READER_ROLE)
+
+    def test_invalidated_by_adding_user_to_group(self):
+        get_group_policy(self.user)
+
+        self.analysts.user_set.add(self.user)
+
+        self.assertEqual(get_group_policy(self.user), "analysts_reader")
+
+    def test_invalidated_by_clearing_group(self):
+        self.user.groups.add(self.analysts)
+        get_group_policy(self.user)
+
+        self.analysts.user_set.clear()
+
+        self.assertEqual(get_group_policy(self.user), constants.MASKED_READER_ROLE)
+
+    def test_invalidated_by_renaming_group(self):
+        group = Group.objects.create(name="Other")
+        self.user.groups.add(group)
+        get_group_policy(self.user)
+
+        group.name = "Unmasked"
+        group.save()
+
+        self.assertIsNone(get_group_policy(self.user))
+
+    def test_invalidated_by_deleting_group(self):
+        self.user.groups.add(self.analysts)
+        get_group_policy(self.user)
+
+        self.analysts.delete()
+
+        self.assertEqual(get_group_policy(self.user), constants.MASKED_READER_ROLE)
+
+    @override_settings(SECURITY_LABEL_POLICY_CACHE_SIZE=1)
+    def test_least_recently_used_evicted(self):
+        other = User.objects.create_user(username="other")
+        get_group_policy(self.user)
+        get_group_policy(other)
+
+        with self.assertNumQueries(1):
+            get_group_policy(self.user)
+
+    @override_settings(SECURITY_LABEL_POLICY_CACHE_TIMEOUT=0)
+    def test_expired(self):
+        get_group_policy(self.user)
+
+        with self.assertNumQueries(1):
+            get_group_policy(self.user)
+
+
+@override_settings(
+    SECURITY_LABEL_GROUPS_TO_POLICIES=GROUPS_TO_POLICIES,
+    SECURITY_LABEL_POLICY_CACHE_ALIAS="default",
+)
+class TestSharedPolicyCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="user")
+        self.analysts = Group.objects.create(name="Analysts")
+
+    def test_cached(self):
+        self.user.groups.add(self.analysts)
+        get_group_policy(self.user)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_group_policy(self.user), "analysts_reader")
+
+    def test_invalidate_user(self):
+        get_group_policy(self.user)
+
+        self.user.groups.add(self.analysts)
+
+        self.assertEqual(get_group_policy(self.user), "analysts_reader")
+
+    def test_invalidate_all(self):
+        get_group_policy(self.user)
+
+        invalidate_policies()
+
+        with self.assertNumQueries(1):
+            get_group_policy(self.user)
+
+    def test_shared_between_caches(self):
+        PolicyCache(alias="default").get_or_set(self.user.pk, lambda: "shared")
+
+        self.assertEqual(get_group_policy(self.user), "shared")
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import json
+import tempfile
+from pathlib import Path
+
+from django.test import SimpleTestCase, override_settings
+
+from django_security_label.labels import MaskFunction
+from django_security_label.profiling import (
+    MaskFunctionProfile,
+    mask_function_expression,
+    profile_mask_functions,
+)
+from tests.utils import AnonTransactionTestCase, run_command
+
+
+class TestMaskFunctionCost(SimpleTestCase):
+    def test_unknown(self):
+        self.assertIsNone(MaskFunction.dummy_name.cost)
+
+    @override_settings(SECURITY_LABEL_MASK_FUNCTION_COSTS={"dummy_name": 1.5})
+    def test_from_settings(self):
+        self.assertEqual(MaskFunction.dummy_name.cost, 1.5)
+        self.assertIsNone(MaskFunction.dummy_word.cost)
+
+    def test_value_is_unchanged(self):
+        self.assertEqual(MaskFunction.dummy_name, "dummy_name()")
+
+
+class TestMaskFunctionProfile(SimpleTestCase):
+    def test_per_row(self):
+        profile = MaskFunctionProfile("dummy_name", "anon.dummy_name()", 1000, 0.002)
+
+        self.assertEqual(profile.per_row, 2.0)
+
+    def test_failed(self):
+        profile = MaskFunctionProfile("nope()", "anon.nope()", 1000, error="missing")
+
+        self.assertIsNone(profile.per_row)
+
+    def test_expression(self):
+        self.assertEqual(
+            mask_function_expression(MaskFunction.dummy_uuidv4), "anon.dummy_uuidv4()"
+        )
+        self.assertEqual(
+            mask_function_expression("random_int_between(0,50)"),
+            "anon.random_int_between(0,50)",
+        )
+
+
+class TestProfileMaskFunctions(AnonTransactionTestCase):
+    def test_ranked(self):
+        profiles = profile_mask_functions(
+            ["not_a_function()", MaskFunction.dummy_uuidv4, "random_int_between(0,50)"],
+            rows=100,
+            repeat=1,
+        )
+
+        self.assertEqual(
+            {profile.name for profile in profiles[:2]},
+            {"dummy_uuidv4", "random_int_between(0,50)"},
+        )
+        self.assertLessEqual(profiles[0].duration, profiles[1].duration)
+        self.assertEqual(profiles[2].name, "not_a_function()")
+        self.assertIsNone(profiles[2].duration)
+        self.assertIn("not_a_function", profiles[2].error)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "costs.json"
+
+            out, err, returncode = run_command(
+                "profile_mask_functions",
+                "dummy_word",
+                "random_int_between(0,50)",
+                "--rows",
+                "100",
+                "--output",
+                str(path),
+            )
+
+            report = json.loads(path.read_text())
+        self.assertEqual(returncode, 0)
+        self.assertIn("Rank", out)
+        self.assertIn("dummy_word", out)
+        self.assertEqual(
+            set(report["costs"]), {"dummy_word", "random_int_between(0,50)"}
+        )
+        self.assertEqual(report["rows"], 100)
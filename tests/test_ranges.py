@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from django.db import connection
+from django.test import SimpleTestCase
+
+from django_security_label.ranges import KeyRange, split_table
+from tests.testapp.models import MaskedColumn
+from tests.utils import AnonTransactionTestCase, create_masked_columns
+
+
+class TestKeyRange(SimpleTestCase):
+    def test_where_sql(self):
+        self.assertEqual(
+            KeyRange(MaskedColumn, "3", "5").where_sql(connection),
+            (
+                ' WHERE "id" >= CAST(%s AS integer) AND "id" < CAST(%s AS integer)',
+                ["3", "5"],
+            ),
+        )
+
+    def test_open_range(self):
+        self.assertEqual(KeyRange(MaskedColumn).where_sql(connection), ("", []))
+
+
+class TestSplitTable(AnonTransactionTestCase):
+    def test_split(self):
+        records = create_masked_columns(5)
+
+        ranges = split_table(MaskedColumn, 2)
+
+        self.assertEqual(
+            [(key_range.start, key_range.end) for key_range in ranges],
+            [
+                (None, records[2].pk),
+                (records[2].pk, records[4].pk),
+                (records[4].pk, None),
+            ],
+        )
+
+    def test_empty_table(self):
+        ranges = split_table(MaskedColumn, 2)
+
+        self.assertEqual(
+            [(key_range.start, key_range.end) for key_range in ranges], [(None, None)]
+        )
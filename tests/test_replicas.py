@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import datetime as dt
+import uuid
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError
+from django.db import connection
+
+from django_security_label.cloning import clone_masked
+from django_security_label.replicas import (
+    MaskedReplicaSync,
+    install_change_tracking,
+    sync_masked_replica,
+    uninstall_change_tracking,
+)
+from tests.test_cloning import CloneTestCase
+from tests.testapp.models import MaskedColumn
+from tests.utils import create_masked_column, run_command
+
+
+class ReplicaTestCase(CloneTestCase):
+    def setUp(self):
+        super().setUp()
+        install_change_tracking([MaskedColumn])
+        self.addCleanup(uninstall_change_tracking)
+        clone_masked("clone", models=[MaskedColumn])
+
+    def change_rows(self):
+        MaskedColumn.objects.filter(pk=self.records[0].pk).update(
+            safe_text="changed", confidential="changed"
+        )
+        MaskedColumn.objects.filter(pk=self.records[1].pk).delete()
+        return create_masked_column(safe_text="safe_text_value_3")
+
+
+class TestSyncMaskedReplica(ReplicaTestCase):
+    def test_changed_rows_are_synced(self):
+        created = self.change_rows()
+
+        results = sync_masked_replica("clone", models=[MaskedColumn], batch_size=1)
+
+        self.assertEqual(results, {MaskedColumn: (2, 1)})
+        replicas = MaskedColumn.objects.using("clone").in_bulk()
+        self.assertEqual(
+            set(replicas), {self.records[0].pk, self.records[2].pk, created.pk}
+        )
+        self.assertEqual(replicas[self.records[0].pk].safe_text, "changed")
+        self.assertEqual(replicas[self.records[0].pk].confidential, "CONFIDENTIAL")
+        self.assertEqual(replicas[created.pk].safe_text, "safe_text_value_3")
+        self.assertNotEqual(replicas[created.pk].text, "secret_text_value")
+
+    def test_log_is_emptied(self):
+        self.change_rows()
+        sync_masked_replica("clone", models=[MaskedColumn])
+
+        self.assertEqual(
+            sync_masked_replica("clone", models=[MaskedColumn]),
+            {MaskedColumn: (0, 0)},
+        )
+
+    def test_log_is_emptied_per_batch(self):
+        for record in (self.records[0], self.records[2]):
+            MaskedColumn.objects.filter(pk=record.pk).update(safe_text="changed")
+        upsert = MaskedReplicaSync._upsert
+        batches = []
+
+        def interrupt_second_batch(sync, model, primary_keys):
+            batches.append(primary_keys)
+            if len(batches) == 2:
+                raise KeyboardInterrupt
+            return upsert(sync, model, primary_keys)
+
+        with (
+            mock.patch.object(
+                MaskedReplicaSync,
+                "_upsert",
+                autospec=True,
+                side_effect=interrupt_second_batch,
+            ),
+            self.assertRaises(KeyboardInterrupt),
+        ):
+            sync_masked_replica("clone", models=[MaskedColumn], batch_size=1)
+
+        self.assertEqual(
+            sync_masked_replica("clone", models=[MaskedColumn]),
+            {MaskedColumn: (1, 0)},
+        )
+
+    def test_missing_rows_are_kept_until_deleted(self):
+        MaskedColumn.objects.filter(pk=self.records[1].pk).delete()
+
+        with (
+            mock.patch.object(
+                MaskedReplicaSync, "_delete", side_effect=KeyboardInterrupt
+            ),
+            self.assertRaises(KeyboardInterrupt),
+        ):
+            sync_masked_replica("clone", models=[MaskedColumn], batch_size=1)
+
+        self.assertEqual(
+            sync_masked_replica("clone", models=[MaskedColumn]),
+            {MaskedColumn: (0, 1)},
+        )
+
+    def test_concurrent_changes_are_kept(self):
+        # Another transaction logs a change first, so with a lower id, but
+        # only commits once the sync has read the log.
+        other = connection.get_new_connection(connection.get_connection_params())
+        self.addCleanup(other.close)
+        other.execute(
+            "UPDATE testapp_maskedcolumn SET safe_text = 'concurrent' WHERE id = %s",
+            [self.records[2].pk],
+        )
+        self.change_rows()
+        upsert_changes = MaskedReplicaSync._upsert_changes
+
+        def commit_after_reading(sync, changes):
+            result = upsert_changes(sync, changes)
+            other.commit()
+            return result
+
+        with mock.patch.object(
+            MaskedReplicaSync,
+            "_upsert_changes",
+            autospec=True,
+            side_effect=commit_after_reading,
+        ):
+            self.assertEqual(
+                sync_masked_replica("clone", models=[MaskedColumn]),
+                {MaskedColumn: (2, 1)},
+            )
+
+        self.assertEqual(
+            sync_masked_replica("clone", models=[MaskedColumn]),
+            {MaskedColumn: (1, 0)},
+        )
+        replica = MaskedColumn.objects.using("clone").get(pk=self.records[2].pk)
+        self.assertEqual(replica.safe_text, "concurrent")
+
+    def test_policy(self):
+        created = self.change_rows()
+
+        sync_masked_replica("clone", policy="analysts_reader", models=[MaskedColumn])
+
+        replica = MaskedColumn.objects.using("clone").get(pk=created.pk)
+        self.assertEqual(replica.text, "secret_text_value")
+        self.assertEqual(replica.uuid, uuid.UUID(int=0))
+
+    def test_without_change_tracking(self):
+        uninstall_change_tracking()
+
+        with self.assertRaisesMessage(
+            ValueError, "Install change tracking on 'default' first"
+        ):
+            sync_masked_replica("clone", models=[MaskedColumn])
+
+    def test_missing_updated_field(self):
+        with self.assertRaisesMessage(
+            ValueError, "testapp.MaskedColumn has no 'updated_at' field"
+        ):
+            sync_masked_replica(
+                "clone", models=[MaskedColumn], updated_field="updated_at"
+            )
+
+
+class TestSyncByTimestamp(CloneTestCase):
+    def setUp(self):
+        super().setUp()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TABLE dsl_clone.auth_user (LIKE public.auth_user INCLUDING ALL)"
+            )
+            # The migrations create it in the test database's public schema.
+            cursor.execute(
+                "CREATE TABLE dsl_clone.dsl_sync_state "
+                "(LIKE public.dsl_sync_state INCLUDING ALL)"
+            )
+        login = dt.datetime(2026, 1, 1, tzinfo=dt.UTC)
+        self.users = [
+            User.objects.create(username="alice", last_login=login),
+            User.objects.create(username="bob", last_login=login + dt.timedelta(1)),
+            User.objects.create(username="carol"),
+        ]
+
+    def test_rows_updated_since_last_sync(self):
+        results = sync_masked_replica(
+            "clone", models=[User], updated_field="last_login"
+        )
+        self.assertEqual(results, {User: (2, 0)})
+        User.objects.filter(username="alice").update(
+            first_name="Alice", last_login=dt.datetime(2026, 2, 1, tzinfo=dt.UTC)
+        )
+
+        results = sync_masked_replica(
+            "clone", models=[User], updated_field="last_login"
+        )
+
+        # Bob has the last timestamp of the previous sync, so he's copied again.
+        self.assertEqual(results, {User: (2, 0)})
+        self.assertEqual(
+            list(
+                User.objects.using("clone")
+                .order_by("username")
+                .values_list("username", "first_name")
+            ),
+            [("alice", "Alice"), ("bob", "")],
+        )
+
+    def test_missing_state_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TABLE dsl_clone.dsl_sync_state")
+
+        with self.assertRaisesMessage(
+            ValueError,
+            "Run the django_security_label migrations on 'clone' first, "
+            "to create the dsl_sync_state table.",
+        ):
+            sync_masked_replica("clone", models=[User], updated_field="last_login")
+
+
+class TestSyncMaskedReplicaCommand(ReplicaTestCase):
+    def test_command(self):
+        self.change_rows()
+
+        out, err, returncode = run_command("sync_masked_replica", "clone", "testapp")
+
+        self.assertEqual(returncode, 0)
+        self.assertIn("Synced testapp_maskedcolumn: 2 upserted, 1 deleted in ", out)
+        self.assertIn("Synced 3 rows of 1 tables into 'clone'.", out)
+
+    def test_install_triggers(self):
+        uninstall_change_tracking()
+
+        out, err, returncode = run_command(
+            "sync_masked_replica", "clone", "testapp", "--install-triggers"
+        )
+
+        self.assertIn("Installed change tracking on 1 tables of 'default'.", out)
+        self.change_rows()
+        self.assertEqual(
+            sync_masked_replica("clone", models=[MaskedColumn]),
+            {MaskedColumn: (2, 1)},
+        )
+
+    def test_same_database(self):
+        with self.assertRaisesMessage(
+            CommandError, "The target must differ from the source database."
+        ):
+            run_command("sync_masked_replica", "default")
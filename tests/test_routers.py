@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+from functools import partial
+from unittest import mock
+
+from django.db import connection, connections
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from django_security_label import constants
+from django_security_label import middleware as middleware_module
+from django_security_label.middleware import MaskedReadsMiddleware
+from django_security_label.routers import MaskedDatabaseRouter
+from tests.testapp.models import MaskedColumn
+from tests.utils import AnonTransactionTestCase, create_masked_column
+
+POLICY_DATABASES = {constants.MASKED_READER_ROLE: "masked"}
+
+
+@override_settings(SECURITY_LABEL_POLICY_DATABASES=POLICY_DATABASES)
+class TestMaskedDatabaseRouter(SimpleTestCase):
+    router = MaskedDatabaseRouter()
+
+    def set_policy(self, policy):
+        token = middleware_module._active_policy.set(policy)
+        self.addCleanup(middleware_module._active_policy.reset, token)
+
+    def test_no_active_policy(self):
+        self.assertIsNone(self.router.db_for_read(MaskedColumn))
+        self.assertIsNone(self.router.db_for_write(MaskedColumn))
+
+    def test_policy_with_database(self):
+        self.set_policy(constants.MASKED_READER_ROLE)
+
+        self.assertEqual(self.router.db_for_read(MaskedColumn), "masked")
+        self.assertEqual(self.router.db_for_write(MaskedColumn), "masked")
+
+    def test_policy_without_database(self):
+        self.set_policy("analysts_reader")
+
+        self.assertIsNone(self.router.db_for_read(MaskedColumn))
+
+    def test_allow_relation(self):
+        masked = MaskedColumn()
+        masked._state.db = "masked"
+        default = MaskedColumn()
+        default._state.db = "default"
+
+        self.assertTrue(self.router.allow_relation(masked, default))
+        self.assertIsNone(self.router.allow_relation(default, default))
+
+    def test_allow_migrate(self):
+        self.assertFalse(self.router.allow_migrate("masked", "testapp"))
+        self.assertIsNone(self.router.allow_migrate("default", "testapp"))
+
+
+def get_response_read(request, test_record):
+    request.row = MaskedColumn.objects.get(pk=test_record.pk)
+    return request
+
+
+@override_settings(
+    SECURITY_LABEL_POLICY_DATABASES=POLICY_DATABASES,
+    DATABASE_ROUTERS=["django_security_label.routers.MaskedDatabaseRouter"],
+)
+class TestMaskedDatabaseMiddleware(AnonTransactionTestCase):
+    databases = {"default", "masked"}
+    request_factory = RequestFactory()
+
+    def setUp(self):
+        self.test_record = create_masked_column()
+
+    def test_masked_reads_without_role_switch(self):
+        middleware = MaskedReadsMiddleware(
+            partial(get_response_read, test_record=self.test_record)
+        )
+
+        with mock.patch(
+            "django_security_label.middleware._switch_role",
+            wraps=middleware_module._switch_role,
+        ) as switch_role:
+            response = middleware(self.request_factory.get("/"))
+
+        self.assertEqual(response.row._state.db, "masked")
+        self.assertEqual(response.row.confidential, "CONFIDENTIAL")
+        self.assertNotIn(
+            constants.MASKED_READER_ROLE,
+            [call.args[1] for call in switch_role.call_args_list],
+        )
+
+    def test_masked_connection_role(self):
+        with connections["masked"].cursor() as cursor:
+            cursor.execute("SELECT current_user")
+            self.assertEqual(cursor.fetchone()[0], constants.MASKED_READER_ROLE)
+
+    def test_queries_bypassing_router_are_masked(self):
+        def get_response(request):
+            request.row = MaskedColumn.objects.using("default").get(
+                pk=self.test_record.pk
+            )
+            return request
+
+        response = MaskedReadsMiddleware(get_response)(self.request_factory.get("/"))
+
+        self.assertEqual(response.row.confidential, "CONFIDENTIAL")
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT current_user")
+            self.assertEqual(cursor.fetchone()[0], connection.settings_dict["USER"])
+
+    @override_settings(SECURITY_LABEL_TRANSACTION_ROLE=True)
+    def test_queries_bypassing_router_use_transaction_role(self):
+        def get_response(request):
+            request.row = MaskedColumn.objects.using("default").get(
+                pk=self.test_record.pk
+            )
+            return request
+
+        with mock.patch(
+            "django_security_label.middleware._switch_role",
+            wraps=middleware_module._switch_role,
+        ) as switch_role:
+            response = MaskedReadsMiddleware(get_response)(
+                self.request_factory.get("/")
+            )
+
+        self.assertEqual(response.row.confidential, "CONFIDENTIAL")
+        # SET LOCAL ROLE only, without a RESET ROLE.
+        self.assertEqual(
+            [
+                (call.args[1], call.kwargs.get("local"))
+                for call in switch_role.call_args_list
+            ],
+            [(constants.MASKED_READER_ROLE, True)],
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT current_user")
+            self.assertEqual(cursor.fetchone()[0], connection.settings_dict["USER"])
@@ -131,3 +131,20 @@ class TestSetupPoliciesCommand(TransactionTestCase):
 
         self.assertTrue(Group.objects.filter(name="Test Group G").exists())
         self.assertEqual(self._get_db_roles(["test_policy_g"]), {"test_policy_g"})
+
+    @override_settings(
+        SECURITY_LABEL_GROUPS_TO_POLICIES=[
+            ("Test Group H", "test_policy_h"),
+        ]
+    )
+    def test_login_roles(self):
+        self.addCleanup(self._cleanup_roles, ["test_policy_h"])
+
+        call_command("setup_policies", "--login", stdout=StringIO())
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT rolcanlogin FROM pg_roles WHERE rolname = %s",
+                ["test_policy_h"],
+            )
+            self.assertTrue(cursor.fetchone()[0])
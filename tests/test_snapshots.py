@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import uuid
+
+from django.db import connection, models
+from django.test import SimpleTestCase
+from django.test.utils import isolate_apps
+
+from django_security_label.labels import MaskColumn, MaskFunction, SampleTable
+from django_security_label.middleware import masked_reads
+from django_security_label.snapshots import (
+    MaskedSnapshot,
+    drop_snapshots,
+    get_snapshots,
+    policy_roles,
+    refresh_snapshots,
+)
+from tests.testapp.models import MaskedColumn
+from tests.utils import AnonTransactionTestCase, create_masked_column, run_command
+
+ZERO_UUID = uuid.UUID("00000000-0000-0000-0000-000000000000")
+
+
+class TestMaskedSnapshotSQL(SimpleTestCase):
+    def test_select_sql(self):
+        snapshot = MaskedSnapshot(MaskedColumn, "analysts")
+
+        self.assertEqual(
+            snapshot.select_sql(connection),
+            'SELECT "id", "text", '
+            'CAST($$00000000-0000-0000-0000-000000000000$$ AS uuid) AS "uuid", '
+            '"safe_text", "safe_uuid", "confidential", "random_int" '
+            'FROM "testapp_maskedcolumn"',
+        )
+
+    @isolate_apps("tests.testapp")
+    def test_select_sql_sampled(self):
+        class Event(models.Model):
+            name = models.TextField()
+
+            class Meta:
+                app_label = "testapp"
+                indexes = [
+                    MaskColumn(fields=["name"], mask_function=MaskFunction.dummy_name)
+                ]
+                constraints = [
+                    SampleTable(name="event_sample", ratio=10),
+                    SampleTable(
+                        name="event_sample_analysts", policy="analysts", ratio=1
+                    ),
+                ]
+
+        self.assertEqual(
+            MaskedSnapshot(Event, "anon").select_sql(connection),
+            'SELECT "id", CAST(anon.dummy_name() AS text) AS "name" '
+            'FROM "testapp_event" TABLESAMPLE SYSTEM(10)',
+        )
+
+    def test_get_snapshots(self):
+        snapshots = get_snapshots(models=[MaskedColumn])
+
+        self.assertEqual(
+            [(s.schema, s.table) for s in snapshots],
+            [
+                ("masked_analysts", "testapp_maskedcolumn"),
+                ("masked_anon", "testapp_maskedcolumn"),
+            ],
+        )
+
+    def test_get_snapshots_for_policies(self):
+        snapshots = get_snapshots(["analysts"], models=[MaskedColumn])
+
+        self.assertEqual([s.policy for s in snapshots], ["analysts"])
+
+
+class TestMaskedSnapshot(AnonTransactionTestCase):
+    def setUp(self):
+        self.snapshot = MaskedSnapshot(MaskedColumn, "analysts")
+        self.addCleanup(self.snapshot.drop)
+        self.record = create_masked_column()
+
+    def read_snapshot(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT id, text, uuid FROM {self.snapshot.qualified_name(connection)}"
+                " ORDER BY id"
+            )
+            return cursor.fetchall()
+
+    def test_policy_roles(self):
+        self.assertEqual(policy_roles("analysts"), ["analysts_reader"])
+
+    def test_create(self):
+        self.assertFalse(self.snapshot.exists())
+
+        self.snapshot.create()
+
+        self.assertTrue(self.snapshot.exists())
+        self.assertEqual(
+            self.read_snapshot(), [(self.record.pk, "secret_text_value", ZERO_UUID)]
+        )
+
+    def test_refresh(self):
+        self.snapshot.create()
+        other = create_masked_column(text="other")
+
+        self.snapshot.refresh()
+
+        self.assertEqual(
+            self.read_snapshot(),
+            [
+                (self.record.pk, "secret_text_value", ZERO_UUID),
+                (other.pk, "other", ZERO_UUID),
+            ],
+        )
+
+    def test_masked_role_reads_snapshot(self):
+        self.snapshot.create()
+        create_masked_column(text="after the snapshot")
+        self.addCleanup(connection.close)
+        with connection.cursor() as cursor:
+            cursor.execute("SET search_path TO masked_analysts, public")
+
+        with masked_reads("analysts_reader"):
+            rows = list(MaskedColumn.objects.values_list("text", "uuid"))
+
+        self.assertEqual(rows, [("secret_text_value", ZERO_UUID)])
+
+    def test_refresh_snapshots(self):
+        results = refresh_snapshots(["analysts"], models=[MaskedColumn])
+
+        self.assertEqual([created for _, created in results], [True])
+
+        reported = []
+        results = refresh_snapshots(
+            ["analysts"],
+            models=[MaskedColumn],
+            progress=lambda snapshot, created, duration: reported.append(created),
+        )
+
+        self.assertEqual([created for _, created in results], [False])
+        self.assertEqual(reported, [False])
+
+    def test_drop_snapshots(self):
+        refresh_snapshots(["analysts"], models=[MaskedColumn])
+
+        snapshots = drop_snapshots(["analysts"], models=[MaskedColumn])
+
+        self.assertEqual([s.policy for s in snapshots], ["analysts"])
+        self.assertFalse(snapshots[0].exists())
+
+
+class TestRefreshMaskedSnapshotsCommand(AnonTransactionTestCase):
+    def setUp(self):
+        self.snapshot = MaskedSnapshot(MaskedColumn, "analysts")
+        self.addCleanup(self.snapshot.drop)
+
+    def test_create_refresh_drop(self):
+        out, err, returncode = run_command(
+            "refresh_masked_snapshots", "analysts", "--model", "testapp.MaskedColumn"
+        )
+        self.assertEqual(returncode, 0)
+        self.assertIn(
+            "Created snapshot masked_analysts.testapp_maskedcolumn for policy "
+            "'analysts'",
+            out,
+        )
+
+        out, _, _ = run_command(
+            "refresh_masked_snapshots", "analysts", "--model", "testapp.MaskedColumn"
+        )
+        self.assertIn("Refreshed snapshot masked_analysts.testapp_maskedcolumn", out)
+
+        out, _, _ = run_command(
+            "refresh_masked_snapshots",
+            "analysts",
+            "--model",
+            "testapp.MaskedColumn",
+            "--drop",
+        )
+        self.assertIn("Dropped snapshot masked_analysts.testapp_maskedcolumn", out)
+        self.assertFalse(self.snapshot.exists())
+
+    def test_unknown_policy(self):
+        out, err, _ = run_command("refresh_masked_snapshots", "unknown")
+
+        self.assertEqual(out, "")
+        self.assertIn("No labeled tables to snapshot.", err)
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import uuid
+from unittest import mock
+
+from django.db import connection
+from django.test import SimpleTestCase
+
+from django_security_label.static_masking import (
+    CHECKPOINT_TABLE,
+    StaticAnonymizer,
+    _masked_columns,
+    anonymize_static,
+    get_static_models,
+)
+from tests.testapp.models import MaskedColumn
+from tests.utils import AnonTransactionTestCase, create_masked_columns, run_command
+
+
+class TestGetStaticModels(SimpleTestCase):
+    def test_policy(self):
+        self.assertEqual(get_static_models("anon"), [MaskedColumn])
+        self.assertEqual(get_static_models("analysts"), [MaskedColumn])
+        self.assertEqual(get_static_models("unknown"), [])
+
+
+class TestMaskedColumns(SimpleTestCase):
+    def test_assignments(self):
+        self.assertEqual(
+            _masked_columns(MaskedColumn, "analysts", connection),
+            ['"uuid" = CAST($$00000000-0000-0000-0000-000000000000$$ AS uuid)'],
+        )
+
+    def test_function_expression(self):
+        self.assertIn(
+            '"random_int" = CAST(anon.random_int_between(0,50) AS integer)',
+            _masked_columns(MaskedColumn, "anon", connection),
+        )
+
+
+class StaticMaskingTestCase(AnonTransactionTestCase):
+    def setUp(self):
+        self.addCleanup(self.drop_checkpoint_table)
+        self.records = create_masked_columns(5)
+
+    def drop_checkpoint_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {CHECKPOINT_TABLE}")
+
+    def checkpoints(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT batch, row_count, done_at IS NOT NULL FROM {CHECKPOINT_TABLE} "
+                "WHERE policy = 'anon' ORDER BY batch"
+            )
+            return cursor.fetchall()
+
+
+class TestAnonymizeStatic(StaticMaskingTestCase):
+    def test_masks_stored_values(self):
+        rows = anonymize_static(batch_size=2)
+
+        self.assertEqual(rows, {MaskedColumn: 5})
+        for record in MaskedColumn.objects.all():
+            self.assertNotEqual(record.text, "secret_text_value")
+            self.assertNotEqual(
+                record.uuid, uuid.UUID("12345678-1234-5678-1234-567812345678")
+            )
+            self.assertEqual(record.confidential, "CONFIDENTIAL")
+            self.assertLessEqual(record.random_int, 50)
+            self.assertTrue(record.safe_text.startswith("safe_text_value_"))
+        # The checkpoints of finished tables are cleared.
+        self.assertEqual(self.checkpoints(), [])
+
+    def test_policy(self):
+        anonymize_static(policy="analysts")
+
+        record = MaskedColumn.objects.get(pk=self.records[0].pk)
+        self.assertEqual(record.uuid, uuid.UUID(int=0))
+        self.assertEqual(record.confidential, "hunter2")
+
+    def test_resume(self):
+        update_batch = StaticAnonymizer._update_batch
+
+        def interrupt_second_batch(self, number, key_range):
+            if number == 1:
+                raise KeyboardInterrupt
+            return update_batch(self, number, key_range)
+
+        with (
+            mock.patch.object(
+                StaticAnonymizer,
+                "_update_batch",
+                autospec=True,
+                side_effect=interrupt_second_batch,
+            ),
+            self.assertRaises(KeyboardInterrupt),
+        ):
+            anonymize_static(batch_size=2, workers=1)
+        self.assertEqual(
+            self.checkpoints(), [(0, 2, True), (1, None, False), (2, 1, True)]
+        )
+        MaskedColumn.objects.update(confidential="hunter2")
+
+        rows = anonymize_static(batch_size=2)
+
+        self.assertEqual(rows, {MaskedColumn: 2})
+        self.assertEqual(
+            list(
+                MaskedColumn.objects.order_by("pk").values_list(
+                    "confidential", flat=True
+                )
+            ),
+            ["hunter2", "hunter2", "CONFIDENTIAL", "CONFIDENTIAL", "hunter2"],
+        )
+        self.assertEqual(self.checkpoints(), [])
+
+    def test_done_tables_are_masked_again(self):
+        anonymize_static()
+        # Reloaded data is masked anew, without resetting.
+        MaskedColumn.objects.update(confidential="hunter2")
+
+        self.assertEqual(anonymize_static(), {MaskedColumn: 5})
+        self.assertEqual(
+            set(MaskedColumn.objects.values_list("confidential", flat=True)),
+            {"CONFIDENTIAL"},
+        )
+
+    def test_reset(self):
+        # A stale checkpoint, as if the table were done.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {CHECKPOINT_TABLE} (policy, table_name, batch, done_at) "
+                "VALUES ('anon', 'testapp_maskedcolumn', 0, now())"
+            )
+
+        self.assertEqual(anonymize_static(reset=True), {MaskedColumn: 5})
+
+    def test_missing_checkpoint_table(self):
+        with (
+            mock.patch(
+                "django_security_label.static_masking.CHECKPOINT_TABLE", "dsl_missing"
+            ),
+            self.assertRaisesMessage(
+                ValueError,
+                "Run the django_security_label migrations on 'default' first, "
+                "to create the dsl_missing table.",
+            ),
+        ):
+            anonymize_static()
+
+    def test_progress(self):
+        calls = []
+
+        anonymize_static(
+            batch_size=2, workers=1, progress=lambda *args: calls.append(args[:4])
+        )
+
+        self.assertEqual(
+            calls,
+            [(MaskedColumn, 1, 3, 2), (MaskedColumn, 2, 3, 4), (MaskedColumn, 3, 3, 5)],
+        )
+
+
+class TestAnonymizeStaticCommand(StaticMaskingTestCase):
+    def test_command(self):
+        out, err, returncode = run_command(
+            "anonymize_static", "testapp", "--batch-size", "2", "--noinput"
+        )
+
+        self.assertEqual(returncode, 0)
+        self.assertIn("testapp_maskedcolumn: 3/3 batches, 5 rows in ", out)
+        self.assertIn("Anonymized 5 rows of 1 tables in 'default'.", out)
+        self.assertEqual(
+            set(MaskedColumn.objects.values_list("confidential", flat=True)),
+            {"CONFIDENTIAL"},
+        )
+
+    def test_unknown_policy(self):
+        out, err, returncode = run_command(
+            "anonymize_static", "--policy", "unknown", "--noinput"
+        )
+
+        self.assertIn("No tables have columns masked for policy 'unknown'.", err)
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase
+
+from django_security_label import constants
+from django_security_label.middleware import MaskedReadsMiddleware, masked_reads
+from django_security_label.signals import role_reset, role_switched
+from django_security_label.stats import RequestRoleStats, RoleSwitchAggregator
+from tests.testapp.models import MaskedColumn
+from tests.utils import AnonTransactionTestCase, create_masked_column
+
+
+class TestRequestRoleStats(SimpleTestCase):
+    def test_record(self):
+        stats = RequestRoleStats("policy")
+
+        stats.record("policy", 0.25)
+        stats.record(None, 0.5)
+
+        self.assertEqual(stats.switches, 1)
+        self.assertEqual(stats.resets, 1)
+        self.assertEqual(stats.duration, 0.75)
+
+
+class TestRoleSwitchAggregator(SimpleTestCase):
+    def test_summary(self):
+        aggregator = RoleSwitchAggregator()
+        for duration in range(1, 101):
+            aggregator.record("policy", "switch", duration / 1000)
+        aggregator.record("policy", "reset", 0.5)
+
+        summary = aggregator.summary()
+
+        self.assertEqual(summary["policy"]["switch"]["count"], 100)
+        self.assertEqual(summary["policy"]["switch"]["p50"], 0.05)
+        self.assertEqual(summary["policy"]["switch"]["p99"], 0.099)
+        self.assertEqual(
+            summary["policy"]["reset"], {"count": 1, "p50": 0.5, "p99": 0.5}
+        )
+
+    def test_sample_size(self):
+        aggregator = RoleSwitchAggregator(sample_size=2)
+        for duration in (10, 1, 1):
+            aggregator.record(None, "switch", duration)
+
+        summary = aggregator.summary()[None]["switch"]
+
+        self.assertEqual(summary["count"], 3)
+        self.assertEqual(summary["p99"], 1)
+
+    def test_reset(self):
+        aggregator = RoleSwitchAggregator()
+        aggregator.record("policy", "switch", 1)
+
+        aggregator.reset()
+
+        self.assertEqual(aggregator.summary(), {})
+
+    def test_connect(self):
+        aggregator = RoleSwitchAggregator()
+        aggregator.connect()
+        self.addCleanup(aggregator.disconnect)
+
+        role_switched.send(sender=None, policy="policy", duration=1.0)
+        role_reset.send(sender=None, policy="policy", duration=2.0)
+
+        self.assertEqual(set(aggregator.summary()["policy"]), {"switch", "reset"})
+
+
+class TestRoleSwitchSignals(AnonTransactionTestCase):
+    request_factory = RequestFactory()
+
+    def setUp(self):
+        self.test_record = create_masked_column()
+        self.received = []
+        role_switched.connect(self.receive)
+        role_reset.connect(self.receive)
+        self.addCleanup(role_switched.disconnect, self.receive)
+        self.addCleanup(role_reset.disconnect, self.receive)
+
+    def receive(self, signal, **kwargs):
+        self.received.append((signal, kwargs))
+
+    def read(self, request):
+        request.row = MaskedColumn.objects.get(pk=self.test_record.pk)
+        return request
+
+    def test_middleware_signals(self):
+        MaskedReadsMiddleware(self.read)(self.request_factory.get("/"))
+
+        self.assertEqual(
+            [signal for signal, _ in self.received], [role_switched, role_reset]
+        )
+        for _, kwargs in self.received:
+            self.assertEqual(kwargs["alias"], "default")
+            self.assertIs(kwargs["connection"], connection)
+            self.assertEqual(kwargs["policy"], constants.MASKED_READER_ROLE)
+            self.assertFalse(kwargs["local"])
+            self.assertGreaterEqual(kwargs["duration"], 0)
+        self.assertEqual(self.received[0][1]["role"], constants.MASKED_READER_ROLE)
+        self.assertIsNone(self.received[1][1]["role"])
+
+    def test_request_stats(self):
+        middleware = MaskedReadsMiddleware(self.read)
+
+        response = middleware(self.request_factory.get("/"))
+
+        stats = response.security_label_stats
+        self.assertEqual(stats.policy, constants.MASKED_READER_ROLE)
+        self.assertEqual((stats.switches, stats.resets), (1, 1))
+        self.assertGreater(stats.duration, 0)
+
+    def test_unmasked_request_has_no_stats(self):
+        request = self.request_factory.get("/")
+        request.user = type(
+            "User", (), {"is_authenticated": True, "is_superuser": True}
+        )()
+
+        response = MaskedReadsMiddleware(self.read)(request)
+
+        self.assertFalse(hasattr(response, "security_label_stats"))
+        self.assertEqual(self.received, [])
+
+    def test_masked_reads_signals(self):
+        with masked_reads():
+            pass
+
+        self.assertEqual(
+            [kwargs["policy"] for _, kwargs in self.received],
+            [constants.MASKED_READER_ROLE, constants.MASKED_READER_ROLE],
+        )
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from django.contrib.auth.models import User
+from django.db import models
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import isolate_apps
+
+from django_security_label.labels import SampleTable
+from django_security_label.tables import (
+    LabeledTables,
+    collect_labeled_tables,
+    get_labeled_tables,
+)
+from tests.testapp.models import MaskedColumn
+
+
+class TestLabeledTables(SimpleTestCase):
+    tables = LabeledTables(["testapp_maskedcolumn", "app_user"])
+
+    def test_quoted_reference(self):
+        self.assertTrue(
+            self.tables.referenced_by(
+                'SELECT "testapp_maskedcolumn"."id" FROM "testapp_maskedcolumn"'
+            )
+        )
+
+    def test_unquoted_reference(self):
+        self.assertTrue(self.tables.referenced_by("select * from APP_USER"))
+
+    def test_no_reference(self):
+        self.assertFalse(self.tables.referenced_by('SELECT * FROM "auth_user"'))
+
+    def test_prefix_not_matched(self):
+        self.assertFalse(self.tables.referenced_by('SELECT * FROM "app_user_groups"'))
+
+    def test_sql_object_assumed_to_reference(self):
+        self.assertTrue(self.tables.referenced_by(object()))
+
+    def test_empty(self):
+        tables = LabeledTables([])
+
+        self.assertFalse(tables.referenced_by('SELECT * FROM "testapp_maskedcolumn"'))
+
+
+class TestCollectLabeledTables(SimpleTestCase):
+    def test_collect(self):
+        self.assertEqual(
+            collect_labeled_tables([MaskedColumn, User]), {"testapp_maskedcolumn"}
+        )
+
+    @isolate_apps("tests.testapp")
+    def test_sampled_table(self):
+        class Event(models.Model):
+            class Meta:
+                app_label = "testapp"
+                constraints = [SampleTable(name="event_sample", ratio=10)]
+
+        self.assertEqual(collect_labeled_tables([Event]), {"testapp_event"})
+
+    def test_installed_models(self):
+        self.assertIn("testapp_maskedcolumn", get_labeled_tables())
+        self.assertNotIn("auth_user", get_labeled_tables())
+
+    @override_settings(SECURITY_LABEL_LABELED_TABLES=["reporting_view"])
+    def test_extra_tables(self):
+        self.assertIn("reporting_view", get_labeled_tables())
+        self.assertIn("testapp_maskedcolumn", get_labeled_tables())
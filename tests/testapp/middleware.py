@@ -1,7 +1,5 @@
 from __future__ import annotations
 
-from django.db import InternalError
-
 from django_security_label.middleware import (
     disable_masked_reads,
     set_session_role,
@@ -17,11 +15,8 @@ class AnalystsMaskedReadsMiddleware:
         if use_masked_reads(request):
             set_session_role("analysts_reader")
             try:
-                response = self.get_response(request)
-            except InternalError:
+                return self.get_response(request)
+            finally:
                 disable_masked_reads()
-                raise
-            disable_masked_reads()
-            return response
 
         return self.get_response(request)
@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+from django.http import HttpResponse
+from django.urls import path
+
+from django_security_label.decorators import masking_exempt, masking_policy
+from tests.testapp.models import MaskedColumn
+
+
+def read_view(request):
+    row = MaskedColumn.objects.get()
+    return HttpResponse(f"{row.confidential} {row.uuid}")
+
+
+urlpatterns = [
+    path("read/", read_view),
+    path("exempt/", masking_exempt(read_view)),
+    path("analysts/", masking_policy("analysts_reader")(read_view)),
+]
@@ -10,11 +10,14 @@ from contextlib import contextmanager
 from io import StringIO
 from pathlib import Path
 from textwrap import dedent
+from uuid import UUID
 
 from django.core.management import call_command
 from django.db import connection
 from django.test import TransactionTestCase, override_settings
 
+from tests.testapp.models import MaskedColumn
+
 
 @contextmanager
 def temp_migrations_module():
@@ -46,6 +49,28 @@ def run_command(*args, **kwargs):
     return out.getvalue(), err.getvalue(), returncode
 
 
+def create_masked_column(**kwargs):
+    """Create a ``MaskedColumn`` row holding the unmasked test values."""
+    return MaskedColumn.objects.create(
+        **{
+            "text": "secret_text_value",
+            "uuid": UUID("12345678-1234-5678-1234-567812345678"),
+            "safe_text": "safe_text_value",
+            "safe_uuid": UUID("87654321-4321-8765-4321-876543218765"),
+            "confidential": "hunter2",
+            "random_int": 999,
+            **kwargs,
+        }
+    )
+
+
+def create_masked_columns(count):
+    """Create ``count`` rows, told apart by their ``safe_text``."""
+    return [
+        create_masked_column(safe_text=f"safe_text_value_{i}") for i in range(count)
+    ]
+
+
 empty_migration = dedent(
     """\
     from django.db import migrations